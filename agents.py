@@ -1,5 +1,7 @@
-import json
-from llm_client import get_completion, get_reasoning_completion
+from llm_client import get_completion
+from model_router import routed_completion
+from prompt_budget import pack_prompt, count_tokens
+from json_output import parse_json_output, extract_json
 import notion_ops
 import vector_ops
 
@@ -8,27 +10,26 @@ try:
 except ImportError:
     read_pdf_content = None
 
+# 各类 prompt 的输入 token 预算（含模板本身）；超出时输入按首尾保留截断
+INTENT_PROMPT_TOKENS = 600
+DRAFT_PROMPT_TOKENS = 12000
+MERGE_PROMPT_TOKENS = 8000
+
 
 # =========================================================
 # Utilities
 # =========================================================
 def safe_json_parse(input_data, context=""):
+    """
+    解析模型输出的 JSON：先原样解析，失败时本地修复（截断、未转义换行/引号、多余逗号等），
+    解析/修复/失败次数按 context 记录，见 json_output.get_json_stats()
+    """
     if not input_data:
         return None
     if isinstance(input_data, dict):
         return input_data
-    try:
-        text = str(input_data).strip()
-        # Clean potential markdown code blocks
-        clean = text.replace("```json", "").replace("```", "")
-        start = clean.find("{")
-        end = clean.rfind("}") + 1
-        if start != -1 and end != -1:
-            clean = clean[start:end]
-        return json.loads(clean)
-    except Exception as e:
-        print(f"❌ [{context}] JSON parse error:", e)
-        return None
+    parsed = parse_json_output(str(input_data), context or "json")
+    return parsed if isinstance(parsed, dict) else None
 
 
 # =========================================================
@@ -38,27 +39,31 @@ class ResearcherAgent:
     def __init__(self):
         print("🕵️‍♂️ Researcher Agent initialized.")
         
-    def merge_content(self, old_text: str, new_input: str) -> dict:
+    def merge_content(self, old_text: str, new_input: str, on_delta=None) -> dict:
         """
         合并旧笔记内容和新输入内容
         
         参数:
             old_text: 现有笔记的文本内容
             new_input: 新的输入内容
+            on_delta: 可选的流式回调 on_delta(kind, text)，见 get_reasoning_completion
         
         返回:
             dict: 合并后的草稿，包含 title, summary, markdown_body, tags
+
+        新旧内容较短时由 V3 完成融合，见 model_router.choose_model；
+        结果无法解析或被截断时升级到 R1 重试一次，仍失败返回 None
         """
         print("⚗️ Researcher merging content...")
-        prompt = f"""
+        prompt = pack_prompt("""
         Act as a Knowledge Editor. 
         Task: Merge the NEW INPUT into the EXISTING NOTE.
         
         EXISTING NOTE:
-        {old_text[:5000]}
+        {old_text}
         
         NEW INPUT:
-        {new_input[:5000]}
+        {new_input}
         
         Output JSON (Markdown):
         {{
@@ -67,19 +72,29 @@ class ResearcherAgent:
             "markdown_body": "# Title\\n\\nMerged content...",
             "tags": ["tag1", "tag2"]
         }}
-        """
-        res, _ = get_reasoning_completion(prompt)
-        return safe_json_parse(res, "Merge Draft")
+        """, MERGE_PROMPT_TOKENS, label="merge", old_text=old_text, new_input=new_input)
+        for attempt in range(2):
+            res, _ = routed_completion(
+                prompt, task="merge", input_tokens=count_tokens(old_text) + count_tokens(new_input),
+                attempt=attempt, on_delta=on_delta, json_mode=True,
+            )
+            merged = safe_json_parse(res, "Merge Draft")
+            if merged and merged.get("markdown_body"):
+                return merged
+            if not res:
+                break
+        print("❌ Merge failed.")
+        return None
 
     def analyze_intent(self, text: str) -> dict:
         if text.strip().startswith("❌ Error"):
             print("🛑 Error detected in content, skipping analysis.")
             return {"intent": "Error", "category": "Error"}
 
-        prompt = f"""
+        prompt = pack_prompt("""
         Analyze the user input to determine the INTENT and CATEGORY.
 
-        Input Preview: {text[:800]}
+        Input Preview: {text}
 
         DEFINITIONS:
         1. **intent**:
@@ -96,8 +111,8 @@ class ResearcherAgent:
             "intent": "save_note" | "query_knowledge",
             "category": "Spanish" | "Tech" | "Humanities"
         }}
-        """
-        res = get_completion(prompt)
+        """, INTENT_PROMPT_TOKENS, label="intent", text=text)
+        res = get_completion(prompt, json_mode=True)
         
         parsed = safe_json_parse(res, "Intent Analysis")
         if not parsed:
@@ -124,7 +139,7 @@ class ResearcherAgent:
         print(f"🧠 Memory search (Filter: {category_filter})...")
         return vector_ops.search_memory(text[:1000], category_filter=category_filter)
 
-    def draft_content(self, text: str, category: str = "Humanities", error_context: str = "") -> dict:
+    def draft_content(self, text: str, category: str = "Humanities", error_context: str = "", on_delta=None) -> dict:
         """
         根据文本内容生成结构化草稿
         
@@ -132,9 +147,12 @@ class ResearcherAgent:
             text: 原始文本内容
             category: 内容分类，可选值 "Spanish" | "Tech" | "Humanities"（默认为 "Humanities"）
             error_context: 错误上下文，用于重试时提供之前的错误信息
+            on_delta: 可选的流式回调 on_delta(kind, text)，见 get_reasoning_completion
         
         返回:
             dict: 包含 title, summary, markdown_body, tags 等字段的草稿字典
+
+        模型按输入长度和分类选择（短内容用 V3），V3 的结果无法解析时重试升级到 R1
         """
         if text.strip().startswith("❌ Error"):
             return {
@@ -146,6 +164,7 @@ class ResearcherAgent:
             }
 
         current_error = error_context
+        input_tokens = count_tokens(text)
         
         for attempt in range(3):
             print(f"🔄 Draft Generation Attempt {attempt + 1}/3...")
@@ -155,10 +174,10 @@ class ResearcherAgent:
                 err_msg_block = f"\n\n--- PREVIOUS ERROR ---\n{current_error}\n----------------------\n"
 
             if category == "Spanish":
-                prompt = f"""
+                template = """
                 You are a Spanish teacher.
                 {err_msg_block}
-                Input: {text[:20000]}
+                Input: {text}
                 
                 Analyze the content and Output STRICT JSON.
                 LANGUAGE: SIMPLIFIED CHINESE.
@@ -175,10 +194,10 @@ class ResearcherAgent:
                 """
                 tag = "Spanish Draft"
             else: 
-                prompt = f"""
+                template = """
                 You are a professional research editor.
                 {err_msg_block}
-                Input: {text[:20000]}
+                Input: {text}
 
                 Analyze and output STRICT JSON.
                 LANGUAGE: SIMPLIFIED CHINESE.
@@ -194,7 +213,15 @@ class ResearcherAgent:
                 """
                 tag = "General Draft"
 
-            content, _ = get_reasoning_completion(prompt)
+            prompt = pack_prompt(template, DRAFT_PROMPT_TOKENS, label=tag, fixed={"err_msg_block": err_msg_block}, text=text)
+            content, _ = routed_completion(
+                prompt, task="draft", input_tokens=input_tokens, category=category,
+                attempt=attempt, on_delta=on_delta, json_mode=True,
+            )
+            if not content:
+                # 调用本身失败（llm_client 已做过重试和降级），换个提示词重来没有意义
+                print("❌ LLM unavailable, giving up.")
+                break
             draft = safe_json_parse(content, tag)
             
             if draft and isinstance(draft, dict) and draft.get("markdown_body"):
@@ -209,7 +236,13 @@ class ResearcherAgent:
                 return draft
             
             print(f"⚠️ Attempt {attempt + 1} Failed.")
-            current_error = f"JSON Parsing Failed. Raw output start: {content[:500]}..."
+            if extract_json(content)[1] == "truncated":
+                current_error = (
+                    "Output was cut off by the length limit before the JSON was complete. "
+                    "Keep markdown_body more concise so the whole JSON fits."
+                )
+            else:
+                current_error = f"JSON Parsing Failed. Raw output start: {content[:500]}..."
 
         print("❌ All attempts failed.")
         return {
@@ -317,19 +350,21 @@ class EditorAgent:
             dict: 合并后的草稿
         """
         new_text = new_draft.get("markdown_body", "") or str(new_draft)
-        prompt = f"""
+        prompt = pack_prompt("""
         Act as a Knowledge Manager. Merge these texts into one article.
         LANGUAGE: SIMPLIFIED CHINESE.
         FORMAT: Markdown.
 
         --- OLD ---
-        {old_text[:6000]}
+        {old_text}
         
         --- NEW ---
-        {new_text[:6000]}
+        {new_text}
         
         JSON SCHEMA: 
         {{ "title": "str", "summary": "str", "markdown_body": "str" }}
-        """
-        res, _ = get_reasoning_completion(prompt)
+        """, MERGE_PROMPT_TOKENS, label="merge", old_text=old_text, new_text=new_text)
+        res, _ = routed_completion(
+            prompt, task="merge", input_tokens=count_tokens(old_text) + count_tokens(new_text), json_mode=True
+        )
         return safe_json_parse(res, "Merge")
\ No newline at end of file
@@ -1,5 +1,7 @@
 import sys
 import os
+import re
+import json
 import uuid
 import time
 from io import StringIO
@@ -18,6 +20,8 @@ except ImportError:
 
 # Import Workflow
 from workflow import app_graph, KnowledgeDomain
+import vector_ops
+import llm_telemetry
 
 
 # Import File Ops
@@ -26,6 +30,78 @@ try:
 except ImportError:
     read_pdf_content = None
 
+_BODY_FIELD_RE = re.compile(r'"markdown_body"\s*:\s*"')
+
+
+def partial_markdown_body(raw: str) -> str:
+    """从尚未生成完的草稿 JSON 中取出 markdown_body 已生成的部分（用于流式预览）"""
+    match = _BODY_FIELD_RE.search(raw)
+    if not match:
+        return ""
+    body = raw[match.end():]
+    end = re.search(r'(?<!\\)(\\\\)*"', body)
+    if end:
+        body = body[:end.end() - 1]
+    body = re.sub(r'\\(u[0-9a-fA-F]{0,3})?$', "", body)  # 去掉被截断的转义序列
+    try:
+        return json.loads(f'"{body}"')
+    except ValueError:
+        return body.replace("\\n", "\n")
+
+
+class LLMStreamView:
+    """在 status 容器里实时渲染 R1 的思考过程和草稿正文"""
+
+    REFRESH_SECONDS = 0.15
+
+    def __init__(self, container):
+        self.container = container
+        self.reasoning_box = None
+        self.draft_box = None
+        self.reasoning = ""
+        self.content = ""
+        self._last_render = 0.0
+
+    def update(self, delta: dict):
+        kind, text = delta.get("kind"), delta.get("text", "")
+        if kind == "reasoning" and self.content:
+            # 上一次生成已结束（解析失败重试），重新开始显示
+            self.reasoning, self.content = "", ""
+        if kind == "reasoning":
+            self.reasoning += text
+        else:
+            self.content += text
+        if time.monotonic() - self._last_render >= self.REFRESH_SECONDS:
+            self.render()
+
+    def flush(self):
+        """流结束后补渲染节流期间积压的最后几个增量"""
+        if self.reasoning or self.content:
+            self.render()
+
+    def render(self):
+        self._last_render = time.monotonic()
+        if self.reasoning_box is None:
+            self.reasoning_box = self.container.empty()
+            self.draft_box = self.container.empty()
+        if self.reasoning:
+            self.reasoning_box.caption(f"💭 {self.reasoning[-600:]}")
+        body = partial_markdown_body(self.content)
+        if body:
+            self.draft_box.markdown(body[-3000:])
+
+
+def run_telemetry_line(run_id: str) -> str:
+    """本次工作流运行的 LLM 调用摘要（调用次数、耗时、token、成本）"""
+    total = llm_telemetry.get_summary(run_id=run_id)["total"]
+    if not total["calls"]:
+        return ""
+    return (
+        f"📊 LLM: {total['calls']} calls, {total['wall_seconds']:.1f}s, "
+        f"{total['prompt_tokens']}+{total['completion_tokens']} tokens, ${total['cost']:.4f}"
+    )
+
+
 # ===========================
 #  Page Configuration
 # ===========================
@@ -64,6 +140,16 @@ st.markdown("""
     </style>
     """, unsafe_allow_html=True)
 
+# ===========================
+#  Background Warmup
+# ===========================
+# 向量模型很大，放到后台线程加载，UI 先渲染出来
+@st.cache_resource(show_spinner=False)
+def start_vector_warmup():
+    return vector_ops.start_warmup()
+
+start_vector_warmup()
+
 # ===========================
 #  State Init
 # ===========================
@@ -75,6 +161,13 @@ if "messages" not in st.session_state:
 if "thread_id" not in st.session_state:
     st.session_state["thread_id"] = str(uuid.uuid4())
 
+if "session_id" not in st.session_state:
+    st.session_state["session_id"] = uuid.uuid4().hex[:12]
+
+# 遥测中的工作流运行 ID：每次提交输入生成一个，人工审核后的续跑沿用（与 LangGraph 线程无关）
+if "run_id" not in st.session_state:
+    st.session_state["run_id"] = None
+
 if "graph_state" not in st.session_state:
     st.session_state["graph_state"] = "IDLE"  # IDLE, RUNNING, PAUSED
 
@@ -99,6 +192,12 @@ with st.sidebar:
         """, unsafe_allow_html=True
     )
     st.caption("Knowledge Graph Agent")
+    if vector_ops.is_ready():
+        st.caption("🧠 Memory: ready")
+    elif vector_ops.get_warmup_error():
+        st.caption(f"🧠 Memory: failed ({vector_ops.get_warmup_error()})")
+    else:
+        st.caption("🧠 Memory: loading in background...")
     
     st.divider()
     
@@ -127,6 +226,15 @@ with st.sidebar:
     )
     
     st.divider()
+
+    session_total = llm_telemetry.get_summary(session_id=st.session_state["session_id"])["total"]
+    if session_total["calls"]:
+        with st.expander("📊 LLM Usage (this session)"):
+            st.caption(
+                f"{session_total['calls']} calls · {session_total['wall_seconds']:.1f}s · "
+                f"{session_total['prompt_tokens']}+{session_total['completion_tokens']} tokens · "
+                f"${session_total['cost']:.4f} · {session_total['cache_hits']} cache hits"
+            )
     
     # Reset Button
     if st.button("🗑️ Clear Chat & Reset", use_container_width=True):
@@ -209,9 +317,13 @@ if st.session_state["graph_state"] == "PAUSED":
                 # 2. Resume Graph Execution
                 with st.status("🚀 Writing to Notion...", expanded=True) as status:
                     final_output = None
-                    for event in app_graph.stream(None, config, stream_mode="values"):
-                        if "final_output" in event:
-                            final_output = event["final_output"]
+                    with llm_telemetry.telemetry_scope(run_id=st.session_state["run_id"], session_id=st.session_state["session_id"]):
+                        for event in app_graph.stream(None, config, stream_mode="values"):
+                            if "final_output" in event:
+                                final_output = event["final_output"]
+                    telemetry_line = run_telemetry_line(st.session_state["run_id"])
+                    if telemetry_line:
+                        status.write(telemetry_line)
                     status.update(label="✅ Published successfully!", state="complete", expanded=False)
                 
                 # 3. Append Success Message
@@ -244,6 +356,7 @@ if st.session_state["graph_state"] == "IDLE":
 
         # B. Run Graph
         config = {"configurable": {"thread_id": st.session_state["thread_id"]}}
+        st.session_state["run_id"] = uuid.uuid4().hex[:12]
         
         with st.chat_message("assistant"):
             status_container = st.status("🤖 Thinking...", expanded=True)
@@ -265,23 +378,35 @@ if st.session_state["graph_state"] == "IDLE":
                 "retry_count": 0
                 }
 
-                # Stream Graph
+                # Stream Graph（values: 状态快照；custom: R1 的增量输出）
                 final_output = None
                 intent_detected = None
+                stream_view = LLMStreamView(status_container)
                 
-                for event in app_graph.stream(initial_state, config, stream_mode="values"):
-                    if "intent_type" in event and event["intent_type"]:
-                        intent_detected = event["intent_type"]
-                        if intent_detected == "query_knowledge":
-                            status_container.write("🔍 Intent: **Query Knowledge Base**")
-                        elif intent_detected == "save_note":
-                            status_container.write("✍️ Intent: **Drafting Note**")
-                    
-                    if "memory_match" in event and event['memory_match'].get('match'):
-                        status_container.write(f"🧠 Memory Recall: Found related note '{event['memory_match'].get('title')}'")
-                    
-                    if "final_output" in event:
-                        final_output = event["final_output"]
+                with llm_telemetry.telemetry_scope(run_id=st.session_state["run_id"], session_id=st.session_state["session_id"]):
+                    for mode, event in app_graph.stream(initial_state, config, stream_mode=["values", "custom"]):
+                        if mode == "custom":
+                            if "llm_delta" in event:
+                                stream_view.update(event["llm_delta"])
+                            continue
+
+                        if "intent_type" in event and event["intent_type"]:
+                            intent_detected = event["intent_type"]
+                            if intent_detected == "query_knowledge":
+                                status_container.write("🔍 Intent: **Query Knowledge Base**")
+                            elif intent_detected == "save_note":
+                                status_container.write("✍️ Intent: **Drafting Note**")
+
+                        if "memory_match" in event and event['memory_match'].get('match'):
+                            status_container.write(f"🧠 Memory Recall: Found related note '{event['memory_match'].get('title')}'")
+
+                        if "final_output" in event:
+                            final_output = event["final_output"]
+                stream_view.flush()
+
+                telemetry_line = run_telemetry_line(st.session_state["run_id"])
+                if telemetry_line:
+                    status_container.write(telemetry_line)
 
                 # C. Check Results
                 snapshot = app_graph.get_state(config)
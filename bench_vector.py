@@ -0,0 +1,381 @@
+"""
+向量检索的质量与延迟基准
+
+用法:
+    python bench_vector.py                          # 离线：确定性 stub 编码器 + 内置语料
+    python bench_vector.py --modes dense hybrid --distractors 200
+    python bench_vector.py --embedder model         # 使用 vector_ops 配置的真实编码器
+    python bench_vector.py --out results.json --compare baseline.json
+
+在临时目录里建库（不触碰 ./chroma_db），写入三个领域的固定笔记和按种子生成的干扰笔记，
+然后跑带标注的查询，报告 recall@k、MRR、查询延迟 p50/p95、建库吞吐和磁盘占用。
+stub 编码器把分词结果哈希到固定维度，结果只取决于代码和种子，适合跨提交对比。
+（Chroma 的 HNSW 是近似检索、并行建图，召回偶尔会有一条查询级别的波动。）
+"""
+import io
+import os
+import json
+import math
+import time
+import random
+import shutil
+import hashlib
+import argparse
+import tempfile
+import statistics
+import subprocess
+from contextlib import contextmanager, redirect_stdout, nullcontext
+from typing import Optional, Dict, Any, List, Tuple
+
+import vector_ops
+from lexical_index import tokenize
+
+STUB_DIM = 256
+RECALL_KS = (1, 3, 5)
+
+# (page_id, category, title, content)
+FIXTURE_NOTES: List[Tuple[str, str, str, str]] = [
+    ("es-imperfecto", "spanish_learning", "Pretérito imperfecto",
+     "Summary: 西班牙语过去未完成时，描述过去的习惯、背景和持续动作。\n"
+     "Cuando era niño, jugaba en el parque todos los días. Terminaciones -aba / -ía."),
+    ("es-indefinido", "spanish_learning", "Pretérito indefinido",
+     "Summary: 简单过去时，表示过去某个时间点完成的动作。\n"
+     "Ayer comí paella. Verbos irregulares: fui, tuve, hice, estuve."),
+    ("es-subjuntivo", "spanish_learning", "Presente de subjuntivo",
+     "Summary: 虚拟式现在时，用于愿望、怀疑、情感和命令。\n"
+     "Espero que vengas mañana. Ojalá llueva. Quiero que estudies más."),
+    ("es-ser-estar", "spanish_learning", "Ser vs Estar",
+     "Summary: ser 表示本质和身份，estar 表示状态和位置。\n"
+     "Soy profesor. Estoy cansado. La fiesta es en mi casa."),
+    ("es-por-para", "spanish_learning", "Por y para",
+     "Summary: por 表示原因、途径、交换；para 表示目的、目的地、期限。\n"
+     "Gracias por la ayuda. Estudio para aprender. Salgo para Madrid."),
+    ("es-vocab-cocina", "spanish_learning", "Vocabulario de cocina",
+     "Summary: 厨房词汇：sartén 平底锅，olla 锅，cuchillo 刀，hornear 烘烤。\n"
+     "Receta: freír, hervir, cortar, mezclar los ingredientes."),
+    ("es-pronombres", "spanish_learning", "Pronombres de objeto directo e indirecto",
+     "Summary: 直接宾语代词 lo/la/los/las 与间接宾语代词 le/les，连用时 le 变 se。\n"
+     "Se lo di a María. Te la compré ayer."),
+    ("tech-hnsw", "tech_knowledge", "HNSW 近似最近邻索引",
+     "Summary: 分层可导航小世界图，ef_construction 和 M 控制召回与构建速度。\n"
+     "Chroma uses hnswlib; search ef trades latency for recall."),
+    ("tech-bm25", "tech_knowledge", "BM25 ranking function",
+     "Summary: 基于词频和逆文档频率的检索打分，k1 和 b 控制饱和与长度归一化。\n"
+     "Inverted index, term frequency saturation, document length normalization."),
+    ("tech-langgraph", "tech_knowledge", "LangGraph interrupt_before",
+     "Summary: 在指定节点前暂停工作流，等待人工审查后继续。\n"
+     "StateGraph, checkpointer, MemorySaver, human-in-the-loop approval."),
+    ("tech-pytorch-linear", "tech_knowledge", "torch.nn.Linear 权重初始化",
+     "Summary: Linear 层默认使用 kaiming_uniform 初始化权重，偏置为均匀分布。\n"
+     "reset_parameters, fan_in, bias bound 1/sqrt(fan_in)."),
+    ("tech-asyncio", "tech_knowledge", "Python asyncio gather",
+     "Summary: asyncio.gather 并发运行多个协程，Semaphore 限制同时进行的请求数。\n"
+     "event loop, await, coroutine, task cancellation."),
+    ("tech-sqlite-wal", "tech_knowledge", "SQLite WAL mode",
+     "Summary: 预写日志模式允许读写并发，checkpoint 把 WAL 合并回主库。\n"
+     "PRAGMA journal_mode=WAL; synchronous=NORMAL."),
+    ("tech-onnx", "tech_knowledge", "ONNX Runtime int8 量化",
+     "Summary: 动态量化把权重转为 int8，CPU 推理更快、模型更小。\n"
+     "quantize_dynamic, QuantType.QInt8, InferenceSession."),
+    ("hum-economic-rent", "humanities", "经济租",
+     "Summary: 经济租是生产要素收入中超过其机会成本的部分。\n"
+     "Economic rent, Ricardo, land rent, rent-seeking behaviour."),
+    ("hum-critical-thinking", "humanities", "Critical thinking",
+     "Summary: 批判性思维是对事实进行分析以形成判断的能力。\n"
+     "Evaluate arguments, identify fallacies, question assumptions."),
+    ("hum-industrial-revolution", "humanities", "工业革命",
+     "Summary: 18 世纪后期始于英国，蒸汽机和纺织机械改变了生产方式。\n"
+     "La Revolución Industrial transformó la economía europea."),
+    ("hum-stoicism", "humanities", "斯多葛主义",
+     "Summary: 区分可控与不可控之事，以理性和德性面对命运。\n"
+     "Marcus Aurelius, Epictetus, Seneca, Meditations."),
+    ("hum-opportunity-cost", "humanities", "机会成本",
+     "Summary: 做出选择时所放弃的次优选项的价值。\n"
+     "Opportunity cost, trade-off, scarcity, marginal decision."),
+    ("hum-renaissance", "humanities", "文艺复兴",
+     "Summary: 14 至 17 世纪始于意大利的文化运动，人文主义复兴古典学术。\n"
+     "Florence, Medici, Leonardo da Vinci, humanism."),
+    ("hum-social-contract", "humanities", "社会契约论",
+     "Summary: 霍布斯、洛克、卢梭关于国家权力来源于人民同意的理论。\n"
+     "Leviathan, state of nature, general will."),
+]
+
+# (查询, 期望命中的 page_id, 可选的领域过滤)
+FIXTURE_QUERIES: List[Tuple[str, str, Optional[str]]] = [
+    ("过去的习惯用什么时态", "es-imperfecto", None),
+    ("jugaba todos los días terminaciones aba", "es-imperfecto", "spanish_learning"),
+    ("ayer fui irregulares", "es-indefinido", None),
+    ("espero que vengas ojalá", "es-subjuntivo", None),
+    ("虚拟式 愿望 怀疑", "es-subjuntivo", "spanish_learning"),
+    ("ser estar 区别", "es-ser-estar", None),
+    ("por para 目的 原因", "es-por-para", None),
+    ("sartén olla cuchillo", "es-vocab-cocina", None),
+    ("se lo di 宾语代词", "es-pronombres", None),
+    ("HNSW ef_construction M recall", "tech-hnsw", None),
+    ("近似最近邻 图索引", "tech-hnsw", "tech_knowledge"),
+    ("BM25 k1 b term frequency", "tech-bm25", None),
+    ("interrupt_before 人工审查", "tech-langgraph", None),
+    ("nn.Linear kaiming_uniform", "tech-pytorch-linear", None),
+    ("asyncio gather Semaphore", "tech-asyncio", None),
+    ("WAL journal_mode checkpoint", "tech-sqlite-wal", None),
+    ("int8 quantize_dynamic CPU", "tech-onnx", None),
+    ("什么是经济租", "hum-economic-rent", None),
+    ("rent-seeking Ricardo", "hum-economic-rent", "humanities"),
+    ("critical thinking fallacies arguments", "hum-critical-thinking", None),
+    ("蒸汽机 英国 工业革命", "hum-industrial-revolution", None),
+    ("Revolución Industrial economía europea", "hum-industrial-revolution", None),
+    ("Marcus Aurelius Seneca", "hum-stoicism", None),
+    ("机会成本 trade-off scarcity", "hum-opportunity-cost", None),
+    ("文艺复兴 人文主义 Medici", "hum-renaissance", None),
+    ("霍布斯 洛克 卢梭 社会契约", "hum-social-contract", None),
+]
+
+
+class StubEmbedder:
+    """
+    确定性的离线编码器：把 tokenize() 的结果哈希到 STUB_DIM 维并做 L2 归一化
+
+    与 chromadb Embedding 函数接口一致：embedder(texts) -> List[List[float]]
+    """
+
+    def __init__(self, dim: int = STUB_DIM):
+        self.dim = dim
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        vectors = []
+        for text in input:
+            vec = [0.0] * self.dim
+            for token in tokenize(text):
+                digest = hashlib.md5(token.encode("utf-8")).digest()
+                idx = int.from_bytes(digest[:4], "little") % self.dim
+                vec[idx] += 1.0 if digest[4] & 1 else -1.0
+            norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+            vectors.append([v / norm for v in vec])
+        return vectors
+
+
+def build_corpus(distractors_per_domain: int = 50, seed: int = 42) -> List[Dict[str, Any]]:
+    """
+    固定笔记 + 按种子生成的干扰笔记（从同领域词汇随机拼接，只用于增加检索难度）
+    """
+    rng = random.Random(seed)
+    pages = [
+        {"page_id": pid, "content": content, "title": title, "category": category}
+        for pid, category, title, content in FIXTURE_NOTES
+    ]
+    vocab: Dict[str, List[str]] = {}
+    for _, category, title, content in FIXTURE_NOTES:
+        vocab.setdefault(category, []).extend(tokenize(f"{title} {content}"))
+
+    for category, words in sorted(vocab.items()):
+        words = sorted(set(w for w in words if len(w) > 1))
+        for i in range(distractors_per_domain):
+            title = " ".join(rng.sample(words, 3))
+            body = " ".join(rng.choice(words) for _ in range(rng.randint(40, 120)))
+            pages.append({
+                "page_id": f"distractor-{category}-{i}",
+                "content": f"Summary: {' '.join(rng.sample(words, 8))}\n{body}",
+                "title": title,
+                "category": category,
+            })
+    return pages
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+@contextmanager
+def _isolated_store(path: str, embedder=None, partitioned: Optional[bool] = None):
+    """把 vector_ops 临时指向 path 下的新库；退出时恢复原有配置和懒加载状态"""
+    overrides = {
+        "CHROMA_PATH": path,
+        "CONTENT_STORE_PATH": os.path.join(path, "content_store.sqlite"),
+        "INDEX_VERSION_PATH": os.path.join(path, "index_version"),
+        "QUERY_CACHE_PATH": None,
+        "_client": None,
+        "_collection": None,
+        "_query_cache": None,
+        "_lexical_index": None,
+        "_fingerprint_index": None,
+        "_content_store": None,
+        "_index_version": None,
+    }
+    if embedder is not None:
+        overrides.update({"EMBEDDING_BACKEND": "local", "_embedding_func": embedder})
+    if partitioned is not None:
+        overrides["PARTITION_BY_DOMAIN"] = partitioned
+    saved = {name: getattr(vector_ops, name) for name in overrides}
+    for name, value in overrides.items():
+        setattr(vector_ops, name, value)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(vector_ops, name, value)
+
+
+def run_benchmark(
+    *,
+    embedder: str = "stub",
+    modes: Tuple[str, ...] = ("dense",),
+    distractors: int = 50,
+    seed: int = 42,
+    chunked: bool = False,
+    partitioned: bool = False,
+    repeat: int = 3,
+    verbose: bool = False,
+) -> Dict[str, Any]:
+    """
+    建库并评测
+
+    参数:
+        embedder: "stub"（确定性离线编码器）或 "model"（vector_ops 配置的真实编码器）
+        modes: 要评测的检索模式（dense / hybrid / lexical）
+        distractors: 每个领域的干扰笔记数
+        seed: 干扰笔记的随机种子
+        chunked: 是否分块索引
+        partitioned: 是否按领域分区存储
+        repeat: 每条查询重复次数（延迟取全部样本；查询向量缓存每轮清空）
+        verbose: 保留 vector_ops 的逐条检索日志
+
+    返回:
+        dict: 建库指标 + 每个模式的 recall@k / MRR / 延迟
+    """
+    corpus = build_corpus(distractors, seed)
+    workdir = tempfile.mkdtemp(prefix="bench_vector_")
+    stub = StubEmbedder() if embedder == "stub" else None
+    result: Dict[str, Any] = {
+        "embedder": embedder if stub else vector_ops.embedding_model_key(),
+        "pages": len(corpus),
+        "queries": len(FIXTURE_QUERIES),
+        "seed": seed,
+        "chunked": chunked,
+        "partitioned": partitioned,
+        "modes": {},
+    }
+    try:
+        quiet = nullcontext() if verbose else redirect_stdout(io.StringIO())
+        with _isolated_store(workdir, stub, partitioned), quiet:
+            if stub is None:
+                vector_ops.embed_texts(["warmup"])
+            stats = vector_ops.add_memories(corpus, chunked=chunked)
+            result["build"] = {
+                "elapsed_s": stats["elapsed"],
+                "pages_per_sec": stats["pages_per_sec"],
+                "failed": len(stats["failed"]),
+                "disk_bytes": _dir_size(workdir),
+            }
+
+            max_k = max(RECALL_KS)
+            for mode in modes:
+                vector_ops.get_lexical_index()  # 建索引不计入查询延迟
+                hits = {k: 0 for k in RECALL_KS}
+                reciprocal = 0.0
+                latencies = []
+                for round_no in range(repeat):
+                    vector_ops._get_query_cache().clear()
+                    for query, expected, category in FIXTURE_QUERIES:
+                        t0 = time.perf_counter()
+                        ranked = vector_ops.search_memories(
+                            query, n_results=max_k, category_filter=category, threshold=None, mode=mode,
+                        )
+                        latencies.append((time.perf_counter() - t0) * 1000)
+                        if round_no:
+                            continue
+                        ids = [r["page_id"] for r in ranked]
+                        rank = ids.index(expected) + 1 if expected in ids else None
+                        for k in RECALL_KS:
+                            hits[k] += bool(rank and rank <= k)
+                        reciprocal += 1.0 / rank if rank else 0.0
+                latencies.sort()
+                n = len(FIXTURE_QUERIES)
+                result["modes"][mode] = {
+                    **{f"recall@{k}": hits[k] / n for k in RECALL_KS},
+                    "mrr": reciprocal / n,
+                    "p50_ms": statistics.median(latencies),
+                    "p95_ms": _percentile(latencies, 0.95),
+                }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def print_report(result: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None):
+    build = result["build"]
+    print(
+        f"\n📊 {result['embedder']} | {result['pages']} pages, {result['queries']} queries "
+        f"(chunked={result['chunked']}, partitioned={result['partitioned']})"
+    )
+    print(
+        f"🏗️ build {build['elapsed_s']:.2f}s, {build['pages_per_sec']:.1f} pages/sec, "
+        f"{build['disk_bytes'] / 1024 / 1024:.2f} MB on disk"
+    )
+    columns = [f"recall@{k}" for k in RECALL_KS] + ["mrr", "p50_ms", "p95_ms"]
+    print(f"{'mode':<8}" + "".join(f"{c:>12}" for c in columns))
+    for mode, metrics in result["modes"].items():
+        row = f"{mode:<8}" + "".join(f"{metrics[c]:>12.3f}" for c in columns)
+        print(row)
+        base = (baseline or {}).get("modes", {}).get(mode)
+        if base:
+            print(f"{'  Δ':<8}" + "".join(f"{metrics[c] - base.get(c, 0):>+12.3f}" for c in columns))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark retrieval quality and latency of vector_ops")
+    parser.add_argument("--embedder", choices=["stub", "model"], default="stub")
+    parser.add_argument("--modes", nargs="+", default=["dense"], choices=["dense", "hybrid", "lexical"])
+    parser.add_argument("--distractors", type=int, default=50, help="distractor notes per domain")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=3, help="latency rounds per query")
+    parser.add_argument("--chunked", action="store_true")
+    parser.add_argument("--partitioned", action="store_true")
+    parser.add_argument("--verbose", action="store_true", help="keep per-query search logs")
+    parser.add_argument("--out", help="write results as JSON")
+    parser.add_argument("--compare", help="baseline JSON from a previous --out")
+    args = parser.parse_args()
+
+    result = run_benchmark(
+        embedder=args.embedder,
+        modes=tuple(args.modes),
+        distractors=args.distractors,
+        seed=args.seed,
+        chunked=args.chunked,
+        partitioned=args.partitioned,
+        repeat=args.repeat,
+        verbose=args.verbose,
+    )
+    result["revision"] = _git_revision()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"💾 Results saved: {args.out}")
@@ -0,0 +1,111 @@
+import zlib
+import sqlite3
+import hashlib
+import threading
+from typing import Optional, Dict, Iterable, Tuple
+
+
+class ContentStore:
+    """
+    笔记全文的旁路存储（SQLite + zlib 压缩，按内容寻址）
+
+    - blobs: content_hash -> 压缩后的全文，相同内容只存一份
+    - pages: page_id -> content_hash
+    向量库 metadata 只保留标题、摘要等小字段，全文在真正需要时（RAG）再按 page_id 读取。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS blobs (content_hash TEXT PRIMARY KEY, data BLOB);"
+            "CREATE TABLE IF NOT EXISTS pages (page_id TEXT PRIMARY KEY, content_hash TEXT);"
+            "CREATE INDEX IF NOT EXISTS pages_hash ON pages (content_hash);"
+        )
+        self._db.commit()
+
+    @staticmethod
+    def hash_content(content: str) -> str:
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def put(self, page_id: str, content: str) -> str:
+        """写入/替换页面全文，返回内容哈希"""
+        return self.put_many([(page_id, content)])[page_id]
+
+    def put_many(self, items: Iterable[Tuple[str, str]]) -> Dict[str, str]:
+        """批量写入，单个事务提交"""
+        hashes = {}
+        replaced = set()
+        with self._lock:
+            for page_id, content in items:
+                digest = self.hash_content(content)
+                old = self._db.execute(
+                    "SELECT content_hash FROM pages WHERE page_id = ?", (page_id,)
+                ).fetchone()
+                if old and old[0] != digest:
+                    replaced.add(old[0])
+                self._db.execute(
+                    "INSERT OR IGNORE INTO blobs (content_hash, data) VALUES (?, ?)",
+                    (digest, zlib.compress(content.encode("utf-8"), 6)),
+                )
+                self._db.execute(
+                    "INSERT OR REPLACE INTO pages (page_id, content_hash) VALUES (?, ?)",
+                    (page_id, digest),
+                )
+                hashes[page_id] = digest
+            self._gc(replaced)
+            self._db.commit()
+        return hashes
+
+    def get(self, page_id: str) -> Optional[str]:
+        """读取页面全文，不存在时返回 None"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT b.data FROM pages p JOIN blobs b ON b.content_hash = p.content_hash WHERE p.page_id = ?",
+                (page_id,),
+            ).fetchone()
+        return zlib.decompress(row[0]).decode("utf-8") if row else None
+
+    def get_many(self, page_ids: Iterable[str]) -> Dict[str, str]:
+        page_ids = list(page_ids)
+        if not page_ids:
+            return {}
+        placeholders = ",".join("?" * len(page_ids))
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT p.page_id, b.data FROM pages p JOIN blobs b ON b.content_hash = p.content_hash "
+                f"WHERE p.page_id IN ({placeholders})",
+                page_ids,
+            ).fetchall()
+        return {pid: zlib.decompress(data).decode("utf-8") for pid, data in rows}
+
+    def delete(self, page_ids: Iterable[str]):
+        page_ids = list(page_ids)
+        with self._lock:
+            orphaned = set()
+            for page_id in page_ids:
+                row = self._db.execute(
+                    "SELECT content_hash FROM pages WHERE page_id = ?", (page_id,)
+                ).fetchone()
+                if row:
+                    orphaned.add(row[0])
+            self._db.executemany("DELETE FROM pages WHERE page_id = ?", [(p,) for p in page_ids])
+            self._gc(orphaned)
+            self._db.commit()
+
+    def _gc(self, hashes: Iterable[str]):
+        """删除已不再被任何页面引用的 blob"""
+        self._db.executemany(
+            "DELETE FROM blobs WHERE content_hash = ? "
+            "AND NOT EXISTS (SELECT 1 FROM pages WHERE content_hash = ?)",
+            [(h, h) for h in hashes],
+        )
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            pages = self._db.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+            blobs, size = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM blobs"
+            ).fetchone()
+        return {"pages": pages, "blobs": blobs, "compressed_bytes": size}
@@ -0,0 +1,123 @@
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Optional, List, Dict, Any
+
+
+def normalize_query(text: str) -> str:
+    """查询文本归一化：NFKC + 去首尾空白 + 合并连续空白"""
+    return " ".join(unicodedata.normalize("NFKC", text or "").split())
+
+
+class QueryEmbeddingCache:
+    """
+    查询向量缓存：进程内 LRU + 可选的 SQLite 持久层
+
+    键为 (模型名, 归一化查询文本) 的哈希，换模型后旧缓存自然失效。
+    查找顺序：内存 LRU -> 磁盘 -> 未命中（由调用方编码后 put 回来）。
+    """
+
+    def __init__(self, max_entries: int = 512, path: Optional[str] = None, max_disk_entries: int = 20000):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.path = path
+        self._lru: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                    "key TEXT PRIMARY KEY, model TEXT, vector BLOB, accessed REAL)"
+                )
+                self._db.commit()
+            except Exception as e:
+                print(f"⚠️ Query cache disk tier disabled ({path}): {e}")
+                self._db = None
+
+    @staticmethod
+    def make_key(model_name: str, text: str) -> str:
+        return hashlib.sha256(f"{model_name}\0{normalize_query(text)}".encode("utf-8")).hexdigest()
+
+    def get(self, model_name: str, text: str) -> Optional[List[float]]:
+        key = self.make_key(model_name, text)
+        with self._lock:
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return vector
+
+            if self._db is not None:
+                try:
+                    row = self._db.execute(
+                        "SELECT vector FROM query_embeddings WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row:
+                        self._db.execute(
+                            "UPDATE query_embeddings SET accessed = julianday('now') WHERE key = ?", (key,)
+                        )
+                        self._db.commit()
+                        vector = array("f", row[0]).tolist()
+                        self._remember(key, vector)
+                        self.hits += 1
+                        self.disk_hits += 1
+                        return vector
+                except Exception as e:
+                    print(f"⚠️ Query cache disk read failed: {e}")
+
+            self.misses += 1
+            return None
+
+    def put(self, model_name: str, text: str, vector: List[float]):
+        key = self.make_key(model_name, text)
+        vector = [float(x) for x in vector]
+        with self._lock:
+            self._remember(key, vector)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO query_embeddings (key, model, vector, accessed) "
+                        "VALUES (?, ?, ?, julianday('now'))",
+                        (key, model_name, array("f", vector).tobytes()),
+                    )
+                    self._db.execute(
+                        "DELETE FROM query_embeddings WHERE key IN ("
+                        "SELECT key FROM query_embeddings ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                        (self.max_disk_entries,),
+                    )
+                    self._db.commit()
+                except Exception as e:
+                    print(f"⚠️ Query cache disk write failed: {e}")
+
+    def _remember(self, key: str, vector: List[float]):
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM query_embeddings")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._lru),
+            "persistent": self._db is not None,
+        }
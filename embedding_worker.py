@@ -0,0 +1,237 @@
+import time
+import queue
+import atexit
+import itertools
+import threading
+import multiprocessing as mp
+from concurrent.futures import Future
+from typing import Optional, List, Dict, Any
+
+_READY = "__ready__"
+
+
+def _worker_main(
+    model_name: str,
+    device: str,
+    request_q,
+    response_q,
+    batch_window: float,
+    max_batch: int,
+    encode_batch_size: int,
+):
+    """
+    Embedding 子进程主循环
+
+    拿到第一个请求后，在 batch_window 秒内继续收集其它请求（最多 max_batch 条文本），
+    合并成一次 encode 调用，再按请求拆分结果发回。
+    """
+    try:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(model_name, device=device)
+    except Exception as e:
+        response_q.put((_READY, None, f"model load failed: {e}"))
+        return
+    response_q.put((_READY, None, None))
+
+    stopping = False
+    while not stopping:
+        item = request_q.get()
+        if item is None:
+            break
+        batch = [item]
+        n_texts = len(item[1])
+        deadline = time.monotonic() + batch_window
+        while n_texts < max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                nxt = request_q.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if nxt is None:
+                stopping = True
+                break
+            batch.append(nxt)
+            n_texts += len(nxt[1])
+
+        texts = [t for _, req_texts in batch for t in req_texts]
+        try:
+            # 与 chromadb 的 SentenceTransformerEmbeddingFunction 保持一致（不归一化）
+            vectors = model.encode(
+                texts,
+                batch_size=encode_batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=False,
+            ).tolist()
+        except Exception as e:
+            for req_id, _ in batch:
+                response_q.put((req_id, None, str(e)))
+            continue
+
+        offset = 0
+        for req_id, req_texts in batch:
+            response_q.put((req_id, vectors[offset:offset + len(req_texts)], None))
+            offset += len(req_texts)
+
+
+class EmbeddingWorkerClient:
+    """
+    独立 Embedding 进程的客户端
+
+    模型只在子进程里加载一次；Streamlit 各会话线程调用 embed() 时把请求放进
+    multiprocessing 队列，子进程在一个很短的时间窗口内把并发请求合并成一次前向计算，
+    编码期间不占用主进程的 GIL。
+
+    子进程启动后先加载模型，加载完成时发回就绪信号。embed() 先按 load_timeout 等待就绪，
+    再把请求放进队列，request_timeout 只约束请求本身，冷启动慢（磁盘/CPU 慢）不会误判为超时。
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        device: str = "cpu",
+        *,
+        batch_window_ms: float = 10,
+        max_batch: int = 64,
+        encode_batch_size: int = 32,
+        request_timeout: float = 120,
+        load_timeout: float = 600,
+    ):
+        self.model_name = model_name
+        self.device = device
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch = max_batch
+        self.encode_batch_size = encode_batch_size
+        self.request_timeout = request_timeout
+        self.load_timeout = load_timeout
+
+        self._ctx = mp.get_context("spawn")
+        self._request_q = None
+        self._response_q = None
+        self._process = None
+        self._dispatcher = None
+        self._pending: Dict[int, Future] = {}
+        self._pending_lock = threading.Lock()
+        self._ids = itertools.count()
+        self._ready = threading.Event()
+        self._error: Optional[str] = None
+        self._closed = False
+        self.requests = 0
+        self.texts = 0
+
+    def start(self):
+        if self._process is not None:
+            return
+        self._request_q = self._ctx.Queue()
+        self._response_q = self._ctx.Queue()
+        self._process = self._ctx.Process(
+            target=_worker_main,
+            args=(
+                self.model_name,
+                self.device,
+                self._request_q,
+                self._response_q,
+                self.batch_window,
+                self.max_batch,
+                self.encode_batch_size,
+            ),
+            name="embedding-worker",
+            daemon=True,
+        )
+        self._process.start()
+        self._dispatcher = threading.Thread(target=self._dispatch, name="embedding-dispatcher", daemon=True)
+        self._dispatcher.start()
+        atexit.register(self.close)
+        print(f"🧵 Embedding worker started (pid {self._process.pid}).")
+
+    def _dispatch(self):
+        """把子进程返回的结果分发给对应的 Future；子进程退出时让所有等待者失败"""
+        while not self._closed:
+            try:
+                req_id, vectors, error = self._response_q.get(timeout=1)
+            except queue.Empty:
+                if self._process is not None and not self._process.is_alive():
+                    self._fail_all(f"embedding worker exited (code {self._process.exitcode})")
+                    return
+                continue
+            except (EOFError, OSError):
+                return
+
+            if req_id == _READY:
+                self._error = error
+                self._ready.set()
+                if error:
+                    print(f"❌ Embedding worker failed: {error}")
+                    self._fail_all(error)
+                continue
+
+            with self._pending_lock:
+                future = self._pending.pop(req_id, None)
+            if future is None:
+                continue
+            if error:
+                future.set_exception(RuntimeError(error))
+            else:
+                future.set_result(vectors)
+
+    def _fail_all(self, reason: str):
+        self._error = reason
+        self._ready.set()
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(RuntimeError(reason))
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """等待子进程加载完模型"""
+        self.start()
+        self._ready.wait(timeout)
+        return self.is_ready()
+
+    def is_ready(self) -> bool:
+        return self._ready.is_set() and self._error is None
+
+    def embed(self, texts: List[str], timeout: Optional[float] = None) -> List[List[float]]:
+        """编码一组文本（阻塞直到子进程返回）"""
+        if not texts:
+            return []
+        self.start()
+        if not self._ready.wait(self.load_timeout):
+            raise TimeoutError(f"embedding worker did not load the model within {self.load_timeout:.0f}s")
+        if self._error:
+            raise RuntimeError(self._error)
+
+        req_id = next(self._ids)
+        future: Future = Future()
+        with self._pending_lock:
+            self._pending[req_id] = future
+        self.requests += 1
+        self.texts += len(texts)
+        self._request_q.put((req_id, list(texts)))
+        try:
+            return future.result(timeout=timeout or self.request_timeout)
+        finally:
+            with self._pending_lock:
+                self._pending.pop(req_id, None)
+
+    def close(self):
+        if self._closed or self._process is None:
+            return
+        self._closed = True
+        try:
+            self._request_q.put(None)
+            self._process.join(timeout=5)
+        except Exception:
+            pass
+        if self._process.is_alive():
+            self._process.terminate()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "alive": bool(self._process and self._process.is_alive()),
+            "ready": self.is_ready(),
+            "requests": self.requests,
+            "texts": self.texts,
+            "error": self._error,
+        }
@@ -0,0 +1,121 @@
+import re
+import hashlib
+import threading
+from typing import Optional, Dict, Tuple, List
+
+from lexical_index import tokenize
+
+SIMHASH_BITS = 64
+
+
+def normalize_text(text: str) -> str:
+    """去掉大小写和空白差异，用于精确重复判断"""
+    return re.sub(r"\s+", " ", (text or "").strip().lower())
+
+
+def text_hash(text: str) -> str:
+    """归一化后全文的 sha256"""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def simhash(text: str, bits: int = SIMHASH_BITS) -> int:
+    """
+    计算文本的 SimHash 指纹
+
+    特征取 tokenize() 的结果（中日文单字+双字、西语去重音、英文词），按词频加权；
+    内容相近的文本指纹的汉明距离很小。
+    """
+    weights: Dict[str, int] = {}
+    for token in tokenize(text):
+        weights[token] = weights.get(token, 0) + 1
+
+    acc = [0] * bits
+    for token, weight in weights.items():
+        h = int.from_bytes(hashlib.md5(token.encode("utf-8")).digest()[:bits // 8], "little")
+        for i in range(bits):
+            acc[i] += weight if (h >> i) & 1 else -weight
+
+    fingerprint = 0
+    for i, value in enumerate(acc):
+        if value > 0:
+            fingerprint |= 1 << i
+    return fingerprint
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class SimHashIndex:
+    """
+    近重复检测索引：精确哈希 + SimHash 分段桶（LSH）
+
+    64 位指纹切成 bands 段，每段作为一个桶键。汉明距离小于 bands 的两个指纹至少有一段
+    完全相同（抽屉原理），所以查询只需比较同桶候选，不用扫全库。
+    """
+
+    def __init__(self, bands: int = 4, bits: int = SIMHASH_BITS):
+        self.bands = bands
+        self.bits = bits
+        self._band_width = bits // bands
+        self._lock = threading.Lock()
+        self._fingerprints: Dict[str, Tuple[int, str]] = {}   # doc_id -> (simhash, text_hash)
+        self._exact: Dict[str, set] = {}                     # text_hash -> doc_ids
+        self._buckets: Dict[Tuple[int, int], set] = {}       # (band, value) -> doc_ids
+
+    def __len__(self) -> int:
+        return len(self._fingerprints)
+
+    def _band_keys(self, fingerprint: int) -> List[Tuple[int, int]]:
+        mask = (1 << self._band_width) - 1
+        return [(b, (fingerprint >> (b * self._band_width)) & mask) for b in range(self.bands)]
+
+    def add(self, doc_id: str, fingerprint: int, exact_hash: str):
+        with self._lock:
+            self._remove_locked(doc_id)
+            self._fingerprints[doc_id] = (fingerprint, exact_hash)
+            self._exact.setdefault(exact_hash, set()).add(doc_id)
+            for key in self._band_keys(fingerprint):
+                self._buckets.setdefault(key, set()).add(doc_id)
+
+    def add_text(self, doc_id: str, text: str):
+        self.add(doc_id, simhash(text, self.bits), text_hash(text))
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            self._remove_locked(doc_id)
+
+    def _remove_locked(self, doc_id: str):
+        old = self._fingerprints.pop(doc_id, None)
+        if old is None:
+            return
+        fingerprint, exact_hash = old
+        self._exact.get(exact_hash, set()).discard(doc_id)
+        for key in self._band_keys(fingerprint):
+            self._buckets.get(key, set()).discard(doc_id)
+
+    def find(self, text: str, max_distance: int = 3) -> Optional[Tuple[str, int, bool]]:
+        """
+        查找与 text 重复或近重复的文档
+
+        返回:
+            tuple: (doc_id, 汉明距离, 是否精确重复)；没有时返回 None
+        """
+        with self._lock:
+            exact = self._exact.get(text_hash(text))
+            if exact:
+                return sorted(exact)[0], 0, True
+
+        fingerprint = simhash(text, self.bits)
+        with self._lock:
+            best = None
+            seen = set()
+            for key in self._band_keys(fingerprint):
+                for doc_id in self._buckets.get(key, ()):
+                    if doc_id in seen:
+                        continue
+                    seen.add(doc_id)
+                    distance = hamming(fingerprint, self._fingerprints[doc_id][0])
+                    if distance <= max_distance and (best is None or distance < best[1]):
+                        best = (doc_id, distance, False)
+        return best
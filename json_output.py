@@ -0,0 +1,191 @@
+import json
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+_CLOSERS = {"{": "}", "[": "]"}
+_VALID_ESCAPES = set('"\\/bfnrtu')
+
+# 按 label 累计：解析次数、直接成功、修复后成功、截断（拒收）、失败
+_stats: Dict[str, Dict[str, int]] = {}
+_stats_lock = threading.Lock()
+
+
+def _next_significant(text: str, i: int) -> str:
+    while i < len(text) and text[i] in " \t\r\n":
+        i += 1
+    return text[i] if i < len(text) else ""
+
+
+def _strip_trailing_comma(out: list):
+    while out and out[-1] in (" ", "\t", "\r", "\n"):
+        out.pop()
+    if out and out[-1] == ",":
+        out.pop()
+
+
+def repair_json(text: str) -> str:
+    """
+    逐字符扫描，修复模型输出中常见的 JSON 错误：
+
+    - 字符串中的原始换行/制表符等控制字符
+    - 非法转义（如 Markdown / LaTeX 中的 \\_、\\(），按字面反斜杠处理
+    - 字符串中未转义的双引号（后面不是 , } ] : 的引号视为正文）
+    - 对象/数组末尾多余的逗号
+    - 输出被截断：补全字符串，去掉没写完的键，按嵌套顺序补齐括号
+
+    从第一个 {（没有时为 [）开始，到最外层闭合为止；之后的内容丢弃。
+    截断的补全会让内容看起来完整，是否接受由调用方决定，见 extract_json 的 "truncated" 状态。
+    """
+    return _repair(text)[0]
+
+
+def _repair(text: str) -> Tuple[str, bool]:
+    """repair_json 的实现，额外返回输出是否被截断（需要补全字符串或括号）"""
+    start = text.find("{")
+    if start == -1:
+        start = text.find("[")
+    if start == -1:
+        return text, False
+    text = text[start:]
+
+    out: list = []
+    stack: list = []       # 每层 [开括号, 下一个字符串是否为键]
+    in_str = False
+    key_start = None       # 正在写的键在 out 中的起始位置（冒号出现前）
+    i, n = 0, len(text)
+    while i < n:
+        ch = text[i]
+        if in_str:
+            if ch == "\\":
+                nxt = text[i + 1] if i + 1 < n else ""
+                if nxt in _VALID_ESCAPES and not (nxt == "u" and not _is_hex4(text[i + 2:i + 6])):
+                    out.append(ch + nxt)
+                    i += 2
+                    continue
+                out.append("\\\\")
+            elif ch == '"':
+                if _next_significant(text, i + 1) in (",", "}", "]", ":", ""):
+                    in_str = False
+                    out.append('"')
+                else:
+                    out.append('\\"')
+            elif ch == "\n":
+                out.append("\\n")
+            elif ch == "\r":
+                out.append("\\r")
+            elif ch == "\t":
+                out.append("\\t")
+            elif ord(ch) < 0x20:
+                out.append(f"\\u{ord(ch):04x}")
+            else:
+                out.append(ch)
+        elif ch == '"':
+            if stack and stack[-1][0] == "{" and stack[-1][1]:
+                key_start = len(out)
+            in_str = True
+            out.append(ch)
+        elif ch in _CLOSERS:
+            stack.append([ch, ch == "{"])
+            key_start = None
+            out.append(ch)
+        elif ch in "}]":
+            if not stack:
+                break
+            _strip_trailing_comma(out)
+            out.append(_CLOSERS[stack.pop()[0]])
+            key_start = None
+            if not stack:
+                break
+        elif ch == ":":
+            if stack and stack[-1][0] == "{":
+                stack[-1][1] = False
+            key_start = None
+            out.append(ch)
+        elif ch == ",":
+            if stack and stack[-1][0] == "{":
+                stack[-1][1] = True
+            out.append(ch)
+        else:
+            out.append(ch)
+        i += 1
+
+    truncated = bool(stack)
+    if stack:
+        # 输出被截断
+        if in_str:
+            if key_start is not None:
+                del out[key_start:]
+            else:
+                out.append('"')
+        elif key_start is not None:
+            del out[key_start:]
+        while out and out[-1] in (" ", "\t", "\r", "\n"):
+            out.pop()
+        if out and out[-1] == ":":
+            out.append("null")
+        _strip_trailing_comma(out)
+        while stack:
+            out.append(_CLOSERS[stack.pop()[0]])
+    return "".join(out), truncated
+
+
+def _is_hex4(s: str) -> bool:
+    return len(s) == 4 and all(c in "0123456789abcdefABCDEF" for c in s)
+
+
+def extract_json(text: str) -> Tuple[Optional[Any], str]:
+    """
+    从模型输出中提取 JSON
+
+    返回:
+        tuple: (解析结果, 状态)，状态为 "ok"（原样可解析）| "repaired"（修复后可解析）|
+               "truncated"（输出被截断，补全后可解析，但内容不完整）| "failed"
+    """
+    clean = (text or "").strip().replace("```json", "").replace("```", "")
+    start = clean.find("{")
+    end = clean.rfind("}") + 1
+    if start != -1 and end > start:
+        try:
+            return json.loads(clean[start:end]), "ok"
+        except ValueError:
+            pass
+    repaired, truncated = _repair(clean)
+    try:
+        return json.loads(repaired), "truncated" if truncated else "repaired"
+    except ValueError:
+        return None, "failed"
+
+
+def parse_json_output(text: str, label: str = "json") -> Optional[Any]:
+    """
+    extract_json 并按 label 记录解析/修复/截断/失败次数
+
+    截断的输出返回 None：补全括号得到的结果会被当成完整内容发布，调用方应重新生成
+    """
+    result, status = extract_json(text)
+    with _stats_lock:
+        entry = _stats.setdefault(label, {"parsed": 0, "ok": 0, "repaired": 0, "truncated": 0, "failed": 0})
+        entry["parsed"] += 1
+        entry[status] += 1
+    if status == "repaired":
+        print(f"🩹 [{label}] JSON repaired locally.")
+    elif status == "truncated":
+        print(f"✂️ [{label}] JSON output was truncated, rejected.")
+        return None
+    elif status == "failed":
+        print(f"❌ [{label}] JSON parse failed.")
+    return result
+
+
+def get_json_stats() -> Dict[str, Dict[str, Any]]:
+    """各 label 的解析次数，以及修复率、截断率、失败率"""
+    with _stats_lock:
+        return {
+            label: {
+                **entry,
+                "repair_rate": entry["repaired"] / entry["parsed"] if entry["parsed"] else 0.0,
+                "truncation_rate": entry["truncated"] / entry["parsed"] if entry["parsed"] else 0.0,
+                "failure_rate": entry["failed"] / entry["parsed"] if entry["parsed"] else 0.0,
+            }
+            for label, entry in _stats.items()
+        }
@@ -0,0 +1,148 @@
+import re
+import math
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Optional, Dict, List, Tuple
+
+# CJK 统一表意文字 + 扩展 A + 兼容区，外加日文假名
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+_WORD_RE = re.compile(r"[a-z0-9][a-z0-9_.+#-]*[a-z0-9+#]|[a-z0-9]")
+_SPLIT_RE = re.compile(r"[._-]+")
+
+
+def _fold(text: str) -> str:
+    """小写 + 去掉拉丁字母的重音（qué -> que），CJK 字符不受影响"""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    多语言分词：
+    - 拉丁文本（英文/西语/代码标识符）按词切分，保留 . _ - + # 以匹配 API 名（如 torch.nn、c++）
+    - 中文/日文没有空格，按单字 + 相邻双字 (bigram) 切分，兼顾召回和专名精度
+    """
+    if not text:
+        return []
+    folded = _fold(text)
+    tokens = []
+    last = 0
+    for m in _CJK_RE.finditer(folded):
+        tokens.extend(_latin_tokens(folded[last:m.start()]))
+        run = m.group()
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        last = m.end()
+    tokens.extend(_latin_tokens(folded[last:]))
+    return tokens
+
+
+def _latin_tokens(text: str) -> List[str]:
+    """拉丁词切分；带 . _ - 的复合标识符同时保留整体和各组成部分"""
+    tokens = []
+    for word in _WORD_RE.findall(text):
+        tokens.append(word)
+        parts = _SPLIT_RE.split(word)
+        if len(parts) > 1:
+            tokens.extend(p for p in parts if p)
+    return tokens
+
+
+class BM25Index:
+    """
+    进程内倒排索引 (Okapi BM25)
+
+    与向量库使用相同的记录 id（页面 id 或段落 id），由 vector_ops 在写入/删除时同步。
+    只依赖标准库，检索不经过编码器，毫秒级返回。
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)  # term -> {doc_id: tf}
+        self._doc_len: Dict[str, int] = {}
+        self._doc_terms: Dict[str, List[str]] = {}
+        self._doc_meta: Dict[str, Dict[str, str]] = {}
+        self._total_len = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._doc_len)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._doc_len
+
+    def add(self, doc_id: str, text: str, metadata: Optional[Dict[str, str]] = None):
+        """写入/覆盖一条记录"""
+        counts = Counter(tokenize(text))
+        with self._lock:
+            self.remove(doc_id)
+            for term, tf in counts.items():
+                self._postings[term][doc_id] = tf
+            length = sum(counts.values())
+            self._doc_len[doc_id] = length
+            self._doc_terms[doc_id] = list(counts)
+            self._doc_meta[doc_id] = {
+                "category": (metadata or {}).get("category"),
+                "parent_id": (metadata or {}).get("parent_id"),
+            }
+            self._total_len += length
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            if doc_id not in self._doc_len:
+                return
+            for term in self._doc_terms.pop(doc_id):
+                postings = self._postings.get(term)
+                if postings is not None:
+                    postings.pop(doc_id, None)
+                    if not postings:
+                        del self._postings[term]
+            self._total_len -= self._doc_len.pop(doc_id)
+            self._doc_meta.pop(doc_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._doc_len.clear()
+            self._doc_terms.clear()
+            self._doc_meta.clear()
+            self._total_len = 0
+
+    def search(self, query: str, k: int = 10, category: Optional[str] = None) -> List[Tuple[str, float, float]]:
+        """
+        BM25 检索
+
+        返回:
+            list: [(doc_id, bm25_score, coverage), ...] 按得分降序；
+                  coverage 为该记录命中的查询词占全部（去重）查询词的比例
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            n_docs = len(self._doc_len)
+            if n_docs == 0:
+                return []
+            avg_len = self._total_len / n_docs
+            scores: Dict[str, float] = defaultdict(float)
+            matched: Dict[str, int] = defaultdict(int)
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    if category and self._doc_meta[doc_id].get("category") != category:
+                        continue
+                    norm = tf + self.k1 * (1 - self.b + self.b * self._doc_len[doc_id] / avg_len)
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / norm
+                    matched[doc_id] += 1
+
+            ranked = sorted(scores.items(), key=lambda kv: -kv[1])[:k]
+            return [(doc_id, score, matched[doc_id] / len(terms)) for doc_id, score in ranked]
+
+    def parent_of(self, doc_id: str) -> str:
+        meta = self._doc_meta.get(doc_id) or {}
+        return meta.get("parent_id") or doc_id
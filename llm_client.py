@@ -1,60 +1,615 @@
 import os
+import time
+import asyncio
+import weakref
+import threading
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI, DefaultAsyncHttpxClient, BadRequestError
+import httpx
+
+from rate_limiter import TokenBucket
+from response_cache import ResponseCache
+from prompt_budget import count_tokens
+from llm_replay import ReplayClient, RecordingClient
+from llm_telemetry import CallTrace, capture_caller
+from json_output import extract_json
+from resilience import (
+    RetryPolicy, CircuitBreaker, RetryStats, CircuitOpenError,
+    UNHEALTHY, classify_error, call_with_retry, call_with_retry_async,
+)
 
 load_dotenv()
 
-client = OpenAI(
-    api_key=os.getenv("OPENAI_API_KEY"),
-    base_url=os.getenv("OPENAI_BASE_URL")
-)
+# --- 并发与限流 ---
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))       # 同时在途的请求数
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))   # 每分钟 token 上限（输入+输出），0 表示不限
+LLM_MAX_CONNECTIONS = 20   # 异步客户端连接池大小
+
+# --- 重试与熔断 ---
+# SDK 自带的重试关闭，统一由这里的重试层处理（分类、退避、截止时间、指标）
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = 1.0       # 退避基数（秒），第 n 次重试等待 [0, base * 2^n) 的随机时间
+LLM_BACKOFF_MAX = 30.0
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "300"))  # 单次调用（含重试）的默认截止时间，0 表示不限
+LLM_BREAKER_THRESHOLD = 5    # 连续多少次超时/连接错误/5xx 后熔断
+LLM_BREAKER_RECOVERY_SECONDS = 30.0
+
+# --- JSON 输出模式 ---
+# json_mode=True 时对这些模型发送 response_format={"type": "json_object"}；
+# 服务端拒绝（400）时自动去掉该参数重发，并在本进程内记住该模型不支持
+LLM_JSON_MODE_MODELS = {m.strip() for m in os.getenv("LLM_JSON_MODE_MODELS", "deepseek-chat,deepseek-reasoner").split(",") if m.strip()}
+
+# --- 响应缓存 ---
+# 键为 (模型, prompt, 采样参数) 的哈希；重试、重新提交同一份 PDF 时直接返回上次的结果
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "true").lower() == "true"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "./llm_cache.sqlite")
+LLM_CACHE_TTL_HOURS = float(os.getenv("LLM_CACHE_TTL_HOURS", "168"))
+LLM_CACHE_MAX_ENTRIES = 2000
+LLM_CACHE_MAX_MB = 200
+
+# --- 录制 / 回放（见 llm_replay.py）---
+LLM_MODE = os.getenv("LLM_MODE", "live")                   # live | record | replay
+LLM_FIXTURES_DIR = os.getenv("LLM_FIXTURES_DIR", "./llm_fixtures")
+LLM_REPLAY_LATENCY = os.getenv("LLM_REPLAY_LATENCY", "recorded")  # recorded | 固定秒数
+
+
+def _new_openai() -> OpenAI:
+    return OpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        base_url=os.getenv("OPENAI_BASE_URL"),
+        max_retries=0,
+    )
+
+
+def _new_async_openai() -> AsyncOpenAI:
+    return AsyncOpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        base_url=os.getenv("OPENAI_BASE_URL"),
+        max_retries=0,
+        http_client=DefaultAsyncHttpxClient(
+            limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS),
+        ),
+    )
+
+
+# 底层客户端：live 直连；record 转发并录制；replay 离线回放，不需要 API Key
+_async_client_factory: Callable[[], Any] = _new_async_openai
+if LLM_MODE == "replay":
+    client = ReplayClient(LLM_FIXTURES_DIR, latency=LLM_REPLAY_LATENCY)
+    _async_client_factory = client.as_async
+elif LLM_MODE == "record":
+    client = RecordingClient(_new_openai(), LLM_FIXTURES_DIR)
+    _async_client_factory = lambda: client.as_async(_new_async_openai())
+else:
+    client = _new_openai()
+
+# 同步与异步调用共用一个 token 桶；在途请求数分别用线程信号量 / 每个事件循环一个 asyncio 信号量限制
+_token_bucket = TokenBucket(LLM_TOKENS_PER_MINUTE) if LLM_TOKENS_PER_MINUTE > 0 else None
+_sync_slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = weakref.WeakKeyDictionary()
+_async_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+_retry_policy = RetryPolicy(LLM_MAX_RETRIES, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX)
+_retry_stats = RetryStats()
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+_json_mode_unsupported: set = set()
+
+_response_cache: Optional[ResponseCache] = None
+_response_cache_lock = threading.Lock()
+
+def estimate_tokens(text: str) -> int:
+    """估算 token 数（用于限流预扣，实际用量以 response.usage 为准），与 prompt 预算使用同一套本地计数"""
+    return count_tokens(text) + 1
+
+
+def _with_json_mode(kwargs: dict, json_mode: bool) -> dict:
+    if json_mode and kwargs["model"] in LLM_JSON_MODE_MODELS and kwargs["model"] not in _json_mode_unsupported:
+        kwargs["response_format"] = {"type": "json_object"}
+    return kwargs
+
+
+def _completion_kwargs(prompt: str, model: str = "deepseek-chat", json_mode: bool = False) -> dict:
+    return _with_json_mode({
+        "model": model,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0.1,
+        "stream": False,
+        # V3 不需要思考，8192 足够写出非常长的 JSON
+        "max_tokens": 8192,
+    }, json_mode)
+
+
+def _reasoning_kwargs(prompt: str, json_mode: bool = False) -> dict:
+    # 注意：DeepSeek 的 reasoning 过程是计入输出 token 的
+    # 我们必须把它拉到最大，防止思考太久导致 JSON 没写完
+    return _with_json_mode({
+        "model": "deepseek-reasoner",
+        "messages": [{"role": "user", "content": prompt}],
+        "max_tokens": 8192,  # 🔥 关键修改：拉满到 8k
+    }, json_mode)
+
+
+def _without_json_mode(kwargs: dict, exc: BaseException) -> Optional[dict]:
+    """JSON 模式的请求被拒（400）时，返回去掉 response_format 的参数用于重发；否则返回 None"""
+    if "response_format" in kwargs and isinstance(exc, BadRequestError):
+        print(f"⚠️ {kwargs['model']} rejected JSON mode, retrying without it: {exc}")
+        return {k: v for k, v in kwargs.items() if k != "response_format"}
+    return None
+
+
+def _send(kwargs: dict, timeout: Optional[float]):
+    try:
+        return client.chat.completions.create(**kwargs, timeout=timeout)
+    except BadRequestError as e:
+        plain = _without_json_mode(kwargs, e)
+        if plain is None:
+            raise
+        response = client.chat.completions.create(**plain, timeout=timeout)
+        _json_mode_unsupported.add(kwargs["model"])
+        return response
+
+
+async def _send_async(kwargs: dict, timeout: Optional[float]):
+    try:
+        return await get_async_client().chat.completions.create(**kwargs, timeout=timeout)
+    except BadRequestError as e:
+        plain = _without_json_mode(kwargs, e)
+        if plain is None:
+            raise
+        response = await get_async_client().chat.completions.create(**plain, timeout=timeout)
+        _json_mode_unsupported.add(kwargs["model"])
+        return response
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """懒加载响应缓存；LLM_CACHE=false、录制/回放模式或打开失败时返回 None"""
+    global _response_cache, LLM_CACHE_ENABLED
+    if not LLM_CACHE_ENABLED or LLM_MODE != "live":
+        return None
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                try:
+                    _response_cache = ResponseCache(
+                        LLM_CACHE_PATH,
+                        ttl_seconds=LLM_CACHE_TTL_HOURS * 3600,
+                        max_entries=LLM_CACHE_MAX_ENTRIES,
+                        max_bytes=LLM_CACHE_MAX_MB * 1024 * 1024,
+                    )
+                except Exception as e:
+                    print(f"⚠️ LLM cache disabled: {e}")
+                    LLM_CACHE_ENABLED = False
+                    return None
+    return _response_cache
+
+
+def get_llm_cache_stats() -> dict:
+    """响应缓存命中统计（总体与按模型）；未启用时返回空字典"""
+    cache = get_response_cache()
+    return cache.stats() if cache else {}
+
+
+def _cache_get(kwargs: dict, use_cache: bool) -> Optional[dict]:
+    cache = get_response_cache() if use_cache else None
+    return cache.get(kwargs) if cache else None
+
+
+def _cache_status(use_cache: bool, cached: Optional[dict]) -> str:
+    """遥测中的缓存状态：hit | miss | bypass（本次调用跳过）| off（未启用）"""
+    if cached:
+        return "hit"
+    if not use_cache:
+        return "bypass"
+    return "miss" if get_response_cache() is not None else "off"
+
+
+def _cache_put(kwargs: dict, value: dict, use_cache: bool, json_mode: bool = False):
+    # 空回答不缓存；json_mode 下只缓存原样可解析的 JSON 对象（修复过、被截断或解析失败的不缓存），
+    # 避免把一次失败固化到 TTL 结束
+    cache = get_response_cache() if use_cache else None
+    if not cache or not value.get("content"):
+        return
+    if json_mode:
+        parsed, status = extract_json(value["content"])
+        if status != "ok" or not isinstance(parsed, dict):
+            print(f"⚠️ JSON output {status}, not cached.")
+            return
+    cache.put(kwargs, value)
+
+
+def _settle_tokens(estimated: int, response):
+    """用实际用量修正令牌桶"""
+    if _token_bucket is None:
+        return
+    usage = getattr(response, "usage", None)
+    actual = getattr(usage, "total_tokens", None) if usage else None
+    if actual is not None:
+        _token_bucket.adjust(actual - estimated)
+
+
+def _breaker(model: str) -> CircuitBreaker:
+    """每个模型一个熔断器"""
+    with _breakers_lock:
+        if model not in _breakers:
+            _breakers[model] = CircuitBreaker(LLM_BREAKER_THRESHOLD, LLM_BREAKER_RECOVERY_SECONDS)
+        return _breakers[model]
+
+
+def _deadline_at(deadline: Optional[float]) -> Optional[float]:
+    """截止秒数 -> time.monotonic() 时刻；未指定时使用 LLM_DEADLINE_SECONDS"""
+    seconds = LLM_DEADLINE_SECONDS if deadline is None else deadline
+    return time.monotonic() + seconds if seconds > 0 else None
+
+
+def _remaining(deadline_at: Optional[float]) -> Optional[float]:
+    return None if deadline_at is None else deadline_at - time.monotonic()
+
+
+def _primary_unhealthy(exc: BaseException) -> bool:
+    """主模型确实不可用（熔断中，或重试耗尽的超时/连接错误/5xx），此时才值得降级"""
+    return isinstance(exc, CircuitOpenError) or classify_error(exc) in UNHEALTHY
+
+
+def get_llm_retry_stats() -> dict:
+    """重试、退避耗时、截止超时、熔断拒绝和降级次数，以及各模型熔断器状态"""
+    with _breakers_lock:
+        breakers = {model: b.state for model, b in _breakers.items()}
+    return {**_retry_stats.snapshot(), "breakers": breakers}
+
+
+def _create(kwargs: dict, deadline_at: Optional[float] = None, trace: Optional[CallTrace] = None):
+    """同步调用（受并发数和 token 桶限制，按 _retry_policy 重试；退避期间不占并发槽位）"""
+    estimated = estimate_tokens(kwargs["messages"][-1]["content"])
+    if _token_bucket is not None:
+        _token_bucket.acquire(estimated)
+
+    def attempt(timeout):
+        with _sync_slots:
+            return _send(kwargs, timeout)
+
+    response = call_with_retry(
+        attempt, policy=_retry_policy, breaker=_breaker(kwargs["model"]), deadline=deadline_at, stats=_retry_stats,
+        on_retry=trace.add_retry if trace else None,
+    )
+    _settle_tokens(estimated, response)
+    if trace:
+        trace.usage = response.usage
+    return response
+
+
+def get_async_client() -> AsyncOpenAI:
+    """当前事件循环的异步客户端（共享连接池；httpx 连接不能跨事件循环复用）"""
+    loop = asyncio.get_running_loop()
+    async_client = _async_clients.get(loop)
+    if async_client is None:
+        async_client = _async_client_factory()
+        _async_clients[loop] = async_client
+    return async_client
+
+
+def set_client(new_client, async_client_factory: Optional[Callable[[], Any]] = None):
+    """
+    替换底层客户端（如 llm_replay.ReplayClient 或测试桩）
 
-def get_completion(prompt, model="deepseek-chat"):
+    参数:
+        new_client: 提供 chat.completions.create(**kwargs) 的同步客户端
+        async_client_factory: 为每个事件循环创建异步客户端；不提供时使用 new_client.as_async()（如有）或真实接口
+    """
+    global client, _async_client_factory
+    client = new_client
+    if async_client_factory is None:
+        if isinstance(new_client, RecordingClient):
+            async_client_factory = lambda: new_client.as_async(_new_async_openai())
+        else:
+            async_client_factory = getattr(new_client, "as_async", None) or _new_async_openai
+    _async_client_factory = async_client_factory
+    _async_clients.clear()
+
+
+def _get_async_slots() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    slots = _async_slots.get(loop)
+    if slots is None:
+        slots = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+        _async_slots[loop] = slots
+    return slots
+
+
+async def _create_async(kwargs: dict, deadline_at: Optional[float] = None, trace: Optional[CallTrace] = None):
+    """异步调用（受并发数和 token 桶限制，按 _retry_policy 重试）"""
+    estimated = estimate_tokens(kwargs["messages"][-1]["content"])
+    if _token_bucket is not None:
+        await _token_bucket.acquire_async(estimated)
+
+    async def attempt(timeout):
+        async with _get_async_slots():
+            return await _send_async(kwargs, timeout)
+
+    response = await call_with_retry_async(
+        attempt, policy=_retry_policy, breaker=_breaker(kwargs["model"]), deadline=deadline_at, stats=_retry_stats,
+        on_retry=trace.add_retry if trace else None,
+    )
+    _settle_tokens(estimated, response)
+    if trace:
+        trace.usage = response.usage
+    return response
+
+
+def _unpack_reasoning(response) -> Tuple[str, str]:
+    # 获取最终回答
+    content = response.choices[0].message.content
+
+    # 获取思考过程
+    reasoning = getattr(response.choices[0].message, 'reasoning_content', None)
+
+    if not reasoning:
+        reasoning = "（模型未返回显式思考过程）"
+
+    return content, reasoning
+
+
+def get_completion(
+    prompt, model="deepseek-chat", use_cache: bool = True, deadline: Optional[float] = None, json_mode: bool = False
+):
     """
     通用快速模式 (DeepSeek-V3)
     用于：分类、简单提取、JSON格式化
+
+    use_cache=False 时跳过响应缓存（既不读也不写）；
+    deadline 为整次调用（含重试）的截止秒数，默认 LLM_DEADLINE_SECONDS；
+    json_mode=True 时要求模型输出 JSON 对象（prompt 中需出现 "json" 字样）
     """
+    trace = CallTrace(model)
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.1, 
-            stream=False,
-            # V3 不需要思考，8192 足够写出非常长的 JSON
-            max_tokens=8192 
-        )
-        return response.choices[0].message.content
+        kwargs = _completion_kwargs(prompt, model, json_mode)
+        cached = _cache_get(kwargs, use_cache)
+        trace.cache = _cache_status(use_cache, cached)
+        if cached:
+            trace.finish()
+            return cached["content"]
+        content = _create(kwargs, _deadline_at(deadline), trace).choices[0].message.content
+        _cache_put(kwargs, {"content": content}, use_cache, json_mode)
+        trace.finish()
+        return content
     except Exception as e:
+        trace.finish("error", e)
         print(f"❌ V3 调用失败: {e}")
         return ""
 
-def get_reasoning_completion(prompt):
+def stream_reasoning_completion(
+    prompt, deadline: Optional[float] = None, json_mode: bool = False
+) -> Iterator[Tuple[str, str]]:
+    """
+    流式深度思考模式：边生成边产出增量
+
+    建立连接阶段的失败按 _retry_policy 重试；开始输出后的中断不重试（已产出的增量无法撤回）
+
+    返回:
+        generator: 依次 yield ("reasoning" | "content", 增量文本)
+    """
+    kwargs = _reasoning_kwargs(prompt, json_mode)
+    trace = CallTrace(kwargs["model"], stream=True)
+    trace.cache = "bypass"
+    status, error = "ok", None
+    try:
+        yield from _stream_reasoning(kwargs, _deadline_at(deadline), trace)
+    except GeneratorExit:
+        # 调用方提前停止读取
+        status = "cancelled"
+        raise
+    except Exception as e:
+        status, error = "error", e
+        raise
+    finally:
+        trace.finish(status, error)
+
+
+def _stream_reasoning(kwargs: dict, deadline_at: Optional[float], trace: CallTrace) -> Iterator[Tuple[str, str]]:
+    """
+    流式调用：建立连接的每次尝试占一个并发槽位，失败即释放（退避期间不占槽位，与 _create 一致）；
+    连接成功后槽位一直持有到流读完或调用方停止读取
+    """
+    kwargs = {**kwargs, "stream": True, "stream_options": {"include_usage": True}}
+    estimated = estimate_tokens(kwargs["messages"][-1]["content"])
+    if _token_bucket is not None:
+        _token_bucket.acquire(estimated)
+
+    def attempt(timeout):
+        _sync_slots.acquire()
+        try:
+            return _send(kwargs, timeout)
+        except BaseException:
+            _sync_slots.release()
+            raise
+
+    stream = call_with_retry(
+        attempt, policy=_retry_policy, breaker=_breaker(kwargs["model"]), deadline=deadline_at, stats=_retry_stats,
+        on_retry=trace.add_retry,
+    )
+    usage = None
+    try:
+        for chunk in stream:
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            reasoning = getattr(delta, "reasoning_content", None)
+            if reasoning:
+                trace.first_token()
+                yield "reasoning", reasoning
+            if delta.content:
+                trace.first_token()
+                yield "content", delta.content
+    finally:
+        _sync_slots.release()
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()  # 提前停止时释放 HTTP 连接
+    _settle_tokens(estimated, SimpleNamespace(usage=usage))
+    trace.usage = usage
+
+
+def get_reasoning_completion(
+    prompt,
+    on_delta: Optional[Callable[[str, str], None]] = None,
+    use_cache: bool = True,
+    deadline: Optional[float] = None,
+    json_mode: bool = False,
+):
     """
     深度思考模式 (DeepSeek-R1)
+
+    参数:
+        prompt: 提示词
+        on_delta: 可选回调 on_delta(kind, text)；提供时改为流式请求，
+                  思考过程（kind="reasoning"）和回答（kind="content"）的增量一到达就回调
+        use_cache: 是否使用响应缓存；命中时不请求模型，on_delta 一次性收到完整的思考过程和回答
+        deadline: 整次调用（含重试和降级）的截止秒数，默认 LLM_DEADLINE_SECONDS
+        json_mode: 要求模型输出 JSON 对象（降级到 V3 时同样生效）
+
+    返回:
+        tuple: (content, reasoning)；失败时 content 为空字符串。
+        只有 R1 确实不可用（熔断中，或超时/连接错误/5xx 重试耗尽）时才降级为 V3，
+        4xx 等请求本身的问题换模型也无济于事，直接返回。
     """
+    deadline_at = _deadline_at(deadline)
+    trace = CallTrace("deepseek-reasoner", stream=on_delta is not None)
     try:
+        kwargs = _reasoning_kwargs(prompt, json_mode)
+        cached = _cache_get(kwargs, use_cache)
+        trace.cache = _cache_status(use_cache, cached)
+        if cached:
+            print("⚡ R1 响应缓存命中")
+            if on_delta is not None:
+                on_delta("reasoning", cached["reasoning"])
+                on_delta("content", cached["content"])
+            trace.finish()
+            return cached["content"], cached["reasoning"]
+
         print("🤔 R1 正在深度思考 (Deep Thinking)...")
-        # 注意：DeepSeek 的 reasoning 过程是计入输出 token 的
-        # 我们必须把它拉到最大，防止思考太久导致 JSON 没写完
-        response = client.chat.completions.create(
-            model="deepseek-reasoner", 
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=8192  # 🔥 关键修改：拉满到 8k
-        )
-        
-        # 获取最终回答
-        content = response.choices[0].message.content
-        
-        # 获取思考过程
-        reasoning = getattr(response.choices[0].message, 'reasoning_content', None)
-        
-        if not reasoning:
-            reasoning = "（模型未返回显式思考过程）"
-            
+        if on_delta is None:
+            content, reasoning = _unpack_reasoning(_create(kwargs, deadline_at, trace))
+        else:
+            parts = {"reasoning": [], "content": []}
+            for kind, text in _stream_reasoning(kwargs, deadline_at, trace):
+                parts[kind].append(text)
+                on_delta(kind, text)
+            content = "".join(parts["content"])
+            reasoning = "".join(parts["reasoning"]) or "（模型未返回显式思考过程）"
+        _cache_put(kwargs, {"content": content, "reasoning": reasoning}, use_cache, json_mode)
+        trace.finish()
         return content, reasoning
-        
+
     except Exception as e:
+        trace.finish("error", e)
         print(f"❌ R1 调用失败: {e}")
-        # 如果 R1 还是不行，自动降级用 V3 (V3 不思考直接写，反而不容易截断)
+        remaining = _remaining(deadline_at)
+        if not _primary_unhealthy(e) or (remaining is not None and remaining <= 0):
+            return "", f"（R1 调用失败: {e}）"
+        # R1 不可用时降级用 V3 (V3 不思考直接写，反而不容易截断)
         print("🔄 尝试降级使用 DeepSeek-V3...")
-        return get_completion(prompt), "（降级为 V3，无思考过程）"
+        _retry_stats.add(fallbacks=1)
+        content = get_completion(prompt, use_cache=use_cache, deadline=remaining or 0, json_mode=json_mode)
+        return content, "（降级为 V3，无思考过程）"
+
+
+async def async_get_completion(
+    prompt, model="deepseek-chat", use_cache: bool = True, deadline: Optional[float] = None, json_mode: bool = False,
+    caller: Optional[str] = None,
+):
+    """
+    get_completion 的异步版本（失败返回空字符串）
+
+    caller: 遥测中记录的调用方；在 asyncio 任务中运行时调用栈里已没有发起方，需由创建协程处传入
+    """
+    trace = CallTrace(model, caller=caller)
+    try:
+        kwargs = _completion_kwargs(prompt, model, json_mode)
+        cached = _cache_get(kwargs, use_cache)
+        trace.cache = _cache_status(use_cache, cached)
+        if cached:
+            trace.finish()
+            return cached["content"]
+        content = (await _create_async(kwargs, _deadline_at(deadline), trace)).choices[0].message.content
+        _cache_put(kwargs, {"content": content}, use_cache, json_mode)
+        trace.finish()
+        return content
+    except Exception as e:
+        trace.finish("error", e)
+        print(f"❌ V3 调用失败: {e}")
+        return ""
+
+
+async def async_get_reasoning_completion(
+    prompt, use_cache: bool = True, deadline: Optional[float] = None, json_mode: bool = False,
+    caller: Optional[str] = None,
+):
+    """get_reasoning_completion 的异步版本（R1 不可用时降级为 V3；caller 同 async_get_completion）"""
+    deadline_at = _deadline_at(deadline)
+    trace = CallTrace("deepseek-reasoner", caller=caller)
+    try:
+        kwargs = _reasoning_kwargs(prompt, json_mode)
+        cached = _cache_get(kwargs, use_cache)
+        trace.cache = _cache_status(use_cache, cached)
+        if cached:
+            trace.finish()
+            return cached["content"], cached["reasoning"]
+        content, reasoning = _unpack_reasoning(await _create_async(kwargs, deadline_at, trace))
+        _cache_put(kwargs, {"content": content, "reasoning": reasoning}, use_cache, json_mode)
+        trace.finish()
+        return content, reasoning
+    except Exception as e:
+        trace.finish("error", e)
+        print(f"❌ R1 调用失败: {e}")
+        remaining = _remaining(deadline_at)
+        if not _primary_unhealthy(e) or (remaining is not None and remaining <= 0):
+            return "", f"（R1 调用失败: {e}）"
+        print("🔄 尝试降级使用 DeepSeek-V3...")
+        _retry_stats.add(fallbacks=1)
+        content = await async_get_completion(
+            prompt, use_cache=use_cache, deadline=remaining or 0, json_mode=json_mode, caller=trace.caller
+        )
+        return content, "（降级为 V3，无思考过程）"
+
+
+async def gather_completions(
+    prompts: List[str], *, reasoning: bool = False, model: str = "deepseek-chat", use_cache: bool = True,
+    caller: Optional[str] = None,
+) -> list:
+    """
+    并发执行多条 prompt，结果顺序与输入一致
+
+    在途请求数受 LLM_MAX_CONCURRENCY 限制，token 用量受 LLM_TOKENS_PER_MINUTE 限制，
+    可以一次性提交大量 prompt 而不触发服务端限流。
+    各条 prompt 在独立的 asyncio 任务中运行，调用方在这里（任务创建前）确定，遥测记录归到发起批量调用的函数。
+
+    返回:
+        list: reasoning=False 时为字符串列表；True 时为 (content, reasoning) 元组列表
+    """
+    caller = caller or capture_caller()
+    if reasoning:
+        tasks = [async_get_reasoning_completion(p, use_cache=use_cache, caller=caller) for p in prompts]
+    else:
+        tasks = [async_get_completion(p, model, use_cache=use_cache, caller=caller) for p in prompts]
+    return await asyncio.gather(*tasks)
+
+
+def run_completions(prompts: List[str], *, reasoning: bool = False, model: str = "deepseek-chat", use_cache: bool = True) -> list:
+    """gather_completions 的同步入口（在没有事件循环的线程中使用，如 Streamlit 回调、CLI 脚本）"""
+    caller = capture_caller()
+
+    async def _run():
+        try:
+            return await gather_completions(prompts, reasoning=reasoning, model=model, use_cache=use_cache, caller=caller)
+        finally:
+            # asyncio.run 结束后事件循环即关闭，连接池随之释放
+            async_client = _async_clients.pop(asyncio.get_running_loop(), None)
+            if async_client is not None:
+                await async_client.close()
+
+    return asyncio.run(_run())
@@ -0,0 +1,249 @@
+"""
+LLM 录制 / 回放：替换 llm_client 的底层客户端，让工作流可以离线、可重复地运行
+
+    LLM_MODE=record python ...   # 正常调用接口，同时把每次请求和回答写入 LLM_FIXTURES_DIR
+    LLM_MODE=replay python ...   # 不联网：按请求参数查找录制结果；没有录制时返回固定的 JSON 草稿
+
+回放延迟由 LLM_REPLAY_LATENCY 控制："recorded" 按录制时的耗时（含首 token 时间）回放，
+数字表示固定秒数，0 表示立即返回。录制/回放模式下响应缓存不生效，保证每次运行走同样的路径。
+"""
+import os
+import json
+import time
+import asyncio
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional
+
+from response_cache import ResponseCache
+
+STREAM_CHUNK_CHARS = 24   # 回放流式输出时每个增量的字符数
+CANNED_REASONING = "（回放模式：固定输出）"
+
+
+def _request_of(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """决定回答内容的请求参数（去掉超时和流式选项）"""
+    return {k: v for k, v in kwargs.items() if k not in ("timeout", "stream", "stream_options")}
+
+
+def fixture_key(kwargs: Dict[str, Any]) -> str:
+    return ResponseCache.make_key(_request_of(kwargs))
+
+
+def _usage_dict(usage) -> Optional[Dict[str, Any]]:
+    if usage is None:
+        return None
+    if hasattr(usage, "model_dump"):
+        return usage.model_dump()
+    return dict(vars(usage))
+
+
+def _to_namespace(value):
+    if isinstance(value, dict):
+        return SimpleNamespace(**{k: _to_namespace(v) for k, v in value.items()})
+    return value
+
+
+def _message_response(content: str, reasoning: Optional[str], usage: Optional[Dict[str, Any]], model: str):
+    message = SimpleNamespace(role="assistant", content=content, reasoning_content=reasoning)
+    return SimpleNamespace(
+        model=model,
+        choices=[SimpleNamespace(index=0, message=message, finish_reason="stop")],
+        usage=_to_namespace(usage) if usage else None,
+    )
+
+
+def _chunk(reasoning: Optional[str] = None, content: Optional[str] = None, usage=None):
+    choices = [] if usage is not None else [
+        SimpleNamespace(index=0, delta=SimpleNamespace(content=content, reasoning_content=reasoning))
+    ]
+    return SimpleNamespace(choices=choices, usage=_to_namespace(usage) if usage is not None else None)
+
+
+class FixtureStore:
+    """录制文件目录：每个请求一个 JSON 文件，文件名为请求参数的哈希"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, f"{key}.json")
+
+    def load(self, kwargs: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        file = self._file(fixture_key(kwargs))
+        if not os.path.exists(file):
+            return None
+        with open(file, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save(self, kwargs: Dict[str, Any], response: Dict[str, Any], latency: Dict[str, Optional[float]]):
+        os.makedirs(self.path, exist_ok=True)
+        file = self._file(fixture_key(kwargs))
+        record = {"request": _request_of(kwargs), "response": response, "latency": latency}
+        tmp = f"{file}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, file)
+
+
+def canned_response(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """没有录制时的固定回答：意图分析返回 save_note，其余返回一份以输入开头为正文的草稿"""
+    prompt = kwargs["messages"][-1]["content"]
+    if '"intent"' in prompt:
+        content = {"intent": "save_note", "category": "Humanities"}
+    else:
+        marker = next((m for m in ("NEW INPUT:", "--- NEW ---", "Input:") if m in prompt), None)
+        excerpt = prompt.split(marker, 1)[1] if marker else prompt
+        excerpt = " ".join(excerpt.split())[:500]
+        content = {
+            "title": "Replay Draft",
+            "summary": excerpt[:120],
+            "markdown_body": f"# Replay Draft\n\n{excerpt}",
+            "tags": ["replay"],
+            "category": "Humanities",
+        }
+    reasoning = CANNED_REASONING if kwargs["model"] == "deepseek-reasoner" else None
+    return {"content": json.dumps(content, ensure_ascii=False), "reasoning_content": reasoning, "usage": None}
+
+
+class _Namespace:
+    """提供 client.chat.completions.create 这一层访问路径"""
+
+    def __init__(self, create):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=create))
+
+    async def close(self):
+        """与 AsyncOpenAI.close 对应，回放时没有需要释放的连接"""
+
+
+class ReplayClient(_Namespace):
+    """
+    回放客户端，接口与 OpenAI 客户端的 chat.completions.create 一致
+
+    参数:
+        fixtures_dir: 录制目录
+        latency: "recorded" 按录制耗时回放；数字为固定秒数
+        canned: 找不到录制时是否返回固定草稿（False 时抛出 KeyError）
+    """
+
+    def __init__(self, fixtures_dir: str, latency="recorded", canned: bool = True):
+        super().__init__(self.create)
+        self.store = FixtureStore(fixtures_dir)
+        self.latency = latency
+        self.canned = canned
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        record = self.store.load(kwargs)
+        if record is not None:
+            self.hits += 1
+            return record
+        self.misses += 1
+        if not self.canned:
+            raise KeyError(f"no fixture for request {fixture_key(kwargs)}")
+        return {"response": canned_response(kwargs), "latency": {}}
+
+    def _timing(self, record: Dict[str, Any]):
+        """返回 (总耗时, 首 token 时间)"""
+        if self.latency == "recorded":
+            total = record["latency"].get("total") or 0.0
+            first = record["latency"].get("first_token")
+            return total, total if first is None else first
+        total = float(self.latency)
+        return total, total * 0.3
+
+    def _plan(self, kwargs: Dict[str, Any]):
+        record = self._lookup(kwargs)
+        response = record["response"]
+        total, first = self._timing(record)
+        pieces: List[tuple] = []
+        for kind, text in (("reasoning", response.get("reasoning_content")), ("content", response.get("content"))):
+            for i in range(0, len(text or ""), STREAM_CHUNK_CHARS):
+                pieces.append((kind, text[i:i + STREAM_CHUNK_CHARS]))
+        gap = (total - first) / len(pieces) if pieces else 0.0
+        return response, total, first, pieces, gap
+
+    def create(self, **kwargs):
+        response, total, first, pieces, gap = self._plan(kwargs)
+        if not kwargs.get("stream"):
+            time.sleep(total)
+            return _message_response(response["content"], response.get("reasoning_content"), response.get("usage"), kwargs["model"])
+        return self._stream(response, first, pieces, gap)
+
+    def _stream(self, response, first, pieces, gap) -> Iterator[Any]:
+        time.sleep(first)
+        for i, (kind, text) in enumerate(pieces):
+            if i:
+                time.sleep(gap)
+            yield _chunk(**{kind: text})
+        if response.get("usage"):
+            yield _chunk(usage=response["usage"])
+
+    def as_async(self) -> "_Namespace":
+        """同一份录制的异步接口（供 get_async_client 使用）"""
+        async def create(**kwargs):
+            response, total, _, _, _ = self._plan(kwargs)
+            await asyncio.sleep(total)
+            return _message_response(response["content"], response.get("reasoning_content"), response.get("usage"), kwargs["model"])
+        return _Namespace(create)
+
+
+class RecordingClient(_Namespace):
+    """
+    录制客户端：请求照常转发给 inner，同时把回答、用量和耗时写入录制目录
+
+    参数:
+        inner: 真实的 OpenAI / AsyncOpenAI 客户端
+        fixtures_dir: 录制目录
+    """
+
+    def __init__(self, inner, fixtures_dir: str):
+        super().__init__(self.create)
+        self.inner = inner
+        self.store = FixtureStore(fixtures_dir)
+        self.recorded = 0
+
+    def _save(self, kwargs, content, reasoning, usage, started, first_token_at):
+        now = time.perf_counter()
+        latency = {
+            "total": round(now - started, 3),
+            "first_token": round(first_token_at - started, 3) if first_token_at else None,
+        }
+        self.store.save(kwargs, {"content": content, "reasoning_content": reasoning, "usage": _usage_dict(usage)}, latency)
+        self.recorded += 1
+
+    def create(self, **kwargs):
+        started = time.perf_counter()
+        result = self.inner.chat.completions.create(**kwargs)
+        if kwargs.get("stream"):
+            return self._record_stream(kwargs, result, started)
+        message = result.choices[0].message
+        self._save(kwargs, message.content, getattr(message, "reasoning_content", None), result.usage, started, None)
+        return result
+
+    def _record_stream(self, kwargs, stream, started) -> Iterator[Any]:
+        parts = {"reasoning": [], "content": []}
+        usage, first_token_at = None, None
+        for chunk in stream:
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            if chunk.choices:
+                delta = chunk.choices[0].delta
+                for kind, text in (("reasoning", getattr(delta, "reasoning_content", None)), ("content", delta.content)):
+                    if text:
+                        first_token_at = first_token_at or time.perf_counter()
+                        parts[kind].append(text)
+            yield chunk
+        self._save(kwargs, "".join(parts["content"]), "".join(parts["reasoning"]) or None, usage, started, first_token_at)
+
+    def as_async(self, async_inner) -> "_Namespace":
+        """包装异步客户端，写入同一个录制目录"""
+        async def create(**kwargs):
+            started = time.perf_counter()
+            result = await async_inner.chat.completions.create(**kwargs)
+            message = result.choices[0].message
+            self._save(kwargs, message.content, getattr(message, "reasoning_content", None), result.usage, started, None)
+            return result
+        wrapper = _Namespace(create)
+        wrapper.close = async_inner.close
+        return wrapper
@@ -0,0 +1,305 @@
+"""
+LLM 调用遥测：每次调用记录耗时、首 token 时间、token 用量与估算成本、模型、调用方、重试次数和缓存状态
+
+记录写入可插拔的 sink：内存汇总（默认开启，供界面和 get_summary 使用），
+设置 LLM_TELEMETRY_PATH 时同时追加到 JSONL 文件。
+
+用法:
+    python llm_telemetry.py llm_telemetry.jsonl                 # 按会话汇总
+    python llm_telemetry.py llm_telemetry.jsonl --run <run_id>  # 某次工作流运行的明细汇总
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional
+
+LLM_TELEMETRY_PATH = os.getenv("LLM_TELEMETRY_PATH")   # JSONL 输出路径；未设置时只在内存中汇总
+MEMORY_MAX_RECORDS = 5000                              # 内存 sink 保留的最近记录数
+
+PROCESS_SESSION_ID = uuid.uuid4().hex[:12]              # 未指定会话时使用的进程级会话 ID
+
+# 每百万 token 的价格（输入, 输出），用于估算成本；按当前账单价格调整
+MODEL_PRICES = {
+    "deepseek-chat": (0.27, 1.10),
+    "deepseek-reasoner": (0.55, 2.19),
+}
+
+# 识别调用方时跳过的模块（LLM 调用链本身和异步框架）
+_INTERNAL_MODULES = {"llm_client", "model_router", "llm_telemetry", "resilience", "llm_replay", "response_cache"}
+_FRAMEWORK_PREFIXES = ("asyncio", "concurrent", "threading", "contextlib", "contextvars")
+
+_run_id: contextvars.ContextVar = contextvars.ContextVar("llm_run_id", default=None)
+_session_id: contextvars.ContextVar = contextvars.ContextVar("llm_session_id", default=None)
+
+
+class JsonlSink:
+    """每条记录追加一行 JSON"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def emit(self, record: Dict[str, Any]):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+class MemorySink:
+    """在内存中保留最近的记录，按运行 / 会话筛选后汇总"""
+
+    def __init__(self, max_records: int = MEMORY_MAX_RECORDS):
+        self._records: deque = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+
+    def emit(self, record: Dict[str, Any]):
+        with self._lock:
+            self._records.append(record)
+
+    def records(self, run_id: Optional[str] = None, session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                r for r in self._records
+                if (run_id is None or r["run_id"] == run_id) and (session_id is None or r["session_id"] == session_id)
+            ]
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+
+_memory_sink = MemorySink()
+_sinks: list = [_memory_sink]
+if LLM_TELEMETRY_PATH:
+    _sinks.append(JsonlSink(LLM_TELEMETRY_PATH))
+
+
+def add_sink(sink):
+    """注册 sink（任何带 emit(record) 方法的对象）"""
+    _sinks.append(sink)
+
+
+def remove_sink(sink):
+    if sink in _sinks:
+        _sinks.remove(sink)
+
+
+def _emit(record: Dict[str, Any]):
+    for sink in list(_sinks):
+        try:
+            sink.emit(record)
+        except Exception as e:
+            print(f"⚠️ Telemetry sink {type(sink).__name__} failed: {e}")
+
+
+@contextmanager
+def telemetry_scope(run_id: Optional[str] = None, session_id: Optional[str] = None):
+    """
+    在作用域内发生的 LLM 调用标记为同一次工作流运行 / 同一个会话
+
+    基于 contextvars，LangGraph 节点所在的线程和协程会继承这里设置的值。
+    """
+    tokens = []
+    if run_id is not None:
+        tokens.append((_run_id, _run_id.set(run_id)))
+    if session_id is not None:
+        tokens.append((_session_id, _session_id.set(session_id)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def capture_caller() -> str:
+    """
+    调用栈上第一个不属于 LLM 调用链的函数，如 agents.ResearcherAgent.draft_content
+
+    只对同步调用和被直接 await 的协程可靠；在事件循环任务（asyncio.gather / create_task）中
+    调用栈从事件循环开始，需要在创建协程的地方先调用本函数，再通过 caller= 传入。
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module.split(".")[0] not in _INTERNAL_MODULES and not module.startswith(_FRAMEWORK_PREFIXES):
+            return f"{module}.{frame.f_code.co_qualname}"
+        frame = frame.f_back
+    return "unknown"
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """按 MODEL_PRICES 估算一次调用的成本（思考 token 已计入 completion_tokens）"""
+    input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+
+def _field(obj, name: str):
+    if obj is None:
+        return None
+    return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+
+class CallTrace:
+    """
+    一次 LLM 调用的计时与用量
+
+    由 llm_client 创建：请求前记录开始时间和调用方，流式输出到达第一个增量时调用 first_token()，
+    结束时 finish() 生成记录并写入所有 sink。
+    """
+
+    def __init__(self, model: str, stream: bool = False, caller: Optional[str] = None):
+        self.model = model
+        self.stream = stream
+        self.caller = caller or capture_caller()
+        self.run_id = _run_id.get()
+        self.session_id = _session_id.get() or PROCESS_SESSION_ID
+        self.started = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.usage = None
+        self.retries = 0
+        self.cache = "off"
+
+    def first_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+
+    def add_retry(self, kind: str = "", wait: float = 0.0):
+        self.retries += 1
+
+    def finish(self, status: str = "ok", error: Optional[BaseException] = None) -> Dict[str, Any]:
+        ended = time.perf_counter()
+        wall = ended - self.started
+        # 非流式调用的全部 token 同时到达，首 token 时间即总耗时
+        ttft = (self.first_token_at or ended) - self.started
+        details = _field(self.usage, "completion_tokens_details")
+        prompt_tokens = _field(self.usage, "prompt_tokens")
+        completion_tokens = _field(self.usage, "completion_tokens")
+        record = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "session_id": self.session_id,
+            "run_id": self.run_id,
+            "caller": self.caller,
+            "model": self.model,
+            "stream": self.stream,
+            "status": status,
+            "error": f"{type(error).__name__}: {error}" if error else None,
+            "wall_seconds": round(wall, 3),
+            "ttft_seconds": round(ttft, 3) if status == "ok" else None,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "reasoning_tokens": _field(details, "reasoning_tokens"),
+            "total_tokens": _field(self.usage, "total_tokens"),
+            "cost": round(estimate_cost(self.model, prompt_tokens or 0, completion_tokens or 0), 6),
+            "retries": self.retries,
+            "cache": self.cache,
+        }
+        _emit(record)
+        return record
+
+
+def _aggregate(records: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    records = list(records)
+    ttfts = [r["ttft_seconds"] for r in records if r["ttft_seconds"] is not None and r["cache"] != "hit"]
+    total = lambda field: sum(r[field] or 0 for r in records)
+    return {
+        "calls": len(records),
+        "errors": sum(r["status"] != "ok" for r in records),
+        "cache_hits": sum(r["cache"] == "hit" for r in records),
+        "retries": total("retries"),
+        "wall_seconds": round(total("wall_seconds"), 3),
+        "avg_ttft_seconds": round(sum(ttfts) / len(ttfts), 3) if ttfts else None,
+        "prompt_tokens": total("prompt_tokens"),
+        "completion_tokens": total("completion_tokens"),
+        "reasoning_tokens": total("reasoning_tokens"),
+        "cost": round(total("cost"), 6),
+    }
+
+
+def summarize(records: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    汇总调用记录
+
+    返回:
+        dict: {"total": {...}, "by_caller": {调用方: {...}}, "by_model": {模型: {...}}}
+    """
+    records = list(records)
+    groups: Dict[str, Dict[str, list]] = {"by_caller": {}, "by_model": {}}
+    for r in records:
+        groups["by_caller"].setdefault(r["caller"], []).append(r)
+        groups["by_model"].setdefault(r["model"], []).append(r)
+    return {
+        "total": _aggregate(records),
+        **{name: {key: _aggregate(rs) for key, rs in group.items()} for name, group in groups.items()},
+    }
+
+
+def get_summary(run_id: Optional[str] = None, session_id: Optional[str] = None) -> Dict[str, Any]:
+    """内存中记录的汇总；指定 run_id / session_id 时只统计对应的调用"""
+    return summarize(_memory_sink.records(run_id=run_id, session_id=session_id))
+
+
+def get_records(run_id: Optional[str] = None, session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    return _memory_sink.records(run_id=run_id, session_id=session_id)
+
+
+def format_summary(summary: Dict[str, Any], title: str = "LLM calls") -> str:
+    """把 summarize() 的结果排成便于阅读的文本表格"""
+    def row(name, s):
+        ttft = f"{s['avg_ttft_seconds']:.2f}s" if s["avg_ttft_seconds"] is not None else "-"
+        return (
+            f"  {name:<48} {s['calls']:>5} {s['wall_seconds']:>9.2f}s {ttft:>8} "
+            f"{s['prompt_tokens']:>8} {s['completion_tokens']:>8} {s['reasoning_tokens']:>8} "
+            f"{s['retries']:>4} {s['cache_hits']:>4} {s['errors']:>4} {s['cost']:>9.4f}"
+        )
+
+    header = (
+        f"  {'':<48} {'calls':>5} {'wall':>10} {'ttft':>8} "
+        f"{'prompt':>8} {'output':>8} {'reason':>8} {'rtry':>4} {'hit':>4} {'err':>4} {'cost':>9}"
+    )
+    lines = [f"📊 {title}", header, row("TOTAL", summary["total"])]
+    for group in ("by_caller", "by_model"):
+        for name, s in sorted(summary[group].items(), key=lambda kv: -kv[1]["wall_seconds"]):
+            lines.append(row(name, s))
+    return "\n".join(lines)
+
+
+def _load_jsonl(path: str) -> List[Dict[str, Any]]:
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    return records
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize LLM telemetry from a JSONL file")
+    parser.add_argument("path", nargs="?", default=LLM_TELEMETRY_PATH or "llm_telemetry.jsonl")
+    parser.add_argument("--run", help="only this workflow run")
+    parser.add_argument("--session", help="only this session")
+    args = parser.parse_args()
+
+    records = _load_jsonl(args.path)
+    if args.run or args.session:
+        selected = [
+            r for r in records
+            if (not args.run or r["run_id"] == args.run) and (not args.session or r["session_id"] == args.session)
+        ]
+        print(format_summary(summarize(selected), f"run {args.run}" if args.run else f"session {args.session}"))
+    else:
+        sessions: Dict[str, list] = {}
+        for r in records:
+            sessions.setdefault(r["session_id"], []).append(r)
+        for session_id, rs in sessions.items():
+            runs = len({r["run_id"] for r in rs if r["run_id"]})
+            print(format_summary(summarize(rs), f"session {session_id} ({runs} runs, since {rs[0]['ts']})"))
+            print()
@@ -0,0 +1,229 @@
+"""
+HNSW 索引维护
+
+用法:
+    python maintain_index.py stats                      # 记录数、HNSW 参数、磁盘占用、召回/延迟探测
+    python maintain_index.py sweep --ef 10 20 50 100 200 # 不同 ef_search 下的 recall@k 与查询延迟
+    python maintain_index.py rebuild                    # 按 vector_ops 的 HNSW 配置重建索引（清理删除/更新留下的残留）
+
+召回率以暴力精确检索为基准：从库里抽样已存向量作为查询，比较 HNSW 的 Top-K 与精确 Top-K 的重合比例。
+修改 HNSW_SPACE / HNSW_EF_CONSTRUCTION / HNSW_M 后需要 rebuild 才会生效；ef_search 可用 sweep 选定后
+通过 HNSW_EF_SEARCH 配置，打开集合时自动同步。
+"""
+import os
+import time
+import random
+import argparse
+import statistics
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+import vector_ops
+
+REBUILD_SUFFIX = "__rebuild"
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _load_embeddings(batch_size: int = 1000):
+    """读出全部 (ids, embeddings)，用于精确检索基准"""
+    collection = vector_ops.get_collection()
+    ids, vectors = [], []
+    offset = 0
+    while True:
+        page = collection.get(include=["embeddings"], limit=batch_size, offset=offset)
+        batch = page.get("ids") or []
+        if not batch:
+            break
+        ids.extend(batch)
+        vectors.extend(page["embeddings"])
+        offset += len(batch)
+    return ids, np.asarray(vectors, dtype=np.float32)
+
+
+def _space() -> str:
+    return vector_ops.collection_space()
+
+
+def _exact_top_k(matrix: np.ndarray, query: np.ndarray, k: int, space: str) -> np.ndarray:
+    if space == "cosine":
+        norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+        distances = 1.0 - matrix @ query / np.clip(norms, 1e-12, None)
+    elif space == "ip":
+        distances = 1.0 - matrix @ query
+    else:
+        distances = ((matrix - query) ** 2).sum(axis=1)
+    return np.argsort(distances, kind="stable")[:k]
+
+
+def probe(samples: int = 100, k: int = 10, seed: int = 0) -> Dict[str, Any]:
+    """
+    用库内向量作为查询，测量 HNSW 检索的 recall@k（相对精确检索）和查询延迟
+
+    返回:
+        dict: {"records", "samples", "recall@k", "p50_ms", "p95_ms"}
+    """
+    ids, matrix = _load_embeddings()
+    if not ids:
+        return {"records": 0, "samples": 0, f"recall@{k}": 0.0, "p50_ms": 0.0, "p95_ms": 0.0}
+    space = _space()
+    collection = vector_ops.get_collection()
+    k = min(k, len(ids))
+    picks = random.Random(seed).sample(range(len(ids)), min(samples, len(ids)))
+
+    overlap = 0
+    latencies = []
+    for i in picks:
+        expected = {ids[j] for j in _exact_top_k(matrix, matrix[i], k, space)}
+        t0 = time.perf_counter()
+        found = collection.query(query_embeddings=[matrix[i].tolist()], n_results=k, include=["distances"])
+        latencies.append((time.perf_counter() - t0) * 1000)
+        overlap += len(expected & set(found["ids"][0]))
+    latencies.sort()
+    return {
+        "records": len(ids),
+        "samples": len(picks),
+        f"recall@{k}": overlap / (len(picks) * k),
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+    }
+
+
+def stats(samples: int = 100, k: int = 10) -> Dict[str, Any]:
+    """打印各集合的记录数和 HNSW 参数、磁盘占用，以及一次召回/延迟探测"""
+    for name, col in vector_ops.physical_collections().items():
+        hnsw = (col.configuration or {}).get("hnsw") or {}
+        print(
+            f"🗂️ {name}: {col.count()} records | space={hnsw.get('space')} M={hnsw.get('max_neighbors')} "
+            f"ef_construction={hnsw.get('ef_construction')} ef_search={hnsw.get('ef_search')}"
+        )
+    result = {"disk_bytes": _dir_size(vector_ops.CHROMA_PATH), **probe(samples, k)}
+    print(
+        f"📊 {result['disk_bytes'] / 1024 / 1024:.1f} MB on disk | recall@{k} {result[f'recall@{k}']:.3f} | "
+        f"p50 {result['p50_ms']:.2f}ms p95 {result['p95_ms']:.2f}ms"
+    )
+    return result
+
+
+def _set_ef_search(ef: int):
+    for col in vector_ops.physical_collections().values():
+        col.modify(configuration={"hnsw": {"ef_search": ef}})
+
+
+def sweep(ef_values: List[int], samples: int = 100, k: int = 10) -> List[Dict[str, Any]]:
+    """
+    依次设置不同 ef_search 并探测召回/延迟，结束后恢复为 HNSW_EF_SEARCH
+    """
+    results = []
+    try:
+        for ef in ef_values:
+            _set_ef_search(ef)
+            result = {"ef_search": ef, **probe(samples, k)}
+            results.append(result)
+            print(
+                f"🔎 ef_search={ef:<5} recall@{k} {result[f'recall@{k}']:.3f} | "
+                f"p50 {result['p50_ms']:.2f}ms p95 {result['p95_ms']:.2f}ms"
+            )
+    finally:
+        _set_ef_search(vector_ops.HNSW_EF_SEARCH)
+    return results
+
+
+def rebuild_collection(client, name: str, configuration: Dict[str, Any], batch_size: int = 500) -> Optional[int]:
+    """
+    用新的 HNSW 配置重建一个集合：复制到临时集合 -> 删除旧集合 -> 临时集合改名
+
+    复用已存向量，不重新编码。上次重建中断留下的临时集合会被清理或接着改名。
+
+    返回:
+        int: 复制的记录数；集合不存在时返回 None
+    """
+    tmp_name = f"{name}{REBUILD_SUFFIX}"
+    existing = {c.name for c in client.list_collections()}
+    if tmp_name in existing:
+        if name in existing:
+            client.delete_collection(name=tmp_name)  # 上次中断在复制阶段，旧集合完好
+        else:
+            client.get_collection(name=tmp_name, embedding_function=None).modify(name=name)
+            print(f"♻️ Finished an interrupted rebuild of '{name}'.")
+            return 0
+    if name not in existing:
+        return None
+
+    source = client.get_collection(name=name, embedding_function=None)
+    target = client.create_collection(name=tmp_name, embedding_function=None, configuration=configuration)
+    copied = 0
+    offset = 0
+    while True:
+        page = source.get(include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=offset)
+        ids = page.get("ids") or []
+        if not ids:
+            break
+        target.add(
+            ids=ids,
+            embeddings=[list(map(float, e)) for e in page["embeddings"]],
+            documents=page.get("documents"),
+            metadatas=page.get("metadatas"),
+        )
+        offset += len(ids)
+        copied += len(ids)
+
+    client.delete_collection(name=name)
+    target.modify(name=name)
+    return copied
+
+
+def rebuild(samples: int = 100, k: int = 10) -> Dict[str, Any]:
+    """
+    按当前 HNSW 配置重建全部底层集合，并报告重建前后的磁盘占用与召回/延迟
+    """
+    print("📊 Before:")
+    before = stats(samples, k)
+    names = list(vector_ops.physical_collections())
+    client = vector_ops._client
+
+    started = time.perf_counter()
+    for name in names:
+        copied = rebuild_collection(client, name, vector_ops.hnsw_configuration())
+        print(f"🔧 Rebuilt {name}: {copied} records")
+    elapsed = time.perf_counter() - started
+
+    # 集合对象已失效，重新打开；同时通知其他进程（如运行中的应用）重新打开
+    vector_ops._collection = None
+    vector_ops.mark_index_changed()
+    print("📊 After:")
+    after = stats(samples, k)
+    print(
+        f"✅ Rebuild finished in {elapsed:.1f}s | disk {before['disk_bytes'] / 1024 / 1024:.1f} MB -> "
+        f"{after['disk_bytes'] / 1024 / 1024:.1f} MB"
+    )
+    return {"before": before, "after": after, "elapsed_s": elapsed}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HNSW index maintenance for the vector store")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for cmd in ("stats", "sweep", "rebuild"):
+        p = sub.add_parser(cmd)
+        p.add_argument("--samples", type=int, default=100, help="stored vectors used as probe queries")
+        p.add_argument("-k", type=int, default=10)
+        if cmd == "sweep":
+            p.add_argument("--ef", type=int, nargs="+", default=[10, 20, 50, 100, 200])
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        stats(args.samples, args.k)
+    elif args.command == "sweep":
+        sweep(args.ef, args.samples, args.k)
+    else:
+        rebuild(args.samples, args.k)
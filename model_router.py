@@ -0,0 +1,119 @@
+import os
+import time
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from llm_client import get_completion, get_reasoning_completion
+from llm_telemetry import estimate_cost
+from prompt_budget import count_tokens
+
+# --- 路由策略 ---
+# auto：按任务、分类和输入长度选择；reasoner / chat：全部走 R1 / V3
+LLM_ROUTING = os.getenv("LLM_ROUTING", "auto")
+ROUTE_REASONER_MIN_TOKENS = int(os.getenv("ROUTE_REASONER_MIN_TOKENS", "1500"))  # 草稿：输入超过该 token 数才用 R1
+ROUTE_CATEGORY_MIN_TOKENS = {"Spanish": 4000}   # 按分类覆盖阈值（词汇/语法笔记结构简单，V3 足够）
+ROUTE_MERGE_MIN_TOKENS = 800                     # 融合：新旧内容合计超过该 token 数才用 R1
+
+CHAT_MODEL = "deepseek-chat"
+REASONER_MODEL = "deepseek-reasoner"
+
+LATENCY_WINDOW = 200   # 每条路由保留最近多少次耗时用于计算分位数
+
+_stats: Dict[str, Dict[str, Any]] = {}
+_stats_lock = threading.Lock()
+
+
+def choose_model(task: str, input_tokens: int, category: Optional[str] = None, attempt: int = 0) -> Tuple[str, str]:
+    """
+    为一次调用选择模型
+
+    参数:
+        task: "draft" | "merge"
+        input_tokens: 输入内容（不含模板）的 token 数
+        category: 内容分类 Spanish | Tech | Humanities
+        attempt: 第几次尝试；上一次 V3 的结果没能解析时升级到 R1
+
+    返回:
+        tuple: (模型名, 选择原因)
+    """
+    if LLM_ROUTING == "reasoner":
+        return REASONER_MODEL, "forced"
+    if LLM_ROUTING == "chat":
+        return CHAT_MODEL, "forced"
+    if attempt > 0:
+        return REASONER_MODEL, "retry"
+    if task == "merge":
+        threshold = ROUTE_MERGE_MIN_TOKENS
+    else:
+        threshold = ROUTE_CATEGORY_MIN_TOKENS.get(category, ROUTE_REASONER_MIN_TOKENS)
+    if input_tokens >= threshold:
+        return REASONER_MODEL, f"{input_tokens} >= {threshold} tokens"
+    return CHAT_MODEL, f"{input_tokens} < {threshold} tokens"
+
+
+def _record(route: str, model: str, seconds: float, prompt_tokens: int, completion_tokens: int):
+    cost = estimate_cost(model, prompt_tokens, completion_tokens)
+    with _stats_lock:
+        entry = _stats.setdefault(route, {
+            "calls": 0, "seconds": 0.0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0,
+            "latencies": deque(maxlen=LATENCY_WINDOW),
+        })
+        entry["calls"] += 1
+        entry["seconds"] += seconds
+        entry["prompt_tokens"] += prompt_tokens
+        entry["completion_tokens"] += completion_tokens
+        entry["cost"] += cost
+        entry["latencies"].append(seconds)
+
+
+def routed_completion(
+    prompt: str,
+    *,
+    task: str,
+    input_tokens: int,
+    category: Optional[str] = None,
+    attempt: int = 0,
+    on_delta: Optional[Callable[[str, str], None]] = None,
+    json_mode: bool = False,
+) -> Tuple[str, str]:
+    """
+    按路由策略调用 V3 或 R1，并记录该路由的耗时和（本地估算的）token 用量与成本
+
+    V3 不支持思考过程，提供 on_delta 时在完成后一次性回调完整回答。
+
+    返回:
+        tuple: (content, reasoning)，与 get_reasoning_completion 一致
+    """
+    model, reason = choose_model(task, input_tokens, category, attempt)
+    print(f"🧭 Route {task} -> {model} ({reason})")
+    started = time.perf_counter()
+    if model == REASONER_MODEL:
+        content, reasoning = get_reasoning_completion(prompt, on_delta=on_delta, json_mode=json_mode)
+    else:
+        content = get_completion(prompt, model, json_mode=json_mode)
+        reasoning = "（V3 路由，无思考过程）"
+        if on_delta is not None and content:
+            on_delta("content", content)
+    elapsed = time.perf_counter() - started
+    completion_tokens = count_tokens(content) + (count_tokens(reasoning) if model == REASONER_MODEL else 0)
+    _record(f"{task}/{model}", model, elapsed, count_tokens(prompt), completion_tokens)
+    return content, reasoning
+
+
+def get_routing_stats() -> Dict[str, Dict[str, Any]]:
+    """各路由（任务/模型）的调用次数、平均与 p50/p95 耗时、估算 token 和成本"""
+    report = {}
+    with _stats_lock:
+        for route, entry in _stats.items():
+            latencies = sorted(entry["latencies"])
+            report[route] = {
+                "calls": entry["calls"],
+                "avg_seconds": round(entry["seconds"] / entry["calls"], 3),
+                "p50_seconds": round(latencies[len(latencies) // 2], 3),
+                "p95_seconds": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3),
+                "prompt_tokens": entry["prompt_tokens"],
+                "completion_tokens": entry["completion_tokens"],
+                "cost": round(entry["cost"], 6),
+            }
+    return report
@@ -371,22 +371,86 @@ def build_content_blocks(summary, blocks):
     return children
 
 # --- 功能函数 (保持不变) ---
-def get_all_page_titles(db_id):
-    if not db_id: return []
+def query_database_page(db_id: str, start_cursor: str = None, page_size: int = 100) -> dict:
+    """
+    查询数据库的一页结果（Notion 单次最多 100 条）
+
+    参数:
+        db_id: 数据库 ID
+        start_cursor: 上一页返回的 next_cursor，None 表示从头开始
+        page_size: 每页条数
+
+    返回:
+        dict: {"results": [...], "next_cursor": str | None, "has_more": bool}
+    """
     url = f"https://api.notion.com/v1/databases/{db_id}/query"
     headers = {"Authorization": f"Bearer {NOTION_TOKEN}", "Notion-Version": "2022-06-28", "Content-Type": "application/json"}
+    body = {"page_size": page_size}
+    if start_cursor:
+        body["start_cursor"] = start_cursor
+    response = requests.post(url, headers=headers, json=body, timeout=30)
+    response.raise_for_status()
+    data = response.json()
+    return {
+        "results": data.get("results", []),
+        "next_cursor": data.get("next_cursor"),
+        "has_more": data.get("has_more", False),
+    }
+
+def iter_database_pages(db_id: str, start_cursor: str = None, page_size: int = 100):
+    """
+    逐页遍历数据库的全部行（自动翻页）
+
+    每次 yield (results, next_cursor)：next_cursor 是处理完这一页后用于续跑的游标，
+    最后一页为 None。
+    """
+    cursor = start_cursor
+    while True:
+        page = query_database_page(db_id, cursor, page_size)
+        cursor = page["next_cursor"] if page["has_more"] else None
+        yield page["results"], cursor
+        if not cursor:
+            break
+
+def get_page_status(page_id: str) -> str:
+    """
+    查询单个页面是否还存在
+
+    返回:
+        str: "live" | "archived"（已归档或在回收站）| "missing"（404）| "error"（限流、网络等，状态未知）
+    """
+    url = f"https://api.notion.com/v1/pages/{page_id}"
+    headers = {"Authorization": f"Bearer {NOTION_TOKEN}", "Notion-Version": "2022-06-28"}
+    try:
+        response = requests.get(url, headers=headers, timeout=30)
+    except requests.RequestException as e:
+        print(f"⚠️ Failed to check page {page_id}: {e}")
+        return "error"
+    if response.status_code == 404:
+        return "missing"
+    if response.status_code != 200:
+        return "error"
+    data = response.json()
+    return "archived" if data.get("archived") or data.get("in_trash") else "live"
+
+def get_page_title(page: dict) -> str:
+    """从页面对象的 title 属性中提取纯文本标题"""
+    props = page.get("properties", {})
+    title_prop = next((v for k, v in props.items() if v.get("type") == "title"), None)
+    if title_prop and title_prop.get("title"):
+        return "".join([t["plain_text"] for t in title_prop["title"]])
+    return ""
+
+def get_all_page_titles(db_id):
+    if not db_id: return []
     try:
-        response = requests.post(url, headers=headers, json={"page_size": 100}, timeout=10)
-        data = response.json()
         results = []
-        for page in data.get("results", []):
-            try:
-                props = page.get("properties", {})
-                title_prop = next((v for k, v in props.items() if v["type"] == "title"), None)
-                if title_prop and title_prop.get("title"):
-                    title_text = "".join([t["plain_text"] for t in title_prop["title"]])
+        for pages, _ in iter_database_pages(db_id):
+            for page in pages:
+                try:
+                    title_text = get_page_title(page)
                     if title_text: results.append({"id": page["id"], "title": title_text})
-            except: continue
+                except: continue
         return results
     except Exception as e:
         print(f"❌ Error fetching titles: {e}")
@@ -589,9 +653,18 @@ def get_page_text(page_id: str) -> str:
     """
     print(f"📖 Reading content from page {page_id}...")
     try:
-        # 获取所有 block
-        response = notion.blocks.children.list(block_id=page_id)
-        blocks = response.get("results", [])
+        # 获取所有 block（分页读取，单次最多 100 个）
+        blocks = []
+        cursor = None
+        while True:
+            kwargs = {"block_id": page_id, "page_size": 100}
+            if cursor:
+                kwargs["start_cursor"] = cursor
+            response = notion.blocks.children.list(**kwargs)
+            blocks.extend(response.get("results", []))
+            if not response.get("has_more"):
+                break
+            cursor = response.get("next_cursor")
         
         full_text = []
         for b in blocks:
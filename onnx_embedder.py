@@ -0,0 +1,250 @@
+"""
+bge-m3 的 ONNX / int8 量化 CPU 推理后端
+
+用法:
+    # 1. 导出（需要 torch + transformers，联网或本地已有模型均可）
+    python onnx_embedder.py export --model BAAI/bge-m3 --out ./models/bge-m3-onnx
+
+    # 2. 与参考实现 (sentence-transformers) 做一致性校验
+    python onnx_embedder.py parity --model-path ./models/bge-m3-onnx
+
+    # 3. 性能对比：加载时间、单条查询延迟、批量吞吐
+    python onnx_embedder.py bench --model-path ./models/bge-m3-onnx
+
+运行时只依赖 onnxruntime + transformers（分词器），全部从本地目录加载，可离线使用。
+"""
+import os
+import json
+import time
+import argparse
+import statistics
+from typing import Callable, Dict, Any, List, Optional
+
+FP32_FILE = "model.onnx"
+INT8_FILE = "model_int8.onnx"
+CONFIG_FILE = "embedder_config.json"
+
+SAMPLE_TEXTS = [
+    "Title: 西班牙语过去未完成时\nSummary: 用于描述过去的习惯和背景",
+    "El pretérito imperfecto se usa para describir acciones habituales en el pasado.",
+    "How does torch.nn.Linear initialize its weights?",
+    "什么是经济租？",
+    "LangGraph 的 interrupt_before 可以在发布前暂停工作流，等待人工审查。",
+    "Critical thinking is the analysis of available facts to form a judgement.",
+    "Chroma 使用 HNSW 索引进行近似最近邻检索。",
+    "La Revolución Industrial transformó la economía europea del siglo XIX.",
+]
+
+
+class OnnxEmbedder:
+    """
+    与 chromadb 的 Embedding 函数接口一致：embedder(texts) -> List[List[float]]
+
+    参数:
+        model_dir: export_onnx 导出的本地目录（含 onnx 文件、分词器和 embedder_config.json）
+        quantized: 优先使用 int8 动态量化模型（不存在时回退 fp32）
+        max_length: 最大 token 数
+        num_threads: onnxruntime intra-op 线程数，None 表示由运行时决定
+    """
+
+    def __init__(self, model_dir: str, quantized: bool = True, max_length: int = 8192, num_threads: Optional[int] = None):
+        try:
+            import numpy as np
+            import onnxruntime as ort
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise ImportError("ONNX backend requires `onnxruntime` and `transformers`: pip install onnxruntime transformers") from e
+
+        self._np = np
+        model_file = os.path.join(model_dir, INT8_FILE if quantized else FP32_FILE)
+        if not os.path.exists(model_file):
+            model_file = os.path.join(model_dir, FP32_FILE)
+        if not os.path.exists(model_file):
+            raise FileNotFoundError(f"No ONNX model found in {model_dir}, run `python onnx_embedder.py export` first.")
+
+        config = {"pooling": "cls", "normalize": True}
+        config_path = os.path.join(model_dir, CONFIG_FILE)
+        if os.path.exists(config_path):
+            with open(config_path, "r", encoding="utf-8") as f:
+                config.update(json.load(f))
+        self.pooling = config["pooling"]
+        self.normalize = config["normalize"]
+        self.max_length = max_length
+        self.model_file = model_file
+        self.quantized = model_file.endswith(INT8_FILE)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_file, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir, local_files_only=True)
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        np = self._np
+        texts = list(input)
+        if not texts:
+            return []
+        encoded = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_length,
+            return_tensors="np",
+        )
+        feeds = {k: encoded[k].astype(np.int64) for k in self.input_names if k in encoded}
+        hidden = self.session.run(None, feeds)[0]
+
+        if self.pooling == "mean":
+            mask = encoded["attention_mask"][..., None].astype(hidden.dtype)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        else:
+            pooled = hidden[:, 0]
+        if self.normalize:
+            pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype(np.float32).tolist()
+
+
+def export_onnx(model_name_or_path: str, output_dir: str, *, quantize: bool = True, pooling: str = "cls", opset: int = 17) -> str:
+    """
+    把 HuggingFace 模型导出为 ONNX（可选 int8 动态量化），连同分词器保存到 output_dir
+
+    bge-m3 的稠密向量使用 [CLS] 池化 + L2 归一化，这里默认保持一致。
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"📦 Exporting {model_name_or_path} -> {output_dir} ...")
+    tokenizer = AutoTokenizer.from_pretrained(model_name_or_path)
+    model = AutoModel.from_pretrained(model_name_or_path).eval()
+
+    dummy = tokenizer(["hello world"], return_tensors="pt")
+    fp32_path = os.path.join(output_dir, FP32_FILE)
+    dynamic = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (dummy["input_ids"], dummy["attention_mask"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={"input_ids": dynamic, "attention_mask": dynamic, "last_hidden_state": dynamic},
+            opset_version=opset,
+        )
+    tokenizer.save_pretrained(output_dir)
+    with open(os.path.join(output_dir, CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump({"pooling": pooling, "normalize": True, "source_model": model_name_or_path}, f, indent=2)
+    print(f"✅ FP32 model saved: {fp32_path}")
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        int8_path = os.path.join(output_dir, INT8_FILE)
+        # bge-m3 的 fp32 权重超过 2GB，需要外部数据格式
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8, use_external_data_format=True)
+        print(f"✅ INT8 model saved: {int8_path}")
+    return output_dir
+
+
+def check_parity(candidate: Callable, reference: Callable, texts: List[str] = None, min_cosine: float = 0.99) -> Dict[str, Any]:
+    """
+    一致性校验：比较候选后端与参考实现在同一批文本上的余弦相似度
+
+    返回:
+        dict: {"min_cosine", "mean_cosine", "passed"}
+    """
+    import numpy as np
+
+    texts = texts or SAMPLE_TEXTS
+    a = np.asarray(candidate(texts), dtype=np.float32)
+    b = np.asarray(reference(texts), dtype=np.float32)
+    a /= np.clip(np.linalg.norm(a, axis=1, keepdims=True), 1e-12, None)
+    b /= np.clip(np.linalg.norm(b, axis=1, keepdims=True), 1e-12, None)
+    cosines = (a * b).sum(axis=1)
+    result = {
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+        "passed": bool(cosines.min() >= min_cosine),
+    }
+    print(f"{'✅' if result['passed'] else '❌'} Parity: min cos {result['min_cosine']:.5f}, mean cos {result['mean_cosine']:.5f}")
+    return result
+
+
+def benchmark_backend(name: str, factory: Callable[[], Callable], *, queries: List[str] = None, batch_texts: List[str] = None, batch_size: int = 32) -> Dict[str, Any]:
+    """
+    测量一个后端的加载时间、单条查询延迟 (p50/p95) 和批量吞吐 (texts/sec)
+    """
+    queries = queries or SAMPLE_TEXTS
+    batch_texts = batch_texts or [t * 8 for t in SAMPLE_TEXTS] * 8
+
+    started = time.perf_counter()
+    embedder = factory()
+    embedder(["warmup"])
+    load_s = time.perf_counter() - started
+
+    latencies = []
+    for q in queries * 3:
+        t0 = time.perf_counter()
+        embedder([q])
+        latencies.append((time.perf_counter() - t0) * 1000)
+    latencies.sort()
+
+    t0 = time.perf_counter()
+    for i in range(0, len(batch_texts), batch_size):
+        embedder(batch_texts[i:i + batch_size])
+    throughput = len(batch_texts) / (time.perf_counter() - t0)
+
+    result = {
+        "backend": name,
+        "load_s": load_s,
+        "query_p50_ms": statistics.median(latencies),
+        "query_p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "batch_texts_per_sec": throughput,
+    }
+    print(
+        f"⏱️ {name:<12} load {result['load_s']:.1f}s | query p50 {result['query_p50_ms']:.1f}ms "
+        f"p95 {result['query_p95_ms']:.1f}ms | batch {result['batch_texts_per_sec']:.1f} texts/sec"
+    )
+    return result
+
+
+def _reference_factory(model_name_or_path: str, device: str = "cpu") -> Callable[[], Callable]:
+    def factory():
+        from chromadb.utils import embedding_functions
+        return embedding_functions.SentenceTransformerEmbeddingFunction(model_name=model_name_or_path, device=device)
+    return factory
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ONNX embedding backend tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_export = sub.add_parser("export", help="export model to ONNX (+ int8)")
+    p_export.add_argument("--model", default="BAAI/bge-m3")
+    p_export.add_argument("--out", default="./models/bge-m3-onnx")
+    p_export.add_argument("--no-quantize", action="store_true")
+
+    for cmd in ("parity", "bench"):
+        p = sub.add_parser(cmd)
+        p.add_argument("--model-path", default="./models/bge-m3-onnx")
+        p.add_argument("--reference", default="BAAI/bge-m3", help="sentence-transformers model name or local path")
+
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_onnx(args.model, args.out, quantize=not args.no_quantize)
+
+    elif args.command == "parity":
+        reference = _reference_factory(args.reference)()
+        for quantized in (False, True):
+            print(f"--- {'INT8' if quantized else 'FP32'} ---")
+            check_parity(OnnxEmbedder(args.model_path, quantized=quantized), reference)
+
+    elif args.command == "bench":
+        results = [
+            benchmark_backend("torch-fp32", _reference_factory(args.reference)),
+            benchmark_backend("onnx-fp32", lambda: OnnxEmbedder(args.model_path, quantized=False)),
+            benchmark_backend("onnx-int8", lambda: OnnxEmbedder(args.model_path, quantized=True)),
+        ]
+        print(json.dumps(results, indent=2))
@@ -0,0 +1,234 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Iterable
+
+_RESULT_KEYS = ("ids", "embeddings", "documents", "metadatas", "distances", "uris", "data")
+
+
+class PartitionedCollection:
+    """
+    按领域物理分区的 Chroma 集合
+
+    每个领域（metadata["category"]）一个独立集合，各自维护 HNSW 图；
+    对外提供与 chromadb Collection 相同的 get/query/upsert/update/delete/count 子集，
+    vector_ops 无需区分单集合还是分区模式。
+
+    - 写入按 category 路由；同一 id 换了领域时（upsert 或 update）从旧分区移到新分区
+    - 带 where={"category": X} 的查询只访问对应分区
+    - 其它查询并行扇出到所有分区，再按距离合并
+    """
+
+    def __init__(
+        self,
+        client,
+        base_name: str,
+        partitions: Iterable[str],
+        fallback: str = "general",
+        configuration: Optional[Dict[str, Any]] = None,
+    ):
+        self.base_name = base_name
+        self.fallback = fallback
+        self.partitions = list(dict.fromkeys(list(partitions) + [fallback]))
+        self._collections = {
+            p: client.get_or_create_collection(
+                name=f"{base_name}_{p}", embedding_function=None, configuration=configuration,
+            )
+            for p in self.partitions
+        }
+        self._pool = ThreadPoolExecutor(max_workers=len(self._collections), thread_name_prefix="partition")
+
+    def partition_for(self, category: Optional[str]) -> str:
+        return category if category in self._collections else self.fallback
+
+    def collection_for(self, category: Optional[str]):
+        return self._collections[self.partition_for(category)]
+
+    def collections(self) -> Dict[str, Any]:
+        return dict(self._collections)
+
+    # --- 写入 ---
+    def _group_rows(self, metadatas: List[Dict], **columns) -> Dict[str, Dict[str, list]]:
+        groups: Dict[str, Dict[str, list]] = {}
+        for i, meta in enumerate(metadatas):
+            part = self.partition_for((meta or {}).get("category"))
+            group = groups.setdefault(part, {"metadatas": []})
+            group["metadatas"].append(meta)
+            for name, values in columns.items():
+                if values is not None:
+                    group.setdefault(name, []).append(values[i])
+        return groups
+
+    def upsert(self, ids: List[str], metadatas: List[Dict], embeddings=None, documents=None):
+        groups = self._group_rows(metadatas, ids=ids, embeddings=embeddings, documents=documents)
+        for part, group in groups.items():
+            # 领域变化时旧分区里的同 id 记录要删掉，否则会残留
+            for other, col in self._collections.items():
+                if other != part:
+                    col.delete(ids=group["ids"])
+            self._collections[part].upsert(**group)
+
+    def update(self, ids: List[str], metadatas: List[Dict], embeddings=None, documents=None):
+        located = self._locate(ids)
+        if all("category" in (m or {}) for m in metadatas):
+            moving = [
+                i for i, (rid, meta) in enumerate(zip(ids, metadatas))
+                if rid in located and located[rid] != self.partition_for(meta["category"])
+            ]
+            if moving:
+                self._move(
+                    [ids[i] for i in moving],
+                    [metadatas[i] for i in moving],
+                    located,
+                    [embeddings[i] for i in moving] if embeddings is not None else None,
+                    [documents[i] for i in moving] if documents is not None else None,
+                )
+                keep = [i for i in range(len(ids)) if i not in set(moving)]
+                ids = [ids[i] for i in keep]
+                metadatas = [metadatas[i] for i in keep]
+                embeddings = [embeddings[i] for i in keep] if embeddings is not None else None
+                documents = [documents[i] for i in keep] if documents is not None else None
+            if ids:
+                for part, group in self._group_rows(metadatas, ids=ids, embeddings=embeddings, documents=documents).items():
+                    self._collections[part].update(**group)
+            return
+        # metadata 里没有 category（如只删除某个字段）：按 id 找到所在分区
+        for part, col in self._collections.items():
+            idx = [i for i, rid in enumerate(ids) if located.get(rid) == part]
+            if not idx:
+                continue
+            kwargs = {"ids": [ids[i] for i in idx], "metadatas": [metadatas[i] for i in idx]}
+            if embeddings is not None:
+                kwargs["embeddings"] = [embeddings[i] for i in idx]
+            if documents is not None:
+                kwargs["documents"] = [documents[i] for i in idx]
+            col.update(**kwargs)
+
+    def _move(self, ids: List[str], metadatas: List[Dict], located: Dict[str, str], embeddings=None, documents=None):
+        """
+        update 改了领域：从旧分区读出原记录，按 update 的合并语义（None 表示删除字段）
+        合并 metadata，写入新分区后删除旧记录
+        """
+        rows = {}
+        for part in {located[rid] for rid in ids}:
+            part_ids = [rid for rid in ids if located[rid] == part]
+            old = self._collections[part].get(ids=part_ids, include=["embeddings", "documents", "metadatas"])
+            for j, rid in enumerate(old.get("ids") or []):
+                rows[rid] = (old["embeddings"][j], old["documents"][j], old["metadatas"][j] or {})
+
+        new_embeddings, new_documents, new_metadatas = [], [], []
+        for i, rid in enumerate(ids):
+            old_embedding, old_document, old_meta = rows[rid]
+            merged = {**old_meta, **metadatas[i]}
+            new_metadatas.append({k: v for k, v in merged.items() if v is not None})
+            new_embeddings.append(list(map(float, embeddings[i] if embeddings is not None else old_embedding)))
+            new_documents.append(documents[i] if documents is not None else old_document)
+        self.upsert(ids=ids, metadatas=new_metadatas, embeddings=new_embeddings, documents=new_documents)
+
+    def add(self, ids: List[str], metadatas: List[Dict], embeddings=None, documents=None):
+        for part, group in self._group_rows(metadatas, ids=ids, embeddings=embeddings, documents=documents).items():
+            self._collections[part].add(**group)
+
+    def delete(self, ids: List[str] = None, where: Dict = None):
+        for col in self._collections.values():
+            col.delete(ids=ids, where=where)
+
+    def _locate(self, ids: List[str]) -> Dict[str, str]:
+        located = {}
+        for part, col in self._collections.items():
+            for rid in col.get(ids=ids, include=[]).get("ids", []):
+                located[rid] = part
+        return located
+
+    # --- 读取 ---
+    def count(self) -> int:
+        return sum(col.count() for col in self._collections.values())
+
+    def get(self, ids: List[str] = None, where: Dict = None, include: List[str] = None, limit: int = None, offset: int = None):
+        """
+        按 id / where 读取，结果合并成单集合的返回格式
+
+        limit/offset 按“分区依次拼接”后的全局位置计算（用 count() 定位，适用于无 where 的全量遍历）。
+        """
+        include = ["metadatas", "documents"] if include is None else include
+        category = (where or {}).get("category")
+        cols = [self.collection_for(category)] if isinstance(category, str) else list(self._collections.values())
+
+        parts = []
+        if limit is None and not offset:
+            parts = [col.get(ids=ids, where=where, include=include) for col in cols]
+        else:
+            skip = offset or 0
+            remaining = limit
+            for col in cols:
+                size = col.count()
+                if skip >= size:
+                    skip -= size
+                    continue
+                part = col.get(ids=ids, where=where, include=include, limit=remaining, offset=skip)
+                parts.append(part)
+                skip = 0
+                if remaining is not None:
+                    remaining -= len(part.get("ids") or [])
+                    if remaining <= 0:
+                        break
+
+        merged: Dict[str, Any] = {"ids": []}
+        for key in include:
+            merged[key] = []
+        for part in parts:
+            merged["ids"].extend(part.get("ids") or [])
+            for key in include:
+                values = part.get(key)
+                if values is not None:
+                    merged[key].extend(values)
+        return merged
+
+    def query(self, query_embeddings, n_results: int = 10, where: Dict = None, include: List[str] = None):
+        """
+        向量检索：领域过滤时只查对应分区，否则并行扇出后按距离合并 Top-N
+        """
+        kwargs = {"query_embeddings": query_embeddings, "n_results": n_results}
+        if include is not None:
+            kwargs["include"] = include
+
+        category = (where or {}).get("category")
+        if isinstance(category, str):
+            # 分区本身就是过滤条件；其余 where 条件原样保留
+            rest = {k: v for k, v in where.items() if k != "category"}
+            if rest:
+                kwargs["where"] = rest
+            col = self.collection_for(category)
+            return col.query(**kwargs) if col.count() else _empty_query_result(len(query_embeddings))
+        if where:
+            kwargs["where"] = where
+
+        def run(col):
+            size = col.count()
+            if not size:
+                return None
+            return col.query(**{**kwargs, "n_results": min(n_results, size)})
+
+        parts = [p for p in self._pool.map(run, self._collections.values()) if p]
+        return _merge_query_results(parts, len(query_embeddings), n_results)
+
+
+def _empty_query_result(n_queries: int) -> Dict[str, Any]:
+    return {"ids": [[] for _ in range(n_queries)], "distances": [[] for _ in range(n_queries)],
+            "metadatas": [[] for _ in range(n_queries)], "documents": [[] for _ in range(n_queries)]}
+
+
+def _merge_query_results(parts: List[Dict[str, Any]], n_queries: int, n_results: int) -> Dict[str, Any]:
+    """合并多个分区的 query 结果：每个查询按距离升序取前 n_results"""
+    if not parts:
+        return _empty_query_result(n_queries)
+    keys = [k for k in _RESULT_KEYS if parts[0].get(k) is not None]
+    merged = {k: [] for k in keys}
+    for q in range(n_queries):
+        rows = []
+        for part in parts:
+            for i in range(len(part["ids"][q])):
+                rows.append({k: part[k][q][i] for k in keys})
+        rows.sort(key=lambda r: r["distances"])
+        rows = rows[:n_results]
+        for k in keys:
+            merged[k].append([r[k] for r in rows])
+    return merged
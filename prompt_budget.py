@@ -0,0 +1,189 @@
+import os
+import re
+import math
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# 可选：DeepSeek 分词器文件（tokenizer.json）路径，配置后按真实分词计数和截断，否则用经验值估算
+PROMPT_TOKENIZER_PATH = os.getenv("PROMPT_TOKENIZER_PATH")
+
+# 经验值（DeepSeek 文档）：1 个中文字符约 0.6 token，1 个英文字符约 0.3 token
+CJK_TOKENS_PER_CHAR = 0.6
+OTHER_TOKENS_PER_CHAR = 0.3
+
+OMISSION_MARKER = "\n\n[... {omitted} tokens omitted ...]\n\n"
+
+_CJK_RE = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]")
+
+_tokenizer = None
+_tokenizer_loaded = False
+_tokenizer_lock = threading.Lock()
+
+# 按 label 累计：prompt 数、token 数、被截断次数
+_stats: Dict[str, Dict[str, int]] = {}
+_stats_lock = threading.Lock()
+
+
+def _get_tokenizer():
+    """懒加载本地分词器；未配置或加载失败时返回 None"""
+    global _tokenizer, _tokenizer_loaded
+    if not _tokenizer_loaded:
+        with _tokenizer_lock:
+            if not _tokenizer_loaded:
+                if PROMPT_TOKENIZER_PATH:
+                    try:
+                        from tokenizers import Tokenizer
+                        _tokenizer = Tokenizer.from_file(PROMPT_TOKENIZER_PATH)
+                    except Exception as e:
+                        print(f"⚠️ Tokenizer unavailable, using estimates: {e}")
+                _tokenizer_loaded = True
+    return _tokenizer
+
+
+def _char_cost(ch: str) -> float:
+    return CJK_TOKENS_PER_CHAR if _CJK_RE.match(ch) else OTHER_TOKENS_PER_CHAR
+
+
+def count_tokens(text: str) -> int:
+    """本地计算 token 数（不发请求）"""
+    text = text or ""
+    tokenizer = _get_tokenizer()
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+    cjk = len(_CJK_RE.findall(text))
+    return math.ceil(cjk * CJK_TOKENS_PER_CHAR + (len(text) - cjk) * OTHER_TOKENS_PER_CHAR)
+
+
+def _cut_points(text: str, head_tokens: int, tail_tokens: int) -> Tuple[int, int]:
+    """返回 (head_end, tail_start) 字符位置：text[:head_end] 和 text[tail_start:] 分别不超过给定 token 数"""
+    tokenizer = _get_tokenizer()
+    if tokenizer is not None:
+        offsets = tokenizer.encode(text, add_special_tokens=False).offsets
+        head_end = offsets[head_tokens - 1][1] if head_tokens > 0 else 0
+        tail_start = offsets[len(offsets) - tail_tokens][0] if tail_tokens > 0 else len(text)
+        return head_end, tail_start
+
+    used, head_end = 0.0, 0
+    for ch in text:
+        used += _char_cost(ch)
+        if used > head_tokens:
+            break
+        head_end += 1
+    used, tail_start = 0.0, len(text)
+    for ch in reversed(text):
+        used += _char_cost(ch)
+        if used > tail_tokens:
+            break
+        tail_start -= 1
+    return head_end, tail_start
+
+
+def _snap(text: str, pos: int, forward: bool, window: int = 200) -> int:
+    """把截断点对齐到附近的换行（找不到时保持原位），避免切断段落中间的句子"""
+    if forward:
+        nl = text.find("\n", pos, pos + window)
+        return nl + 1 if nl != -1 else pos
+    nl = text.rfind("\n", max(0, pos - window), pos)
+    return nl + 1 if nl != -1 else pos
+
+
+def truncate_to_tokens(text: str, max_tokens: int, head_ratio: float = 0.7) -> str:
+    """
+    截断到 max_tokens 以内，保留开头和结尾（中间插入省略标记）
+
+    参数:
+        text: 原文
+        max_tokens: token 上限
+        head_ratio: 开头部分占的比例，其余留给结尾
+
+    返回:
+        str: 不超过 max_tokens 时原样返回
+    """
+    text = text or ""
+    total = count_tokens(text)
+    if total <= max_tokens:
+        return text
+    marker_tokens = count_tokens(OMISSION_MARKER.format(omitted=total))
+    keep = max(0, max_tokens - marker_tokens)
+    head_tokens = int(keep * head_ratio)
+    tail_tokens = keep - head_tokens
+    head_end, tail_start = _cut_points(text, head_tokens, tail_tokens)
+    head_end = _snap(text, head_end, forward=False)
+    tail_start = max(_snap(text, tail_start, forward=True), head_end)
+    head, tail = text[:head_end], text[tail_start:]
+    omitted = total - count_tokens(head) - count_tokens(tail)
+    return head + OMISSION_MARKER.format(omitted=omitted) + tail
+
+
+def _allocate(sizes: Dict[str, int], available: int, weights: Dict[str, float]) -> Dict[str, int]:
+    """按权重分配预算；短于份额的字段全额保留，剩余份额再分给其余字段"""
+    alloc: Dict[str, int] = {}
+    pending: List[str] = list(sizes)
+    while pending:
+        total_weight = sum(weights.get(k, 1.0) for k in pending)
+        shares = {k: available * weights.get(k, 1.0) / total_weight for k in pending}
+        fits = [k for k in pending if sizes[k] <= shares[k]]
+        if not fits:
+            for k in pending:
+                alloc[k] = int(shares[k])
+            break
+        for k in fits:
+            alloc[k] = sizes[k]
+            available -= sizes[k]
+            pending.remove(k)
+    return alloc
+
+
+def pack_prompt(
+    template: str,
+    budget: int,
+    *,
+    label: str = "prompt",
+    fixed: Optional[Dict[str, str]] = None,
+    weights: Optional[Dict[str, float]] = None,
+    **fields: str,
+) -> str:
+    """
+    用 str.format 填充模板，并把可截断字段压缩到总预算以内
+
+    参数:
+        template: str.format 模板（JSON 示例中的花括号写成 {{ }}）
+        budget: 整个 prompt 的输入 token 预算
+        label: 日志和统计中使用的名称
+        fixed: 不参与截断的字段（如错误上下文）
+        weights: 各可截断字段分预算时的权重，默认均分
+        **fields: 可截断字段，超出预算时保留首尾
+
+    返回:
+        str: 填充后的 prompt
+    """
+    fixed = fixed or {}
+    weights = weights or {}
+    overhead = count_tokens(template.format(**fixed, **{k: "" for k in fields}))
+    sizes = {k: count_tokens(v or "") for k, v in fields.items()}
+    available = max(0, budget - overhead)
+
+    truncated = []
+    if sum(sizes.values()) > available:
+        alloc = _allocate(sizes, available, weights)
+        for k, limit in alloc.items():
+            if sizes[k] > limit:
+                fields[k] = truncate_to_tokens(fields[k], limit)
+                truncated.append(f"{k} {sizes[k]}→{limit}")
+
+    prompt = template.format(**fixed, **fields)
+    tokens = count_tokens(prompt)
+    note = f", truncated {', '.join(truncated)}" if truncated else ""
+    print(f"📏 [{label}] {tokens} prompt tokens (budget {budget}{note})")
+    with _stats_lock:
+        entry = _stats.setdefault(label, {"prompts": 0, "tokens": 0, "truncated": 0})
+        entry["prompts"] += 1
+        entry["tokens"] += tokens
+        entry["truncated"] += bool(truncated)
+    return prompt
+
+
+def get_prompt_stats() -> Dict[str, Dict[str, int]]:
+    """各 label 累计的 prompt 数、token 数和被截断次数"""
+    with _stats_lock:
+        return {label: dict(entry) for label, entry in _stats.items()}
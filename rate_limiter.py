@@ -0,0 +1,63 @@
+import time
+import asyncio
+import threading
+
+
+class TokenBucket:
+    """
+    令牌桶限流（按每分钟 token 数），线程安全，同步和异步调用方共用同一个桶
+
+    - acquire / acquire_async：按预估用量取令牌，不够时等待补充
+    - adjust：拿到 response.usage 后按实际用量修正，允许短暂欠账（余额为负时后续请求等待）
+    """
+
+    def __init__(self, tokens_per_minute: float):
+        self.capacity = float(tokens_per_minute)
+        self.rate = self.capacity / 60.0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited_seconds = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _try_take(self, amount: float) -> float:
+        """取到令牌返回 0，否则返回还需等待的秒数"""
+        with self._lock:
+            self._refill()
+            need = min(amount, self.capacity)  # 单次请求超过桶容量时，等桶满即可放行
+            if self._tokens >= need:
+                self._tokens -= amount
+                return 0.0
+            return (need - self._tokens) / self.rate
+
+    def acquire(self, amount: float):
+        while True:
+            wait = self._try_take(amount)
+            if not wait:
+                return
+            self.waited_seconds += wait
+            time.sleep(wait)
+
+    async def acquire_async(self, amount: float):
+        while True:
+            wait = self._try_take(amount)
+            if not wait:
+                return
+            self.waited_seconds += wait
+            await asyncio.sleep(wait)
+
+    def adjust(self, delta: float):
+        """delta > 0 表示实际用量比预估多，需补扣；< 0 表示退还"""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens - delta)
+
+    @property
+    def available(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._tokens
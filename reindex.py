@@ -0,0 +1,190 @@
+"""
+从三个 Notion 数据库全量重建向量库（可断点续跑）
+
+用法:
+    python reindex.py                      # 全部数据库
+    python reindex.py --domains tech_knowledge --concurrency 4
+    python reindex.py --reset              # 忽略断点，重建全部页面（包括库中已有的）
+
+默认只补建库中缺失的页面：已有记录保存的是原始输入的全文、摘要和指纹，
+用 Notion 渲染后的正文重建会改变 content_hash 并覆盖这些字段。
+--reset 时已有页面也会重建，但沿用库中记录的摘要和指纹（find_duplicate 仍能识别原始输入）。
+
+每处理完 Notion 的一页查询结果（最多 100 行）就写一次断点文件；中断后再次运行会从
+上次的游标继续。内容未变化的页面由 add_memories 的 content_hash 跳过编码，重跑代价很低。
+"""
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List
+
+import notion_ops
+import vector_ops
+
+# 键与 workflow.KnowledgeDomain 的取值一致，写入的 category 与 node_memory_saver 相同
+DATABASES = {
+    "spanish_learning": notion_ops.DB_SPANISH_ID,
+    "tech_knowledge": notion_ops.DB_TECH_ID,
+    "humanities": notion_ops.DB_HUMANITIES_ID,
+}
+CHECKPOINT_PATH = os.path.join(vector_ops.CHROMA_PATH, "reindex_checkpoint.json")
+DEFAULT_CONCURRENCY = 3  # Notion API 限流约 3 req/s
+CARRIED_FIELDS = ("summary", "type", "simhash", "text_hash")  # --reset 重建时从已有记录沿用的 metadata
+
+
+def _load_checkpoint(path: str) -> Dict[str, Any]:
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            print(f"📌 Resuming from checkpoint: {path}")
+            return state
+        except Exception as e:
+            print(f"⚠️ Checkpoint unreadable, starting over: {e}")
+    return _new_state()
+
+
+def _new_state() -> Dict[str, Any]:
+    return {"databases": {}, "stored": 0, "unchanged": 0, "skipped": 0, "failed": []}
+
+
+def _save_checkpoint(path: str, state: Dict[str, Any]):
+    """先写临时文件再替换，避免中断时留下半个 JSON"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def _count_pages(db_id: str) -> int:
+    """只翻页不读正文，统计数据库行数（用于估算 ETA）"""
+    return sum(len(pages) for pages, _ in notion_ops.iter_database_pages(db_id))
+
+
+def _page_to_memory(page: dict, domain: str, stored: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    读取页面正文，转成 add_memories 需要的字典
+
+    参数:
+        stored: 库中已有记录的 metadata，其中的摘要和指纹字段会沿用
+    """
+    url_prop = page.get("properties", {}).get("URL") or {}
+    metadata = {"url": url_prop.get("url") or page.get("url", "")}
+    for field in CARRIED_FIELDS:
+        if stored and stored.get(field):
+            metadata[field] = stored[field]
+    return {
+        "page_id": page["id"],
+        "content": notion_ops.get_page_text(page["id"]),
+        "title": notion_ops.get_page_title(page) or "Untitled",
+        "category": domain,
+        "metadata": metadata,
+    }
+
+
+def reindex(
+    domains: Optional[List[str]] = None,
+    *,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    checkpoint_path: str = CHECKPOINT_PATH,
+    reset: bool = False,
+    count_first: bool = True,
+    chunked: Optional[bool] = None,
+) -> Dict[str, Any]:
+    """
+    全量重建向量库
+
+    参数:
+        domains: 要处理的领域（DATABASES 的键），None 表示全部
+        concurrency: 并发读取页面正文的线程数
+        checkpoint_path: 断点文件路径
+        reset: 忽略已有断点，并重建库中已有的页面（沿用其摘要和指纹）；默认只补建缺失的页面
+        count_first: 先统计总行数以显示 ETA
+        chunked: 是否分块索引（默认取 vector_ops.CHUNKING_ENABLED）
+
+    返回:
+        dict: 断点状态（含 stored / unchanged / skipped / failed 汇总）
+    """
+    state = _new_state() if reset else _load_checkpoint(checkpoint_path)
+    state.setdefault("skipped", 0)
+    targets = {d: db for d, db in DATABASES.items() if (not domains or d in domains)}
+    for domain, db_id in targets.items():
+        if not db_id:
+            print(f"⚠️ Database for {domain} is not configured, skipped.")
+    targets = {d: db for d, db in targets.items() if db}
+
+    total = None
+    if count_first:
+        total = 0
+        for domain, db_id in targets.items():
+            total += _count_pages(db_id)
+        print(f"📊 {total} pages in {len(targets)} databases.")
+
+    existing = set(vector_ops.list_memory_ids())
+    print(f"📚 {len(existing)} pages already in the vector store" + (" (will be rebuilt)." if reset else " (skipped)."))
+
+    already = sum(state["databases"].get(d, {}).get("pages", 0) for d in targets)
+    processed = 0
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for domain, db_id in targets.items():
+            entry = state["databases"].setdefault(domain, {"cursor": None, "pages": 0, "done": False})
+            if entry["done"]:
+                continue
+            print(f"🗂️ Reindexing {domain} ...")
+
+            for pages, next_cursor in notion_ops.iter_database_pages(db_id, entry["cursor"]):
+                todo = [p for p in pages if reset or p["id"] not in existing]
+                state["skipped"] += len(pages) - len(todo)
+                if todo:
+                    stored = vector_ops.get_memory_metadata([p["id"] for p in todo if p["id"] in existing])
+                    memories = list(pool.map(lambda p: _page_to_memory(p, domain, stored.get(p["id"])), todo))
+                    result = vector_ops.add_memories(memories, chunked=chunked)
+                    state["stored"] += result["stored"]
+                    state["unchanged"] += result["unchanged"]
+                    state["failed"].extend(result["failed"])
+                entry["pages"] += len(pages)
+                entry["cursor"] = next_cursor
+                entry["done"] = next_cursor is None
+                _save_checkpoint(checkpoint_path, state)
+
+                processed += len(pages)
+                elapsed = time.perf_counter() - started
+                rate = processed / elapsed if elapsed > 0 else 0.0
+                progress = f"{already + processed}" + (f"/{total}" if total else "")
+                eta = ""
+                if total and rate > 0:
+                    eta = f", ETA {max(0, total - already - processed) / rate / 60:.1f} min"
+                print(f"⏩ {progress} pages ({rate:.1f} pages/sec{eta})")
+
+    if all(state["databases"].get(d, {}).get("done") for d in targets):
+        # 全部完成：删除断点，下次运行即为新的全量重建
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        print(
+            f"✅ Reindex complete: {state['stored']} stored, {state['unchanged']} unchanged, {state['skipped']} skipped, "
+            f"{len(state['failed'])} failed."
+        )
+    return state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the vector store from Notion databases")
+    parser.add_argument("--domains", nargs="*", choices=list(DATABASES), help="limit to these domains")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--reset", action="store_true", help="ignore the checkpoint and rebuild pages that are already stored")
+    parser.add_argument("--no-count", action="store_true", help="skip the counting pass (no ETA)")
+    parser.add_argument("--chunked", action="store_true", default=None, help="also index passages of long notes")
+    args = parser.parse_args()
+
+    reindex(
+        args.domains,
+        concurrency=args.concurrency,
+        reset=args.reset,
+        count_first=not args.no_count,
+        chunked=args.chunked,
+    )
@@ -0,0 +1,288 @@
+import time
+import random
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import openai
+
+# 可重试的错误类型；其中只有 UNHEALTHY 计入熔断（429 是配额问题，按 Retry-After 退避即可）
+RETRYABLE = ("rate_limit", "timeout", "connection", "server")
+UNHEALTHY = ("timeout", "connection", "server")
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，请求未发出"""
+
+
+class DeadlineExceeded(Exception):
+    """整次调用（含重试和退避）超过截止时间"""
+
+
+def classify_error(exc: BaseException) -> str:
+    """
+    错误分类
+
+    返回:
+        str: rate_limit | timeout | connection | server | client（4xx，重试无意义）| other
+    """
+    if isinstance(exc, openai.RateLimitError):
+        return "rate_limit"
+    if isinstance(exc, (openai.APITimeoutError, TimeoutError, asyncio.TimeoutError)):
+        return "timeout"
+    if isinstance(exc, openai.APIConnectionError):
+        return "connection"
+    if isinstance(exc, openai.APIStatusError):
+        if exc.status_code >= 500 or exc.status_code in (408, 409):
+            return "server"
+        return "client"
+    return "other"
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """从响应头读取服务端建议的等待时间（retry-after-ms / retry-after 秒数或 HTTP 日期）"""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return max(0.0, float(headers["retry-after-ms"]) / 1000)
+    except ValueError:
+        pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+
+class RetryPolicy:
+    """指数退避 + full jitter；服务端给出 Retry-After 时以它为准（加少量抖动，避免同时醒来）"""
+
+    def __init__(self, max_retries: int = 3, base_delay: float = 1.0, max_delay: float = 30.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, exc: BaseException) -> float:
+        hinted = retry_after_seconds(exc)
+        if hinted is not None:
+            return hinted * random.uniform(1.0, 1.1)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    熔断器（closed -> open -> half_open -> closed）
+
+    - 连续 failure_threshold 次"服务端不健康"的失败后打开，recovery_seconds 内的调用直接拒绝
+    - 冷却结束后放行一个探测请求：成功则关闭，失败则重新打开
+    - 服务端有正常应答（包括 4xx / 429）即视为健康
+    """
+
+    def __init__(self, failure_threshold: int = 5, recovery_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self._state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self.times_opened = 0
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == "closed":
+                return True
+            if self._state == "open" and time.monotonic() - self._opened_at >= self.recovery_seconds:
+                self._state = "half_open"
+                self._probing = False
+            if self._state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = "closed"
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == "half_open" or self._failures >= self.failure_threshold:
+                if self._state != "open":
+                    self.times_opened += 1
+                    print(f"⛔ Circuit opened after {self._failures} consecutive failures.")
+                self._state = "open"
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == "open" and time.monotonic() - self._opened_at >= self.recovery_seconds:
+                return "half_open"
+            return self._state
+
+
+class RetryStats:
+    """重试指标：added_latency_seconds = 被重试的失败请求耗时 + 退避等待"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.retries_by_kind: Dict[str, int] = {}
+        self.backoff_seconds = 0.0
+        self.failed_attempt_seconds = 0.0
+        self.gave_up = 0
+        self.deadline_exceeded = 0
+        self.circuit_rejected = 0
+        self.fallbacks = 0
+
+    def add(self, **deltas):
+        with self._lock:
+            for field, delta in deltas.items():
+                setattr(self, field, getattr(self, field) + delta)
+
+    def add_retry(self, kind: str, failed_seconds: float, wait: float):
+        with self._lock:
+            self.retries += 1
+            self.retries_by_kind[kind] = self.retries_by_kind.get(kind, 0) + 1
+            self.failed_attempt_seconds += failed_seconds
+            self.backoff_seconds += wait
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "attempts": self.attempts,
+                "retries": self.retries,
+                "retries_by_kind": dict(self.retries_by_kind),
+                "backoff_seconds": round(self.backoff_seconds, 3),
+                "added_latency_seconds": round(self.backoff_seconds + self.failed_attempt_seconds, 3),
+                "gave_up": self.gave_up,
+                "deadline_exceeded": self.deadline_exceeded,
+                "circuit_rejected": self.circuit_rejected,
+                "fallbacks": self.fallbacks,
+            }
+
+
+def _before_attempt(breaker: Optional[CircuitBreaker], deadline: Optional[float], stats: Optional[RetryStats]) -> Optional[float]:
+    """检查熔断和截止时间，返回本次尝试的超时（秒）"""
+    if breaker is not None and not breaker.allow():
+        if stats:
+            stats.add(circuit_rejected=1)
+        raise CircuitOpenError("circuit open")
+    timeout = None
+    if deadline is not None:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            if stats:
+                stats.add(deadline_exceeded=1)
+            raise DeadlineExceeded("deadline exceeded before the request was sent")
+    if stats:
+        stats.add(attempts=1)
+    return timeout
+
+
+def _after_failure(exc, attempt, started, policy, breaker, deadline, stats, on_retry) -> float:
+    """记录一次失败；不应重试时重新抛出，否则返回退避秒数"""
+    kind = classify_error(exc)
+    if breaker is not None:
+        if kind in UNHEALTHY:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+    if kind not in RETRYABLE:
+        raise exc
+    if attempt >= policy.max_retries:
+        if stats:
+            stats.add(gave_up=1)
+        raise exc
+    wait = policy.delay(attempt, exc)
+    now = time.monotonic()
+    if deadline is not None and now + wait >= deadline:
+        if stats:
+            stats.add(deadline_exceeded=1)
+        raise DeadlineExceeded(f"no time left to retry after {kind}: {exc}") from exc
+    if stats:
+        stats.add_retry(kind, now - started, wait)
+    if on_retry is not None:
+        on_retry(kind, wait)
+    print(f"🔁 {kind} ({type(exc).__name__}), retry {attempt + 1}/{policy.max_retries} in {wait:.1f}s")
+    return wait
+
+
+def call_with_retry(
+    fn: Callable[[Optional[float]], Any],
+    *,
+    policy: RetryPolicy,
+    breaker: Optional[CircuitBreaker] = None,
+    deadline: Optional[float] = None,
+    stats: Optional[RetryStats] = None,
+    on_retry: Optional[Callable[[str, float], None]] = None,
+):
+    """
+    带重试执行 fn(timeout)
+
+    参数:
+        fn: 执行一次请求，timeout 为本次尝试可用的秒数（无截止时间时为 None）
+        deadline: time.monotonic() 时刻的截止时间，None 表示不限
+        on_retry: 每次决定重试时回调 on_retry(错误类型, 退避秒数)，用于单次调用的统计
+
+    异常:
+        CircuitOpenError / DeadlineExceeded，或最后一次失败的原始异常
+    """
+    if stats:
+        stats.add(calls=1)
+    attempt = 0
+    while True:
+        timeout = _before_attempt(breaker, deadline, stats)
+        started = time.monotonic()
+        try:
+            result = fn(timeout)
+        except Exception as exc:
+            time.sleep(_after_failure(exc, attempt, started, policy, breaker, deadline, stats, on_retry))
+            attempt += 1
+            continue
+        if breaker is not None:
+            breaker.record_success()
+        return result
+
+
+async def call_with_retry_async(
+    fn: Callable[[Optional[float]], Awaitable[Any]],
+    *,
+    policy: RetryPolicy,
+    breaker: Optional[CircuitBreaker] = None,
+    deadline: Optional[float] = None,
+    stats: Optional[RetryStats] = None,
+    on_retry: Optional[Callable[[str, float], None]] = None,
+):
+    """call_with_retry 的异步版本"""
+    if stats:
+        stats.add(calls=1)
+    attempt = 0
+    while True:
+        timeout = _before_attempt(breaker, deadline, stats)
+        started = time.monotonic()
+        try:
+            result = await fn(timeout)
+        except Exception as exc:
+            await asyncio.sleep(_after_failure(exc, attempt, started, policy, breaker, deadline, stats, on_retry))
+            attempt += 1
+            continue
+        if breaker is not None:
+            breaker.record_success()
+        return result
@@ -0,0 +1,123 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Optional, Dict, Any
+
+
+class ResponseCache:
+    """
+    LLM 响应的持久缓存（SQLite），带 TTL 和 LRU 容量淘汰
+
+    键为请求参数（模型、messages、temperature、max_tokens 等）序列化后的哈希，
+    任何一个采样参数变化都会落到不同的键上。
+    """
+
+    def __init__(self, path: str, *, ttl_seconds: float = 7 * 24 * 3600, max_entries: int = 2000, max_bytes: int = 200 * 1024 * 1024):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, value TEXT, size INTEGER, created REAL, accessed REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._db.commit()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.by_model: Dict[str, Dict[str, int]] = {}
+
+    @staticmethod
+    def make_key(request: Dict[str, Any]) -> str:
+        """请求参数 -> 缓存键（流式相关参数不影响结果，不参与计算）"""
+        params = {k: v for k, v in request.items() if k not in ("stream", "stream_options")}
+        return hashlib.sha256(json.dumps(params, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def _count(self, model: str, field: str):
+        counters = self.by_model.setdefault(model, {"hits": 0, "misses": 0})
+        counters[field] += 1
+
+    def get(self, request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        key = self.make_key(request)
+        model = request.get("model", "")
+        now = time.time()
+        with self._lock:
+            try:
+                row = self._db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+                if row and now - row[1] > self.ttl_seconds:
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+                    self.expired += 1
+                    row = None
+                if row:
+                    self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                    self.hits += 1
+                    self._count(model, "hits")
+                    return json.loads(row[0])
+            except Exception as e:
+                print(f"⚠️ LLM cache read failed: {e}")
+            self.misses += 1
+            self._count(model, "misses")
+            return None
+
+    def put(self, request: Dict[str, Any], value: Dict[str, Any]):
+        key = self.make_key(request)
+        data = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, model, value, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, request.get("model", ""), data, len(data.encode("utf-8")), now, now),
+                )
+                self._evict(now)
+                self._db.commit()
+            except Exception as e:
+                print(f"⚠️ LLM cache write failed: {e}")
+
+    def _evict(self, now: float):
+        """先删过期条目，再按最近访问时间淘汰超出条数/容量上限的部分"""
+        self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+        self._db.execute(
+            "DELETE FROM responses WHERE key IN ("
+            "SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total > self.max_bytes:
+            freed = 0
+            victims = []
+            for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY accessed ASC"):
+                if total - freed <= self.max_bytes:
+                    break
+                victims.append((key,))
+                freed += size
+            self._db.executemany("DELETE FROM responses WHERE key = ?", victims)
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries,
+            "bytes": size,
+            "by_model": {
+                model: {**c, "hit_rate": c["hits"] / (c["hits"] + c["misses"]) if c["hits"] + c["misses"] else 0.0}
+                for model, c in self.by_model.items()
+            },
+        }
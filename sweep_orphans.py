@@ -0,0 +1,181 @@
+"""
+清理孤儿向量：Notion 中已删除/归档的页面，其记忆也从向量库中删除
+
+用法:
+    python sweep_orphans.py                          # 全量比对，只报告（dry-run）
+    python sweep_orphans.py --apply                  # 全量比对并删除
+    python sweep_orphans.py --incremental --limit 200 --apply          # 逐页核对一小批，游标轮转
+    python sweep_orphans.py --incremental --apply --every 60           # 每 60 分钟跑一次增量核对
+
+全量模式批量列出三个数据库的在用页面 ID，与向量库的页面 ID 做差集。比对用全部数据库的并集，
+不看记录中的 category（分类被移动过的页面在另一个数据库里仍然在用）。有数据库未配置时，
+不在并集中的记录改为逐页核对；有数据库列举失败时拒绝 --apply，避免按不完整的列表误删。增量模式每次按游标逐页查询一小批记录
+（404 / 已归档即为孤儿），适合定时运行；状态查询失败（限流、网络）的页面不会被删除。
+"""
+import os
+import json
+import time
+import argparse
+from typing import Dict, Any, List
+
+import notion_ops
+import vector_ops
+from reindex import DATABASES
+
+STATE_PATH = os.path.join(vector_ops.CHROMA_PATH, "orphan_sweep_state.json")
+DELETE_BATCH_SIZE = 100
+MAX_ORPHAN_RATIO = 0.5       # 孤儿比例超过该值时拒绝删除（多半是配置错误），除非 --force
+NOTION_REQUEST_INTERVAL = 0.35  # 逐页核对时的请求间隔（Notion 限流约 3 req/s）
+
+
+def _normalize_id(page_id: str) -> str:
+    return page_id.replace("-", "").lower()
+
+
+def _check_pages(page_ids: List[str]) -> Dict[str, str]:
+    """逐页查询状态，返回 {page_id: live|archived|missing|error}"""
+    statuses = {}
+    for page_id in page_ids:
+        statuses[page_id] = notion_ops.get_page_status(page_id)
+        time.sleep(NOTION_REQUEST_INTERVAL)
+    return statuses
+
+
+def _delete(orphans: List[str], total: int, dry_run: bool, force: bool) -> int:
+    if not orphans:
+        print("✅ No orphans found.")
+        return 0
+    if dry_run:
+        print(f"🧪 Dry run: {len(orphans)} orphans would be deleted.")
+        return 0
+    if total and len(orphans) / total > MAX_ORPHAN_RATIO and not force:
+        print(
+            f"🛑 {len(orphans)}/{total} records look orphaned, which is above {MAX_ORPHAN_RATIO:.0%}; "
+            f"check the database configuration or pass --force."
+        )
+        return 0
+    deleted = vector_ops.delete_memories(orphans, batch_size=DELETE_BATCH_SIZE)
+    print(f"🧹 Deleted {deleted} orphaned memories.")
+    return deleted
+
+
+def sweep(dry_run: bool = True, force: bool = False) -> Dict[str, Any]:
+    """
+    全量比对：批量列出 Notion 在用页面，与向量库做差集
+
+    返回:
+        dict: {"checked", "orphans", "unknown", "deleted"}；有数据库列举失败时还带 "failed_domains"
+    """
+    stored = vector_ops.list_memory_ids()
+    print(f"📚 {len(stored)} pages in the vector store.")
+
+    listed_domains, failed_domains = set(), []
+    live = set()
+    for domain, db_id in DATABASES.items():
+        if not db_id:
+            continue
+        try:
+            for pages, _ in notion_ops.iter_database_pages(db_id):
+                live.update(_normalize_id(p["id"]) for p in pages)
+            listed_domains.add(domain)
+        except Exception as e:
+            failed_domains.append(domain)
+            print(f"⚠️ Failed to list {domain}: {e}")
+    print(f"🌐 {len(live)} live pages in {len(listed_domains)} databases.")
+
+    if failed_domains and not dry_run:
+        print(f"🛑 Listing failed for {', '.join(failed_domains)}; refusing to delete based on a partial sweep.")
+        return {"checked": len(stored), "orphans": [], "unknown": [], "deleted": 0, "failed_domains": failed_domains}
+
+    # 全部数据库都列举成功时，不在并集中即为孤儿；否则页面可能在未列举的数据库里，逐页核对
+    complete = listed_domains == set(DATABASES)
+    orphans, to_check = [], []
+    for page_id in stored:
+        if _normalize_id(page_id) in live:
+            continue
+        if complete:
+            orphans.append(page_id)
+        else:
+            to_check.append(page_id)
+
+    unknown = []
+    if to_check:
+        print(f"🔎 Checking {len(to_check)} pages not found in the listed databases one by one...")
+        for page_id, status in _check_pages(to_check).items():
+            if status in ("missing", "archived"):
+                orphans.append(page_id)
+            elif status == "error":
+                unknown.append(page_id)
+
+    for page_id in orphans:
+        print(f"   - orphan: {page_id} ({stored[page_id]})")
+    deleted = _delete(orphans, len(stored), dry_run, force)
+    result = {"checked": len(stored), "orphans": orphans, "unknown": unknown, "deleted": deleted}
+    if failed_domains:
+        result["failed_domains"] = failed_domains
+    return result
+
+
+def _load_state(path: str) -> Dict[str, Any]:
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"⚠️ Sweep state unreadable, starting over: {e}")
+    return {"cursor": None}
+
+
+def _save_state(path: str, state: Dict[str, Any]):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def sweep_incremental(limit: int = 200, dry_run: bool = True, state_path: str = STATE_PATH) -> Dict[str, Any]:
+    """
+    增量核对：按 page_id 排序，从上次的游标开始逐页查询 limit 条，到末尾后从头轮转
+
+    返回:
+        dict: {"checked", "orphans", "unknown", "deleted", "cursor"}
+    """
+    state = _load_state(state_path)
+    ids = sorted(vector_ops.list_memory_ids())
+    cursor = state.get("cursor")
+    start = next((i for i, page_id in enumerate(ids) if cursor is None or page_id > cursor), 0)
+    batch = (ids[start:] + ids[:start])[:limit]
+
+    statuses = _check_pages(batch)
+    orphans = [p for p, s in statuses.items() if s in ("missing", "archived")]
+    unknown = [p for p, s in statuses.items() if s == "error"]
+    for page_id in orphans:
+        print(f"   - orphan: {page_id} ({statuses[page_id]})")
+    # 逐页确认过的孤儿不受比例保护限制
+    deleted = _delete(orphans, 0, dry_run, force=True)
+
+    state["cursor"] = batch[-1] if batch else None
+    state["last_run"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    _save_state(state_path, state)
+    print(f"⏩ Checked {len(batch)}/{len(ids)} pages, {len(orphans)} orphans, {len(unknown)} unknown.")
+    return {"checked": len(batch), "orphans": orphans, "unknown": unknown, "deleted": deleted, "cursor": state["cursor"]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delete vectors of Notion pages that no longer exist")
+    parser.add_argument("--apply", action="store_true", help="actually delete (default is a dry run)")
+    parser.add_argument("--force", action="store_true", help="delete even if the orphan ratio looks suspicious")
+    parser.add_argument("--incremental", action="store_true", help="check a rotating slice page by page")
+    parser.add_argument("--limit", type=int, default=200, help="pages per incremental run")
+    parser.add_argument("--every", type=float, help="repeat every N minutes")
+    args = parser.parse_args()
+
+    while True:
+        if args.incremental:
+            sweep_incremental(args.limit, dry_run=not args.apply)
+        else:
+            sweep(dry_run=not args.apply, force=args.force)
+        if not args.every:
+            break
+        time.sleep(args.every * 60)
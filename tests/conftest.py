@@ -0,0 +1,28 @@
+import os
+import sys
+
+# 测试全部离线运行：LLM 走回放客户端，不需要 API Key
+os.environ.setdefault("LLM_MODE", "replay")
+os.environ.setdefault("LLM_REPLAY_LATENCY", "0")
+os.environ.setdefault("LLM_CACHE", "false")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import vector_ops
+from bench_vector import StubEmbedder, _isolated_store
+
+
+@pytest.fixture
+def store(tmp_path):
+    """临时目录中的单集合向量库（确定性 stub 编码器）"""
+    with _isolated_store(str(tmp_path), StubEmbedder(), partitioned=False):
+        yield vector_ops
+
+
+@pytest.fixture
+def partitioned_store(tmp_path):
+    """临时目录中的按领域分区向量库"""
+    with _isolated_store(str(tmp_path), StubEmbedder(), partitioned=True):
+        yield vector_ops
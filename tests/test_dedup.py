@@ -0,0 +1,41 @@
+import pytest
+
+NOTE = "Gradient descent updates parameters in the direction of the negative gradient. " * 5
+
+
+def test_find_duplicate_matches_saved_note(store):
+    store.add_memory(page_id="page-1", content=NOTE, title="GD", category="tech_knowledge")
+    found = store.find_duplicate(NOTE)
+    assert found["match"] and found["exact"]
+    assert found["page_id"] == "page-1"
+    assert found["title"] == "GD"
+
+
+def test_find_duplicate_drops_stale_fingerprint(store):
+    store.add_memory(page_id="page-1", content=NOTE, title="GD", category="tech_knowledge")
+    store.get_fingerprint_index()
+    # 另一个进程（sweep_orphans / reindex）直接删除了记录，本进程的指纹索引不知情
+    store.get_collection().delete(ids=["page-1"])
+
+    assert store.find_duplicate(NOTE) == {"match": False}
+    assert len(store.get_fingerprint_index()) == 0
+
+
+def test_dedup_result_does_not_leak_into_next_run(store, monkeypatch):
+    pytest.importorskip("langgraph")
+    import workflow
+
+    duplicate = {"match": True, "duplicate": True, "exact": True, "page_id": "page-1", "title": "GD"}
+    monkeypatch.setattr(store, "find_duplicate", lambda text: duplicate)
+    state = {"raw_text": NOTE, "user_mode_override": "auto"}
+    state.update(workflow.node_dedup_check(state))
+    assert workflow.route_after_dedup(state) == "duplicate"
+
+    # 同一线程的下一次输入：检查点里还有上一次的结果
+    monkeypatch.setattr(store, "find_duplicate", lambda text: {"match": False})
+    state.update(workflow.node_dedup_check({**state, "raw_text": "something new " * 30}))
+    assert workflow.route_after_dedup(state) == "analyze"
+
+    state["dedup"] = duplicate
+    state.update(workflow.node_dedup_check({**state, "user_mode_override": "query_knowledge"}))
+    assert workflow.route_after_dedup(state) == "analyze"
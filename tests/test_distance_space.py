@@ -0,0 +1,30 @@
+import pytest
+
+import vector_ops
+from bench_vector import StubEmbedder, _isolated_store
+
+NOTES = {
+    "p-attn": "Transformers use self-attention to relate every token to every other token.",
+    "p-cook": "Braise the beef slowly with onions, garlic and red wine for three hours.",
+    "p-rome": "The Roman republic fell after decades of civil war and political violence.",
+}
+
+
+def _distances(tmp_path, space, monkeypatch):
+    monkeypatch.setattr(vector_ops, "HNSW_SPACE", space)
+    with _isolated_store(str(tmp_path / space), StubEmbedder(), partitioned=False):
+        for page_id, text in NOTES.items():
+            vector_ops.add_memory(page_id=page_id, content=text, title=page_id, category="tech_knowledge")
+        monkeypatch.setattr(vector_ops, "HNSW_SPACE", "l2")  # 已建好的集合以实际距离空间为准
+        hits = vector_ops.search_memories("self-attention over tokens", threshold=None, mode="dense")
+        return {h["page_id"]: h["distance"] for h in hits}
+
+
+@pytest.mark.parametrize("space", ["cosine", "ip"])
+def test_distances_share_the_l2_scale(tmp_path, monkeypatch, space):
+    reference = _distances(tmp_path, "l2", monkeypatch)
+    other = _distances(tmp_path, space, monkeypatch)
+
+    assert other.keys() == reference.keys()
+    for page_id, dist in reference.items():
+        assert other[page_id] == pytest.approx(dist, abs=1e-4)
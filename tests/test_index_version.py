@@ -0,0 +1,45 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NOTE = "Gradient descent updates parameters in the direction of the negative gradient. " * 5
+OTHER = "Photosynthesis converts light energy into chemical energy stored in glucose. " * 5
+
+
+def _run_elsewhere(path, code):
+    """在独立进程中对同一个库执行维护操作（模拟 reindex.py / sweep_orphans.py）"""
+    script = textwrap.dedent(f"""
+        import vector_ops
+        from bench_vector import StubEmbedder, _isolated_store
+        with _isolated_store({str(path)!r}, StubEmbedder(), partitioned=False):
+        """) + textwrap.indent(textwrap.dedent(code), "    ")
+    subprocess.run([sys.executable, "-c", script], cwd=ROOT, check=True, capture_output=True,
+                   env={**os.environ, "PYTHONPATH": ROOT})
+
+
+def test_own_writes_keep_indexes(store):
+    store.add_memory(page_id="page-1", content=NOTE, title="GD", category="tech_knowledge")
+    lexical, fingerprints = store.get_lexical_index(), store.get_fingerprint_index()
+
+    store.add_memory(page_id="page-2", content=OTHER, title="Plants", category="tech_knowledge")
+
+    assert store.get_lexical_index() is lexical
+    assert store.get_fingerprint_index() is fingerprints
+    assert len(fingerprints) == 2
+
+
+def test_indexes_rebuild_after_out_of_process_maintenance(store, tmp_path):
+    store.add_memory(page_id="page-1", content=NOTE, title="GD", category="tech_knowledge")
+    assert store.find_duplicate(NOTE)["match"]
+    assert store.search_memories("gradient descent", mode="lexical", threshold=None)
+
+    _run_elsewhere(tmp_path, """
+        vector_ops.delete_memories(["page-1"])
+        vector_ops.add_memory(page_id="page-2", content=%r, title="Plants", category="tech_knowledge")
+    """ % OTHER)
+
+    assert store.search_memories("gradient descent", mode="lexical", threshold=None) == []
+    assert [h["page_id"] for h in store.search_memories("photosynthesis glucose", mode="lexical", threshold=None)] == ["page-2"]
+    assert store.find_duplicate(OTHER)["page_id"] == "page-2"
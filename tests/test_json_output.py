@@ -0,0 +1,41 @@
+import json
+
+import agents
+from json_output import extract_json, parse_json_output
+
+DRAFT = {"title": "Attention", "summary": "s", "markdown_body": "# Attention\n\nFull body.", "tags": ["ml"]}
+
+
+def test_fences_and_trailing_commas_are_repaired():
+    obj, status = extract_json('```json\n{"title": "T", "tags": ["a", "b",],}\n```')
+    assert status in ("ok", "repaired")
+    assert obj == {"title": "T", "tags": ["a", "b"]}
+
+
+def test_truncated_output_is_reported_and_rejected():
+    text = json.dumps(DRAFT)[:-25]
+    obj, status = extract_json(text)
+    assert status == "truncated"
+    assert parse_json_output(text, "test") is None
+
+
+def test_draft_content_regenerates_truncated_draft(monkeypatch):
+    calls = []
+    outputs = [json.dumps(DRAFT)[:-25], json.dumps(DRAFT)]
+
+    def fake_routed_completion(prompt, **kwargs):
+        calls.append((prompt, kwargs["attempt"]))
+        return outputs[len(calls) - 1], ""
+
+    monkeypatch.setattr(agents, "routed_completion", fake_routed_completion)
+    draft = agents.ResearcherAgent().draft_content("Attention is all you need. " * 20, "Tech")
+
+    assert draft["markdown_body"] == DRAFT["markdown_body"]
+    assert [attempt for _, attempt in calls] == [0, 1]
+    assert "cut off by the length limit" in calls[1][0]
+
+
+def test_merge_content_returns_none_instead_of_truncated_merge(monkeypatch):
+    truncated = json.dumps(DRAFT)[:-25]
+    monkeypatch.setattr(agents, "routed_completion", lambda prompt, **kwargs: (truncated, ""))
+    assert agents.ResearcherAgent().merge_content("old note", "new input") is None
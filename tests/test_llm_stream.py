@@ -0,0 +1,46 @@
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+import llm_client
+import llm_telemetry
+import resilience
+
+
+def _chunk(content):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content, reasoning_content=None))], usage=None)
+
+
+@pytest.fixture
+def flaky_stream(monkeypatch):
+    """第一次连接失败，之后返回三段内容；记录退避等待时空闲的并发槽位数"""
+    free_slots = []
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 1:
+            raise openai.APIConnectionError(request=httpx.Request("POST", "http://test"))
+        return iter([_chunk("a"), _chunk("b"), _chunk("c")])
+
+    original = llm_client.client
+    llm_client.set_client(SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+    monkeypatch.setattr(resilience.time, "sleep", lambda seconds: free_slots.append(llm_client._sync_slots._value))
+    yield free_slots
+    llm_client.set_client(original)
+
+
+def test_stream_releases_slot_during_backoff_and_after_early_stop(flaky_stream):
+    capacity = llm_client._sync_slots._value
+    with llm_telemetry.telemetry_scope(run_id="stream-test"):
+        stream = llm_client.stream_reasoning_completion("prompt")
+        assert next(stream) == ("content", "a")
+        stream.close()
+
+    # 退避期间不占槽位
+    assert flaky_stream == [capacity]
+    assert llm_client._sync_slots._value == capacity
+    records = llm_telemetry.get_records(run_id="stream-test")
+    assert [(r["status"], r["retries"]) for r in records] == [("cancelled", 1)]
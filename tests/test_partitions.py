@@ -0,0 +1,41 @@
+NOTE = "\n\n".join(
+    f"Paragraph {i}: transformers use self-attention to relate every token to every other token in the sequence."
+    * 4
+    for i in range(12)
+)
+
+
+def _partition_ids(store, partition):
+    col = store.get_collection().collections()[partition]
+    return set(col.get(include=[]).get("ids") or [])
+
+
+def test_category_move_takes_chunks_along(partitioned_store):
+    store = partitioned_store
+    store.add_memory(page_id="page-1", content=NOTE, title="Attention", category="tech_knowledge", chunked=True)
+    chunks = {i for i in _partition_ids(store, "tech_knowledge") if i != "page-1"}
+    assert chunks
+
+    store.add_memory(page_id="page-1", content=NOTE, title="Attention", category="humanities", chunked=True)
+
+    assert _partition_ids(store, "tech_knowledge") == set()
+    assert _partition_ids(store, "humanities") == {"page-1"} | chunks
+    metas = store.get_collection().get(ids=sorted(chunks), include=["metadatas"])["metadatas"]
+    assert {m["category"] for m in metas} == {"humanities"}
+    hits = store.search_memories("self-attention tokens", category_filter="tech_knowledge", threshold=None)
+    assert hits == []
+
+
+def test_update_with_new_category_moves_record(partitioned_store):
+    collection = partitioned_store.get_collection()
+    collection.upsert(
+        ids=["r1"], embeddings=[[0.1, 0.2, 0.3]], documents=["doc"],
+        metadatas=[{"category": "tech_knowledge", "title": "T", "stale": "x"}],
+    )
+    collection.update(ids=["r1"], metadatas=[{"category": "humanities", "stale": None}])
+
+    assert _partition_ids(partitioned_store, "tech_knowledge") == set()
+    moved = collection.collections()["humanities"].get(ids=["r1"], include=["metadatas", "documents", "embeddings"])
+    assert moved["metadatas"][0] == {"category": "humanities", "title": "T"}
+    assert moved["documents"] == ["doc"]
+    assert [round(float(v), 3) for v in moved["embeddings"][0]] == [0.1, 0.2, 0.3]
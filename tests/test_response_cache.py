@@ -0,0 +1,48 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import llm_client
+from response_cache import ResponseCache
+
+DRAFT = json.dumps({"title": "T", "summary": "s", "markdown_body": "# T\n\nBody text.", "tags": []})
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path / "llm_cache.sqlite"), ttl_seconds=3600, max_entries=100, max_bytes=1 << 20)
+    monkeypatch.setattr(llm_client, "get_response_cache", lambda: cache)
+    return cache
+
+
+@pytest.fixture
+def reply(monkeypatch):
+    """让底层客户端依次返回给定的回答"""
+    outputs = []
+
+    def create(**kwargs):
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=outputs.pop(0)))], usage=None)
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    original = llm_client.client
+    llm_client.set_client(client)
+    yield outputs
+    llm_client.set_client(original)
+
+
+@pytest.mark.parametrize("content", [DRAFT[:-20], DRAFT.replace('"tags": []', '"tags": [],'), "not json"])
+def test_json_mode_does_not_cache_broken_output(cache, reply, content):
+    reply.extend([content, DRAFT])
+    assert llm_client.get_completion("draft json", json_mode=True) == content
+    # 同一输入再次提交：重新生成，而不是重放坏结果
+    assert llm_client.get_completion("draft json", json_mode=True) == DRAFT
+    assert llm_client.get_completion("draft json", json_mode=True) == DRAFT
+    assert reply == []
+
+
+def test_plain_text_is_cached(cache, reply):
+    reply.append("plain answer")
+    assert llm_client.get_completion("question") == "plain answer"
+    assert llm_client.get_completion("question") == "plain answer"
+    assert cache.stats()["hits"] == 1
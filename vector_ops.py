@@ -1,43 +1,576 @@
 import os
-import chromadb
-from chromadb.utils import embedding_functions
+import time
+import uuid
+import argparse
+import hashlib
+import threading
+from itertools import islice
 from dotenv import load_dotenv
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterable, List, Tuple
+
+from embedding_cache import QueryEmbeddingCache, normalize_query
+from lexical_index import BM25Index, tokenize
+from content_store import ContentStore
+from embedding_worker import EmbeddingWorkerClient
+from partitioned_collection import PartitionedCollection
+from fingerprint_index import SimHashIndex, simhash, text_hash
 
 load_dotenv()
 
-# --- 配置 Embedding ---
-EMBEDDING_FUNC = embedding_functions.SentenceTransformerEmbeddingFunction(
-    model_name="BAAI/bge-m3", 
-    device="cpu"   # "mps", "cuda" 或 "cpu"
-)
+# --- 配置 ---
+EMBEDDING_MODEL_NAME = "BAAI/bge-m3"
+EMBEDDING_DEVICE = "cpu"   # "mps", "cuda" 或 "cpu"
+# 编码在哪里执行："local"（当前进程）| "worker"（独立子进程，合并多会话的并发请求）
+#                | "onnx"（当前进程，ONNX Runtime 跑导出的 fp32/int8 模型，见 onnx_embedder.py）
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "local")
+ONNX_MODEL_PATH = os.getenv("ONNX_MODEL_PATH", "./models/bge-m3-onnx")
+ONNX_QUANTIZED = os.getenv("ONNX_QUANTIZED", "true").lower() in ("1", "true", "yes")
+WORKER_BATCH_WINDOW_MS = 10   # 子进程收集并发请求的时间窗口
+WORKER_MAX_BATCH = 64         # 单次合并的最大文本数
+WORKER_LOAD_TIMEOUT = float(os.getenv("EMBEDDING_WORKER_LOAD_TIMEOUT", "600"))  # 子进程加载模型的超时（秒），与单次请求超时分开
+CHROMA_PATH = "./chroma_db"
+COLLECTION_NAME = "knowledge_base"
+CONTENT_STORE_PATH = os.path.join(CHROMA_PATH, "content_store.sqlite")  # 全文旁路存储
+INDEX_VERSION_PATH = os.path.join(CHROMA_PATH, "index_version")  # 写入标记：其他进程改库后，本进程的内存索引据此重建
+CONTENT_MIGRATION_MARKER = os.path.join(CHROMA_PATH, ".content_migrated")  # 旧版 metadata 全文已迁移的标记
+# 按领域物理分区：每个领域一个独立集合（knowledge_base_<domain>），
+# 领域内查询只走自己的 HNSW 图，"All" 查询并行扇出后按距离合并
+PARTITION_BY_DOMAIN = os.getenv("VECTOR_PARTITIONED", "false").lower() in ("1", "true", "yes")
+DOMAIN_PARTITIONS = ("spanish_learning", "tech_knowledge", "humanities")  # 与 workflow.KnowledgeDomain 一致
+# HNSW 索引参数。space / ef_construction / M 只在建集合时生效，修改后需运行
+# `python maintain_index.py rebuild`；ef_search 可在线调整，打开集合时自动同步。
+# 各参数在本库上的召回/延迟取舍用 `python maintain_index.py sweep` 实测。
+HNSW_SPACE = os.getenv("HNSW_SPACE", "l2")  # l2 | cosine | ip；检索距离统一换算到 l2 尺度，THRESHOLD 不随之修改
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "100"))  # 建图候选数：越大图质量越高，写入越慢
+HNSW_M = int(os.getenv("HNSW_M", "16"))                    # 每个节点的邻居数：越大召回越高，内存和磁盘越大
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "100"))   # 查询候选数：越大召回越高，查询越慢
+EMBED_BATCH_SIZE = 32     # 每次编码器前向的条数
+WRITE_BATCH_SIZE = 256    # 每次写入 Chroma 的条数
 
-client = chromadb.PersistentClient(path="./chroma_db")
-collection = client.get_or_create_collection(
-    name="knowledge_base",
-    embedding_function=EMBEDDING_FUNC
-)
+# 分块索引：除页面级高密度向量外，再把全文切成有重叠的段落各自编码，
+# 这样 3000 字之后的内容也能被检索到。检索时段落命中会聚合回页面。
+CHUNKING_ENABLED = os.getenv("VECTOR_CHUNKING", "false").lower() in ("1", "true", "yes")
+CHUNK_SIZE = 800          # 每段最大字符数
+CHUNK_OVERLAP = 150       # 相邻段落重叠字符数
+MAX_CHUNKS_PER_PAGE = 1000  # 单页段落上限，保证超长 PDF 的索引时间有界
+CHUNK_SCORING = "max"     # 段落聚合方式："max" | "sum"
+CHUNK_ID_SEP = "::chunk-"
+CHUNK_FANOUT = 4          # 检索时候选数放大倍数，用于段落聚合
 
-def add_memory(
+# 查询向量缓存：内存 LRU 条数；设置 QUERY_CACHE_PATH 时额外启用 SQLite 持久层
+QUERY_CACHE_SIZE = 512
+QUERY_CACHE_PATH = os.getenv("QUERY_CACHE_PATH")
+
+THRESHOLD = 0.85  # 相似度阈值（距离越小越相似），以 l2 平方距离为尺度：归一化向量下 0 为相同、2 为正交
+# 各距离空间换算到 l2 尺度的系数：归一化向量下 l2² = 2 - 2cos，cosine / ip 距离均为 1 - cos
+L2_DISTANCE_SCALE = {"l2": 1.0, "cosine": 2.0, "ip": 2.0}
+
+# 检索模式："dense"（纯向量）| "hybrid"（BM25 + 向量，RRF 融合）| "lexical"（纯 BM25）
+SEARCH_MODE = os.getenv("VECTOR_SEARCH_MODE", "dense")
+RRF_K = 60                    # Reciprocal Rank Fusion 常数
+LEXICAL_MIN_COVERAGE = 0.8    # 查询词覆盖率达到该值时，即使向量距离超阈值也视为命中
+LEXICAL_SHORTCUT_MAX_TERMS = 8  # 查询词不超过该数量且词法结果明确时，跳过编码器
+LEXICAL_SHORTCUT_MARGIN = 2.0   # 词法第一名得分需达到第二名的倍数
+
+# 近重复检测：页面记录的 metadata 带全文 SimHash，重复粘贴同一篇文章时在编码/LLM 之前拦截
+DUPLICATE_MAX_DISTANCE = 3   # 64 位指纹的汉明距离阈值（需小于 SimHashIndex 的分段数 4）
+DUPLICATE_MIN_CHARS = 200    # 短文本（如提问）不做重复检测
+
+# --- 懒加载资源 ---
+# 模型 (数 GB) 和 Chroma 客户端不在 import 时创建，而是首次使用时加载，
+# 这样 `import workflow` 不会被阻塞；app 启动时可用 start_warmup() 在后台预热。
+_resource_lock = threading.RLock()
+_model_lock = threading.Lock()  # 模型加载单独加锁，避免阻塞集合/缓存等轻量资源
+_embedding_func = None
+_worker_client: Optional[EmbeddingWorkerClient] = None
+_client = None
+_collection = None
+_warmup_thread: Optional[threading.Thread] = None
+_warmup_error: Optional[str] = None
+_query_cache: Optional[QueryEmbeddingCache] = None
+_lexical_index: Optional[BM25Index] = None
+_content_store: Optional[ContentStore] = None
+_fingerprint_index: Optional[SimHashIndex] = None
+_index_version: Optional[str] = None  # 内存索引对应的写入标记
+
+
+def get_embedding_function():
+    """获取 Embedding 函数（首次调用时加载模型）"""
+    global _embedding_func
+    if _embedding_func is None:
+        with _model_lock:
+            if _embedding_func is None:
+                if EMBEDDING_BACKEND == "onnx":
+                    from onnx_embedder import OnnxEmbedder
+                    print(f"⏳ Loading ONNX embedding model: {ONNX_MODEL_PATH} (int8: {ONNX_QUANTIZED})...")
+                    _embedding_func = OnnxEmbedder(ONNX_MODEL_PATH, quantized=ONNX_QUANTIZED)
+                else:
+                    from chromadb.utils import embedding_functions
+                    print(f"⏳ Loading embedding model: {EMBEDDING_MODEL_NAME} ({EMBEDDING_DEVICE})...")
+                    _embedding_func = embedding_functions.SentenceTransformerEmbeddingFunction(
+                        model_name=EMBEDDING_MODEL_NAME,
+                        device=EMBEDDING_DEVICE,
+                    )
+    return _embedding_func
+
+
+def embedding_model_key() -> str:
+    """当前编码器的标识（模型 + 后端），用于查询向量缓存的键"""
+    if EMBEDDING_BACKEND == "onnx":
+        return f"{EMBEDDING_MODEL_NAME}|onnx-{'int8' if ONNX_QUANTIZED else 'fp32'}"
+    return EMBEDDING_MODEL_NAME
+
+
+def get_worker_client() -> EmbeddingWorkerClient:
+    """获取独立 Embedding 进程的客户端（首次调用时启动子进程）"""
+    global _worker_client
+    if _worker_client is None:
+        with _resource_lock:
+            if _worker_client is None:
+                client = EmbeddingWorkerClient(
+                    EMBEDDING_MODEL_NAME,
+                    EMBEDDING_DEVICE,
+                    batch_window_ms=WORKER_BATCH_WINDOW_MS,
+                    max_batch=WORKER_MAX_BATCH,
+                    encode_batch_size=EMBED_BATCH_SIZE,
+                    load_timeout=WORKER_LOAD_TIMEOUT,
+                )
+                client.start()
+                _worker_client = client
+    return _worker_client
+
+
+def hnsw_configuration() -> Dict[str, Any]:
+    """新建集合时使用的 HNSW 配置"""
+    return {
+        "hnsw": {
+            "space": HNSW_SPACE,
+            "ef_construction": HNSW_EF_CONSTRUCTION,
+            "max_neighbors": HNSW_M,
+            "ef_search": HNSW_EF_SEARCH,
+        }
+    }
+
+
+def physical_collections() -> Dict[str, Any]:
+    """底层的 Chroma 集合 {集合名: collection}：单集合模式一个，分区模式每个领域一个"""
+    collection = get_collection()
+    if isinstance(collection, PartitionedCollection):
+        return {col.name: col for col in collection.collections().values()}
+    return {collection.name: collection}
+
+
+def collection_space() -> str:
+    """已打开集合实际使用的距离空间（集合按建库时的参数保存，可能与当前 HNSW_SPACE 不同）"""
+    for col in physical_collections().values():
+        try:
+            space = ((col.configuration or {}).get("hnsw") or {}).get("space")
+        except Exception:
+            space = None
+        if space:
+            return space
+    return HNSW_SPACE
+
+
+def to_l2_distance(distance: float, space: str) -> float:
+    """把 space 下的距离换算到 THRESHOLD 使用的 l2 尺度"""
+    return distance * L2_DISTANCE_SCALE.get(space, 1.0)
+
+
+def _sync_hnsw_config(collection):
+    """ef_search 不一致时在线修改；结构参数不一致只提示（需要重建索引）"""
+    try:
+        current = (collection.configuration or {}).get("hnsw") or {}
+        wanted = hnsw_configuration()["hnsw"]
+        if current.get("ef_search") != wanted["ef_search"]:
+            collection.modify(configuration={"hnsw": {"ef_search": wanted["ef_search"]}})
+        drift = [k for k in ("space", "ef_construction", "max_neighbors") if current.get(k) != wanted[k]]
+        if drift:
+            print(
+                f"⚠️ Collection '{collection.name}' was built with different HNSW settings ({', '.join(drift)}); "
+                f"run `python maintain_index.py rebuild` to apply them."
+            )
+    except Exception as e:
+        print(f"⚠️ Failed to sync HNSW settings for '{collection.name}': {e}")
+
+
+def get_collection():
+    """
+    获取 knowledge_base 集合（首次调用时打开 Chroma 客户端）
+
+    集合不绑定 Embedding 函数：写入和查询都显式传入 embed_texts() 算好的向量，
+    打开集合不需要加载模型，编码也可以交给独立进程。
+    PARTITION_BY_DOMAIN 开启时返回 PartitionedCollection，接口与单集合一致。
+    """
+    global _client, _collection
+    if _collection is None:
+        with _resource_lock:
+            if _collection is None:
+                import chromadb
+                _client = chromadb.PersistentClient(path=CHROMA_PATH)
+                if PARTITION_BY_DOMAIN:
+                    collection = PartitionedCollection(
+                        _client, COLLECTION_NAME, DOMAIN_PARTITIONS, configuration=hnsw_configuration(),
+                    )
+                    physical = list(collection.collections().values())
+                else:
+                    collection = _client.get_or_create_collection(
+                        name=COLLECTION_NAME,
+                        embedding_function=None,
+                        configuration=hnsw_configuration(),
+                    )
+                    physical = [collection]
+                for col in physical:
+                    _sync_hnsw_config(col)
+                _collection = collection
+    return _collection
+
+
+def migrate_to_partitions(batch_size: int = 500, drop_legacy: bool = False) -> int:
+    """
+    把单集合 knowledge_base 中的记录迁移到按领域分区的集合（复用已有向量，不重新编码）
+
+    参数:
+        batch_size: 每批读取/写入的条数
+        drop_legacy: 迁移完成后是否删除旧的单集合
+
+    返回:
+        int: 迁移的记录数
+    """
+    if not PARTITION_BY_DOMAIN:
+        print("⚠️ Set VECTOR_PARTITIONED=true before migrating to partitions.")
+        return 0
+    partitioned = get_collection()
+    try:
+        legacy = _client.get_collection(name=COLLECTION_NAME, embedding_function=None)
+    except Exception:
+        print("ℹ️ No legacy single collection found, nothing to migrate.")
+        return 0
+
+    migrated = 0
+    offset = 0
+    while True:
+        page = legacy.get(include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=offset)
+        ids = page.get("ids") or []
+        if not ids:
+            break
+        partitioned.upsert(
+            ids=ids,
+            embeddings=[list(map(float, e)) for e in page["embeddings"]],
+            documents=page.get("documents"),
+            metadatas=page.get("metadatas"),
+        )
+        offset += len(ids)
+        migrated += len(ids)
+        print(f"   - {migrated} records migrated...")
+
+    if drop_legacy:
+        _client.delete_collection(name=COLLECTION_NAME)
+    print(f"✅ Migrated {migrated} records into {len(partitioned.partitions)} partitions.")
+    return migrated
+
+
+def warmup() -> bool:
+    """
+    预热向量层：加载模型、打开集合，并跑一次编码让权重真正驻留内存
+
+    返回:
+        bool: 成功返回 True，失败返回 False（错误信息见 get_warmup_error()）
+    """
+    global _warmup_error
+    try:
+        get_collection()
+        _migrate_content_once()
+        embed_texts(["warmup"])
+        _warmup_error = None
+        print("🔥 VectorOps warmed up.")
+        return True
+    except Exception as e:
+        _warmup_error = str(e)
+        print(f"❌ VectorOps warmup failed: {e}")
+        return False
+
+
+def start_warmup() -> threading.Thread:
+    """在后台守护线程中执行 warmup()，重复调用会复用同一个线程"""
+    global _warmup_thread
+    with _resource_lock:
+        if _warmup_thread is None:
+            _warmup_thread = threading.Thread(target=warmup, name="vector-warmup", daemon=True)
+            _warmup_thread.start()
+    return _warmup_thread
+
+
+def _get_query_cache() -> QueryEmbeddingCache:
+    global _query_cache
+    if _query_cache is None:
+        with _resource_lock:
+            if _query_cache is None:
+                _query_cache = QueryEmbeddingCache(max_entries=QUERY_CACHE_SIZE, path=QUERY_CACHE_PATH)
+    return _query_cache
+
+
+def get_query_cache_stats() -> Dict[str, Any]:
+    """查询向量缓存的命中/未命中统计"""
+    return _get_query_cache().stats()
+
+
+def get_content_store() -> ContentStore:
+    """获取全文旁路存储（首次调用时打开 SQLite 文件）"""
+    global _content_store
+    if _content_store is None:
+        with _resource_lock:
+            if _content_store is None:
+                os.makedirs(os.path.dirname(CONTENT_STORE_PATH) or ".", exist_ok=True)
+                _content_store = ContentStore(CONTENT_STORE_PATH)
+    return _content_store
+
+
+def get_memory_content(page_id: str) -> str:
+    """
+    按需读取笔记全文（供 RAG 使用）
+
+    优先读旁路存储；旧版本把前 3000 字写在 metadata 里，尚未迁移时回退读取它。
+    """
+    content = get_content_store().get(page_id)
+    if content is not None:
+        return content
+    try:
+        found = get_collection().get(ids=[page_id], include=["metadatas"])
+        metas = found.get("metadatas") or []
+        return (metas[0] or {}).get("content", "") if metas else ""
+    except Exception as e:
+        print(f"❌ Failed to load memory content: {e}")
+        return ""
+
+
+def migrate_content_to_store(batch_size: int = 500) -> int:
+    """
+    迁移旧数据：把 metadata 里的 content 搬到旁路存储，并从 metadata 中删除
+
+    返回:
+        int: 迁移的页面数
+    """
+    collection = get_collection()
+    store = get_content_store()
+    migrated = 0
+    offset = 0
+    while True:
+        page = collection.get(include=["metadatas"], limit=batch_size, offset=offset)
+        ids = page.get("ids") or []
+        if not ids:
+            break
+        offset += len(ids)
+        legacy = [
+            (i, meta["content"]) for i, meta in zip(ids, page.get("metadatas") or [])
+            if meta and meta.get("content")
+        ]
+        if not legacy:
+            continue
+        store.put_many(legacy)
+        # Chroma 的 update 是合并语义，值为 None 表示删除该字段
+        collection.update(ids=[i for i, _ in legacy], metadatas=[{"content": None} for _ in legacy])
+        migrated += len(legacy)
+    with open(CONTENT_MIGRATION_MARKER, "w", encoding="utf-8") as f:
+        f.write(time.strftime("%Y-%m-%dT%H:%M:%S"))
+    print(f"📦 Migrated {migrated} legacy contents to the content store.")
+    return migrated
+
+
+def _migrate_content_once():
+    """warmup 时自动迁移一次旧数据；有标记文件即跳过，失败不影响预热（下次启动重试）"""
+    if os.path.exists(CONTENT_MIGRATION_MARKER):
+        return
+    try:
+        migrate_content_to_store()
+    except Exception as e:
+        print(f"⚠️ Legacy content migration failed, will retry on next start: {e}")
+
+
+def _read_index_version() -> str:
+    try:
+        with open(INDEX_VERSION_PATH, encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def sync_index_version():
+    """
+    检查写入标记：库被其他进程（reindex.py / sweep_orphans.py / maintain_index.py）改过时，
+    丢弃内存中的 BM25、指纹索引和集合句柄，下次使用时从 Chroma 重建
+    """
+    global _index_version, _lexical_index, _fingerprint_index, _collection
+    version = _read_index_version()
+    if version == _index_version:
+        return
+    with _resource_lock:
+        if version == _index_version:
+            return
+        if _index_version is not None and (_lexical_index is not None or _fingerprint_index is not None):
+            print("🔄 Vector store changed by another process, rebuilding in-memory indexes.")
+        if _index_version is not None:
+            _collection = None
+        _lexical_index = None
+        _fingerprint_index = None
+        _index_version = version
+
+
+def mark_index_changed():
+    """
+    写库后更新写入标记，让其他进程的内存索引失效
+
+    本进程的索引已增量同步，直接记下新标记；写入前若已有其他进程改库，先按 sync_index_version() 丢弃。
+    """
+    global _index_version
+    sync_index_version()
+    version = uuid.uuid4().hex
+    try:
+        os.makedirs(os.path.dirname(INDEX_VERSION_PATH) or ".", exist_ok=True)
+        with open(INDEX_VERSION_PATH, "w", encoding="utf-8") as f:
+            f.write(version)
+    except OSError as e:
+        print(f"⚠️ Failed to update index version marker: {e}")
+        return
+    with _resource_lock:
+        _index_version = version
+
+
+def get_lexical_index() -> BM25Index:
+    """
+    获取 BM25 倒排索引（首次调用时从 Chroma 中已存的 Embedding 文本构建）
+
+    之后由 _write_records / _delete_stale_chunks 增量同步；其他进程改库后按写入标记重建。
+    """
+    global _lexical_index
+    sync_index_version()
+    if _lexical_index is None:
+        with _resource_lock:
+            if _lexical_index is None:
+                collection = get_collection()
+                index = BM25Index()
+                offset = 0
+                while True:
+                    page = collection.get(include=["documents", "metadatas"], limit=1000, offset=offset)
+                    ids = page.get("ids") or []
+                    if not ids:
+                        break
+                    for doc_id, doc, meta in zip(ids, page.get("documents") or [], page.get("metadatas") or []):
+                        index.add(doc_id, doc or "", meta)
+                    offset += len(ids)
+                print(f"📇 Lexical index built: {len(index)} records.")
+                _lexical_index = index
+    return _lexical_index
+
+
+def get_fingerprint_index() -> SimHashIndex:
+    """
+    获取近重复检测索引（首次调用时从页面记录 metadata 中的指纹构建）
+
+    旧记录没有指纹时，从旁路存储读取全文现算。之后由 _write_records 增量同步；
+    其他进程改库后按写入标记重建。
+    """
+    global _fingerprint_index
+    sync_index_version()
+    if _fingerprint_index is None:
+        with _resource_lock:
+            if _fingerprint_index is None:
+                collection = get_collection()
+                index = SimHashIndex()
+                offset = 0
+                while True:
+                    page = collection.get(include=["metadatas"], limit=1000, offset=offset)
+                    ids = page.get("ids") or []
+                    if not ids:
+                        break
+                    legacy = []
+                    for doc_id, meta in zip(ids, page.get("metadatas") or []):
+                        meta = meta or {}
+                        if meta.get("parent_id"):
+                            continue  # 段落记录不参与
+                        if meta.get("simhash") and meta.get("text_hash"):
+                            index.add(doc_id, int(meta["simhash"], 16), meta["text_hash"])
+                        else:
+                            legacy.append(doc_id)
+                    for doc_id, content in get_content_store().get_many(legacy).items():
+                        index.add_text(doc_id, content)
+                    offset += len(ids)
+                print(f"🧬 Fingerprint index built: {len(index)} pages.")
+                _fingerprint_index = index
+    return _fingerprint_index
+
+
+def find_duplicate(text: str, max_distance: int = DUPLICATE_MAX_DISTANCE) -> Dict[str, Any]:
+    """
+    检测输入是否与已保存的笔记重复（不调用编码器）
+
+    参数:
+        text: 待保存的原始文本
+        max_distance: SimHash 汉明距离阈值，0 表示只认精确重复
+
+    返回:
+        dict: {"match": True, "duplicate": True, "exact", "hamming", "page_id", "title", "category", "metadata"}
+              或 {"match": False}
+    """
+    if not text or len(text.strip()) < DUPLICATE_MIN_CHARS:
+        return {"match": False}
+    try:
+        index = get_fingerprint_index()
+        while True:
+            found = index.find(text, max_distance)
+            if not found:
+                return {"match": False}
+            page_id, distance, exact = found
+            metas = get_collection().get(ids=[page_id], include=["metadatas"]).get("metadatas") or []
+            if metas:
+                meta = metas[0] or {}
+                break
+            # 记录已被其他进程删除（sweep_orphans / 手动删除），索引中的指纹已失效
+            print(f"🧹 Stale fingerprint for {page_id}, removed.")
+            index.remove(page_id)
+        print(f"🧬 Duplicate of '{meta.get('title', page_id)}' (hamming {distance}, exact: {exact})")
+        return {
+            "match": True,
+            "duplicate": True,
+            "exact": exact,
+            "hamming": distance,
+            "page_id": page_id,
+            "title": meta.get("title", "Untitled"),
+            "category": meta.get("category", "General"),
+            "metadata": meta,
+        }
+    except Exception as e:
+        print(f"⚠️ Duplicate check failed: {e}")
+        return {"match": False}
+
+
+def is_ready() -> bool:
+    """模型和集合是否都已加载完成"""
+    if EMBEDDING_BACKEND == "worker":
+        model_ready = _worker_client is not None and _worker_client.is_ready()
+    else:
+        model_ready = _embedding_func is not None
+    return model_ready and _collection is not None
+
+
+def get_warmup_error() -> Optional[str]:
+    """最近一次 warmup 的错误信息，没有错误时返回 None"""
+    return _warmup_error
+
+
+def _build_memory_record(
     page_id: str,
     content: str = None,
     *,
     title: str = None,
     category: str = None,
     metadata: Optional[Dict[str, Any]] = None,
-):
+) -> Optional[Tuple[str, Dict[str, str]]]:
     """
-    将页面内容存入向量数据库记忆库
-    
-    参数:
-        page_id: Notion 页面 ID，作为向量数据库中的唯一标识
-        content: 页面文本内容（必需）
-        title: 页面标题（可选，会从 metadata 中获取）
-        category: 页面分类（可选，会从 metadata 中获取）
-        metadata: 额外的元数据字典，包含 url、summary、type 等信息
-    
+    构建单条记忆的 (embedding_text, metadata)，add_memory 和 add_memories 共用
+
     返回:
-        bool: 成功返回 True，失败返回 False
+        tuple: (高密度 Embedding 文本, 清洗后的 metadata)；内容不合格时返回 None
     """
     # 1. 参数归一化（避免修改原始 metadata 字典，创建副本）
     final_metadata = dict(metadata) if metadata else {}
@@ -52,20 +585,19 @@ def add_memory(
     final_content = content
 
     # 2. 安全检查
-    if not final_content or not isinstance(final_content, str) or len(final_content.strip()) < 10:
-        print("❌ VectorOps: content too short or missing, skip memory.")
-        return False
+    if not page_id or not final_content or not isinstance(final_content, str) or len(final_content.strip()) < 10:
+        return None
 
-    # 3. 准备 Metadata（这里存全量内容，用于 RAG 回答）
+    # 3. 准备 Metadata（只放小字段；全文写入旁路存储 content_store，RAG 时按需读取）
+    final_metadata.pop("content", None)
     final_metadata.setdefault("title", final_title)
     final_metadata.setdefault("category", final_category)
-    final_metadata["content"] = final_content[:3000]  # Metadata 里存多点，供 LLM 查看
     final_metadata.setdefault("url", "")
 
     # 清洗 None
     cleaned_metadata = {k: str(v) for k, v in final_metadata.items() if v is not None}
-
-    print(f"💾 Vectorizing memory: {final_title}...")
+    # 旧版本把全文放在 metadata 里；Chroma upsert/update 是合并语义，显式置 None 才会删除
+    cleaned_metadata["content"] = None
 
     # 4. 构建高密度 Embedding 文本
     # 策略：
@@ -82,82 +614,730 @@ def add_memory(
         f"Snippet: {dense_content}"
     )
 
-    # 5. 写入向量数据库
+    # 5. 记录 Embedding 文本的哈希，文本不变时可跳过重新编码
+    cleaned_metadata["content_hash"] = content_hash(embedding_text)
+    # 6. 全文指纹，供 find_duplicate 做近重复检测（调用方已带上原始输入的指纹时保留，如 reindex 重建）
+    if not (cleaned_metadata.get("simhash") and cleaned_metadata.get("text_hash")):
+        cleaned_metadata["simhash"] = f"{simhash(final_content):016x}"
+        cleaned_metadata["text_hash"] = text_hash(final_content)
+    return embedding_text, cleaned_metadata
+
+
+def content_hash(text: str) -> str:
+    """Embedding 文本的内容哈希（sha256）"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _find_unchanged(collection, ids: List[str], metadatas: List[Dict[str, str]]) -> set:
+    """
+    找出库中已存在、content_hash 和 category 都未变化的 page_id（category 变化时要走 upsert，分区模式下才会移动分区）
+
+    返回:
+        set: 无需重新编码的 page_id 集合（查询失败时返回空集合，退化为全部重新编码）
+    """
     try:
-        collection.add(
-            documents=[embedding_text],  # 计算向量只用这个"高密度版"
-            metadatas=[cleaned_metadata],
-            ids=[page_id],
+        existing = collection.get(ids=ids, include=["metadatas"])
+    except Exception as e:
+        print(f"⚠️ Hash lookup failed, re-embedding all: {e}")
+        return set()
+    stored = {
+        i: ((meta or {}).get("content_hash"), (meta or {}).get("category"))
+        for i, meta in zip(existing.get("ids", []), existing.get("metadatas") or [])
+    }
+    return {
+        i for i, meta in zip(ids, metadatas)
+        if i in stored and stored[i][0] and stored[i] == (meta["content_hash"], meta.get("category"))
+    }
+
+
+def embed_texts(texts: List[str], batch_size: int = EMBED_BATCH_SIZE) -> List[List[float]]:
+    """
+    批量计算向量，每 batch_size 条走一次编码器前向
+
+    参数:
+        texts: 待编码文本列表
+        batch_size: 每批送入编码器的条数
+
+    返回:
+        list: 与 texts 一一对应的向量列表
+    """
+    vectors = []
+    if EMBEDDING_BACKEND == "worker":
+        # 按 batch_size 切分请求，让其它会话的短查询可以插进同一个微批次
+        client = get_worker_client()
+        for i in range(0, len(texts), batch_size):
+            vectors.extend(client.embed(texts[i:i + batch_size]))
+        return vectors
+
+    ef = get_embedding_function()
+    for i in range(0, len(texts), batch_size):
+        vectors.extend([list(map(float, v)) for v in ef(texts[i:i + batch_size])])
+    return vectors
+
+
+def split_passages(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """
+    将长文本切分为有重叠的段落，尽量在段落/句子边界断开
+
+    参数:
+        text: 原始文本
+        chunk_size: 每段最大字符数
+        overlap: 相邻两段重叠的字符数
+
+    返回:
+        list: 段落列表
+    """
+    text = (text or "").strip()
+    if not text:
+        return []
+    overlap = max(0, min(overlap, chunk_size // 2))
+
+    passages = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            # 在后半窗口里找最后一个自然断点
+            window_start = start + chunk_size // 2
+            window = text[window_start:end]
+            cut = -1
+            for sep in ("\n\n", "\n", "。", "！", "？", ". ", "! ", "? "):
+                pos = window.rfind(sep)
+                if pos != -1:
+                    cut = max(cut, pos + len(sep))
+            if cut > 0:
+                end = window_start + cut
+        passage = text[start:end].strip()
+        if passage:
+            passages.append(passage)
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return passages
+
+
+def _build_chunk_records(
+    page_id: str,
+    content: str,
+    page_metadata: Dict[str, str],
+    chunk_size: int = CHUNK_SIZE,
+    overlap: int = CHUNK_OVERLAP,
+) -> List[Tuple[str, str, Dict[str, str]]]:
+    """
+    为长文本构建段落级记录：每段一个向量，通过 parent_id 关联回页面
+
+    段落 metadata 只保留小字段（标题、分类、父页面），全文仍挂在页面记录上。
+    """
+    passages = split_passages(content, chunk_size, overlap)[:MAX_CHUNKS_PER_PAGE]
+    title = page_metadata.get("title", "Untitled")
+    records = []
+    for idx, passage in enumerate(passages):
+        text = f"Title: {title}\nPassage: {passage}"
+        category = page_metadata.get("category", "General")
+        meta = {
+            "title": title,
+            "category": category,
+            "parent_id": page_id,
+            "chunk_index": idx,
+            "content_hash": content_hash(f"{category}\n{text}"),
+        }
+        records.append((f"{page_id}{CHUNK_ID_SEP}{idx}", text, meta))
+    return records
+
+
+def _build_page_records(page: Dict[str, Any], chunked: bool) -> Optional[List[Tuple[str, str, Dict[str, str]]]]:
+    """
+    构建一个页面要写入的全部记录：页面级高密度记录 + （分块模式下）段落记录
+
+    返回:
+        list: [(id, embedding_text, metadata), ...]；内容不合格时返回 None
+    """
+    page_id = page.get("page_id")
+    record = _build_memory_record(
+        page_id,
+        page.get("content"),
+        title=page.get("title"),
+        category=page.get("category"),
+        metadata=page.get("metadata"),
+    )
+    if record is None:
+        return None
+    embedding_text, cleaned_metadata = record
+    records = [(page_id, embedding_text, cleaned_metadata)]
+    if chunked:
+        records.extend(_build_chunk_records(page_id, page["content"], cleaned_metadata))
+    return records
+
+
+def _write_records(
+    collection,
+    records: List[Tuple[str, str, Dict[str, str]]],
+    embed_batch_size: int = EMBED_BATCH_SIZE,
+) -> set:
+    """
+    写入一组记录：content_hash 未变的只刷新 metadata，其余批量编码后 upsert
+
+    返回:
+        set: 未变化（跳过编码）的 id 集合；写入失败时抛出异常
+    """
+    ids = [r[0] for r in records]
+    unchanged = _find_unchanged(collection, ids, [r[2] for r in records])
+    if unchanged:
+        kept = [r for r in records if r[0] in unchanged]
+        collection.update(ids=[r[0] for r in kept], metadatas=[r[2] for r in kept])
+
+    pending = [r for r in records if r[0] not in unchanged]
+    if pending:
+        documents = [r[1] for r in pending]
+        collection.upsert(
+            ids=[r[0] for r in pending],
+            embeddings=embed_texts(documents, batch_size=embed_batch_size),
+            documents=documents,
+            metadatas=[r[2] for r in pending],
         )
-        print("✅ Memory stored in Vector DB (High-Density Embedding).")
+
+    # 同步倒排索引（尚未构建时跳过，首次使用会从 Chroma 全量构建）
+    if _lexical_index is not None:
+        for record_id, text, meta in records:
+            _lexical_index.add(record_id, text, meta)
+    if _fingerprint_index is not None:
+        for record_id, _, meta in records:
+            if meta.get("simhash"):
+                _fingerprint_index.add(record_id, int(meta["simhash"], 16), meta["text_hash"])
+    mark_index_changed()
+    return unchanged
+
+
+def _delete_stale_chunks(collection, page_id: str, keep_ids: set):
+    """删除页面变短后多出来的旧段落记录"""
+    try:
+        existing = collection.get(where={"parent_id": page_id}, include=[])
+        stale = [i for i in existing.get("ids", []) if i not in keep_ids]
+        if stale:
+            collection.delete(ids=stale)
+            if _lexical_index is not None:
+                for record_id in stale:
+                    _lexical_index.remove(record_id)
+            mark_index_changed()
+    except Exception as e:
+        print(f"⚠️ Failed to clean stale chunks for {page_id}: {e}")
+
+
+def embed_query(query_text: str) -> List[float]:
+    """
+    计算查询向量（带缓存）：同一模型下归一化后相同的查询只编码一次
+    """
+    cache = _get_query_cache()
+    model_key = embedding_model_key()
+    vector = cache.get(model_key, query_text)
+    if vector is None:
+        vector = embed_texts([normalize_query(query_text)])[0]
+        cache.put(model_key, query_text, vector)
+    return vector
+
+
+def add_memory(
+    page_id: str,
+    content: str = None,
+    *,
+    title: str = None,
+    category: str = None,
+    metadata: Optional[Dict[str, Any]] = None,
+    chunked: Optional[bool] = None,
+):
+    """
+    将页面内容存入向量数据库记忆库
+    
+    参数:
+        page_id: Notion 页面 ID，作为向量数据库中的唯一标识
+        content: 页面文本内容（必需）
+        title: 页面标题（可选，会从 metadata 中获取）
+        category: 页面分类（可选，会从 metadata 中获取）
+        metadata: 额外的元数据字典，包含 url、summary、type 等信息
+        chunked: 是否额外按段落分块索引全文（默认取 CHUNKING_ENABLED）
+    
+    返回:
+        bool: 成功返回 True，失败返回 False
+    """
+    chunked = CHUNKING_ENABLED if chunked is None else chunked
+    records = _build_page_records(
+        {"page_id": page_id, "content": content, "title": title, "category": category, "metadata": metadata},
+        chunked,
+    )
+    if records is None:
+        print("❌ VectorOps: content too short or missing, skip memory.")
+        return False
+    final_title = records[0][2]["title"]
+
+    # 写入向量数据库（按 page_id upsert：融合后的笔记复用同一个 page_id）
+    try:
+        collection = get_collection()
+        print(f"💾 Vectorizing memory: {final_title} ({len(records)} vectors)...")
+        unchanged = _write_records(collection, records)
+        get_content_store().put(page_id, content)
+        if chunked:
+            _delete_stale_chunks(collection, page_id, {r[0] for r in records})
+
+        if len(unchanged) == len(records):
+            print(f"⏭️ Memory unchanged, skip re-embedding: {final_title}")
+        else:
+            print("✅ Memory stored in Vector DB (High-Density Embedding).")
         return True
     except Exception as e:
         print(f"❌ Failed to store vector: {e}")
         return False
 
-def search_memory(query_text: str, n_results: int = 5, category_filter: str = None) -> Dict[str, Any]:
+
+def add_memories(
+    pages: Iterable[Dict[str, Any]],
+    *,
+    embed_batch_size: int = EMBED_BATCH_SIZE,
+    write_batch_size: int = WRITE_BATCH_SIZE,
+    chunked: Optional[bool] = None,
+) -> Dict[str, Any]:
     """
-    从向量数据库中检索相关记忆
-    
+    批量写入记忆（用于回填大量 Notion 页面）
+
+    pages 可以是生成器：每次只从中取 write_batch_size 个页面，内存占用有上限。
+    每批先按 embed_batch_size 分批编码，再一次性 upsert 到 Chroma；
+    content_hash 未变化的记录只刷新 metadata，不进编码器。
+    整批写入失败时逐页重试，以便定位具体失败的页面。
+
+    参数:
+        pages: 页面字典的可迭代对象，字段与 add_memory 参数一致
+               (page_id, content, title, category, metadata)
+        embed_batch_size: 每次编码器前向的条数
+        write_batch_size: 每批处理的页面数
+        chunked: 是否额外按段落分块索引全文（默认取 CHUNKING_ENABLED）
+
+    返回:
+        dict: {"total", "stored", "unchanged", "failed": [{"page_id", "error"}], "elapsed", "pages_per_sec"}
+    """
+    chunked = CHUNKING_ENABLED if chunked is None else chunked
+    collection = get_collection()
+    try:
+        max_batch = _client.get_max_batch_size()
+    except Exception:
+        max_batch = None
+
+    stats = {"total": 0, "stored": 0, "unchanged": 0, "failed": []}
+    started = time.perf_counter()
+    iterator = iter(pages)
+
+    while True:
+        batch = list(islice(iterator, write_batch_size))
+        if not batch:
+            break
+        stats["total"] += len(batch)
+
+        # 1. 构建记录（同一批内重复的 page_id 以最后一次为准）
+        page_records: Dict[str, List[Tuple[str, str, Dict[str, str]]]] = {}
+        page_contents: Dict[str, str] = {}
+        for page in batch:
+            page_id = (page or {}).get("page_id")
+            try:
+                records = _build_page_records(page, chunked)
+            except Exception as e:
+                records, reason = None, str(e)
+            else:
+                reason = "content too short or missing"
+            if records is None:
+                stats["failed"].append({"page_id": page_id, "error": reason})
+                continue
+            page_records[page_id] = records
+            page_contents[page_id] = page["content"]
+
+        if not page_records:
+            continue
+
+        # 2. 整批编码 + 写入（超过 Chroma 单次上限时按上限切分）
+        all_records = [r for records in page_records.values() for r in records]
+        step = max_batch or len(all_records)
+        try:
+            unchanged = set()
+            for i in range(0, len(all_records), step):
+                unchanged |= _write_records(collection, all_records[i:i + step], embed_batch_size)
+            succeeded = {pid: unchanged for pid in page_records}
+        except Exception:
+            # 3. 整批失败：逐页重试，定位坏数据
+            succeeded = {}
+            for pid, records in page_records.items():
+                try:
+                    succeeded[pid] = _write_records(collection, records, embed_batch_size)
+                except Exception as e:
+                    stats["failed"].append({"page_id": pid, "error": str(e)})
+
+        if succeeded:
+            try:
+                get_content_store().put_many((pid, page_contents[pid]) for pid in succeeded)
+            except Exception as e:
+                print(f"⚠️ Content store write failed: {e}")
+
+        for pid, unchanged in succeeded.items():
+            records = page_records[pid]
+            if chunked:
+                _delete_stale_chunks(collection, pid, {r[0] for r in records})
+            if all(r[0] in unchanged for r in records):
+                stats["unchanged"] += 1
+            else:
+                stats["stored"] += 1
+
+        elapsed = time.perf_counter() - started
+        done = stats["stored"] + stats["unchanged"]
+        print(f"   - {done}/{stats['total']} pages done ({done / elapsed:.1f} pages/sec)")
+
+    stats["elapsed"] = time.perf_counter() - started
+    done = stats["stored"] + stats["unchanged"]
+    stats["pages_per_sec"] = done / stats["elapsed"] if stats["elapsed"] > 0 else 0.0
+    print(
+        f"✅ Bulk memory done: {stats['stored']}/{stats['total']} stored, "
+        f"{stats['unchanged']} unchanged, {len(stats['failed'])} failed, "
+        f"{stats['pages_per_sec']:.1f} pages/sec."
+    )
+    return stats
+
+
+def list_memory_ids(batch_size: int = 1000) -> Dict[str, str]:
+    """
+    列出库中全部页面级记录（不含段落记录）
+
+    返回:
+        dict: {page_id: category}
+    """
+    collection = get_collection()
+    pages = {}
+    offset = 0
+    while True:
+        page = collection.get(include=["metadatas"], limit=batch_size, offset=offset)
+        ids = page.get("ids") or []
+        if not ids:
+            break
+        for doc_id, meta in zip(ids, page.get("metadatas") or []):
+            meta = meta or {}
+            if not meta.get("parent_id"):
+                pages[doc_id] = meta.get("category", "General")
+        offset += len(ids)
+    return pages
+
+
+def get_memory_metadata(page_ids: List[str], batch_size: int = 100) -> Dict[str, Dict[str, Any]]:
+    """
+    读取页面级记录的 metadata
+
+    返回:
+        dict: {page_id: metadata}，库中不存在的页面不出现在结果中
+    """
+    collection = get_collection()
+    found = {}
+    for i in range(0, len(page_ids), batch_size):
+        page = collection.get(ids=list(page_ids[i:i + batch_size]), include=["metadatas"])
+        for doc_id, meta in zip(page.get("ids") or [], page.get("metadatas") or []):
+            found[doc_id] = meta or {}
+    return found
+
+
+def delete_memories(page_ids: List[str], batch_size: int = 100) -> int:
+    """
+    删除页面的全部记忆：页面记录、段落记录、旁路全文，以及倒排/指纹索引中的条目
+
+    参数:
+        page_ids: 要删除的页面 ID
+        batch_size: 每批删除的页面数
+
+    返回:
+        int: 成功删除的页面数
+    """
+    collection = get_collection()
+    deleted = 0
+    for i in range(0, len(page_ids), batch_size):
+        batch = list(page_ids[i:i + batch_size])
+        try:
+            chunks = collection.get(where={"parent_id": {"$in": batch}}, include=[]).get("ids") or []
+            collection.delete(ids=batch + chunks)
+            get_content_store().delete(batch)
+            if _lexical_index is not None:
+                for record_id in batch + chunks:
+                    _lexical_index.remove(record_id)
+            if _fingerprint_index is not None:
+                for page_id in batch:
+                    _fingerprint_index.remove(page_id)
+            deleted += len(batch)
+        except Exception as e:
+            print(f"❌ Failed to delete memories: {e}")
+    if deleted:
+        mark_index_changed()
+    return deleted
+
+
+def _aggregate_hits(ids: List[str], distances: List[float], metadatas: List[Dict], scoring: str) -> List[Dict[str, Any]]:
+    """
+    将段落级命中聚合回页面级结果
+
+    scoring:
+        "max": 页面得分取其最佳段落（距离最小）
+        "sum": 页面得分为所有命中段落相似度 1/(1+d) 之和，命中段落越多越靠前
+    返回的 distance 始终是该页面最佳段落的距离，阈值判断仍以它为准。
+    """
+    pages: Dict[str, Dict[str, Any]] = {}
+    for vid, dist, meta in zip(ids, distances, metadatas):
+        meta = meta or {}
+        parent = meta.get("parent_id") or vid
+        entry = pages.setdefault(parent, {"page_id": parent, "distance": dist, "score": 0.0, "hits": 0, "metadata": None})
+        entry["distance"] = min(entry["distance"], dist)
+        entry["score"] += 1.0 / (1.0 + dist)
+        entry["hits"] += 1
+        if "parent_id" not in meta:
+            entry["metadata"] = meta  # 页面级记录携带完整 metadata
+
+    ranked = list(pages.values())
+    if scoring == "sum":
+        ranked.sort(key=lambda e: -e["score"])
+    else:
+        ranked.sort(key=lambda e: e["distance"])
+    return ranked
+
+
+def _dense_candidates(collection, query_text: str, n_results: int, where: Optional[Dict], scoring: str) -> List[Dict[str, Any]]:
+    """向量检索，返回聚合到页面级的候选（按 scoring 排序）"""
+    query_args = {
+        "query_embeddings": [embed_query(query_text)],
+        # 多取一些候选：同一页面的多个段落可能同时命中，聚合后再截断到 n_results
+        "n_results": n_results * CHUNK_FANOUT,
+    }
+    if where:
+        query_args["where"] = where
+    results = collection.query(**query_args)
+    if not results['ids'] or len(results['ids'][0]) == 0:
+        return []
+    space = collection_space()
+    return _aggregate_hits(
+        results['ids'][0],
+        [to_l2_distance(d, space) for d in results['distances'][0]],
+        results['metadatas'][0],
+        scoring,
+    )[:n_results]
+
+
+def _lexical_candidates(query_text: str, n_results: int, category: Optional[str]) -> List[Dict[str, Any]]:
+    """BM25 检索，记录级命中按页面取最高分"""
+    index = get_lexical_index()
+    pages: Dict[str, Dict[str, Any]] = {}
+    for doc_id, score, coverage in index.search(query_text, k=n_results * CHUNK_FANOUT, category=category):
+        parent = index.parent_of(doc_id)
+        entry = pages.setdefault(parent, {"page_id": parent, "bm25": score, "coverage": coverage})
+        entry["bm25"] = max(entry["bm25"], score)
+        entry["coverage"] = max(entry["coverage"], coverage)
+    return sorted(pages.values(), key=lambda e: -e["bm25"])[:n_results]
+
+
+def _lexical_is_decisive(query_text: str, lexical: List[Dict[str, Any]]) -> bool:
+    """短关键词查询且 BM25 第一名完全覆盖查询词、明显领先时，可跳过编码器"""
+    if not lexical or lexical[0]["coverage"] < 1.0:
+        return False
+    if len(set(tokenize(query_text))) > LEXICAL_SHORTCUT_MAX_TERMS:
+        return False
+    return len(lexical) == 1 or lexical[0]["bm25"] >= LEXICAL_SHORTCUT_MARGIN * lexical[1]["bm25"]
+
+
+def _fuse_rrf(dense: List[Dict[str, Any]], lexical: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Reciprocal Rank Fusion：score = Σ 1 / (RRF_K + rank)"""
+    fused: Dict[str, Dict[str, Any]] = {}
+    for rank, cand in enumerate(dense, start=1):
+        entry = fused.setdefault(cand["page_id"], {"page_id": cand["page_id"], "rrf": 0.0, "metadata": None})
+        entry.update({k: v for k, v in cand.items() if k != "score"})
+        entry["rrf"] += 1.0 / (RRF_K + rank)
+    for rank, cand in enumerate(lexical, start=1):
+        entry = fused.setdefault(cand["page_id"], {"page_id": cand["page_id"], "rrf": 0.0, "metadata": None})
+        entry["bm25"] = cand["bm25"]
+        entry["coverage"] = cand["coverage"]
+        entry["rrf"] += 1.0 / (RRF_K + rank)
+    return sorted(fused.values(), key=lambda e: -e["rrf"])
+
+
+def _fill_page_metadata(collection, candidates: List[Dict[str, Any]]):
+    """只命中了段落（或只来自词法索引）的页面，补取页面级 metadata"""
+    missing = [c["page_id"] for c in candidates if not c.get("metadata")]
+    if not missing:
+        return
+    fetched = collection.get(ids=missing, include=["metadatas"])
+    page_meta = dict(zip(fetched.get("ids", []), fetched.get("metadatas") or []))
+    for c in candidates:
+        if not c.get("metadata"):
+            c["metadata"] = page_meta.get(c["page_id"]) or {}
+
+
+def search_memories(
+    query_text: str,
+    n_results: int = 5,
+    category_filter: str = None,
+    *,
+    threshold: Optional[float] = THRESHOLD,
+    fields: Optional[List[str]] = None,
+    include_content: bool = False,
+    scoring: str = None,
+    mode: str = None,
+) -> List[Dict[str, Any]]:
+    """
+    检索并返回完整的 Top-K 排序结果（一次调用拿到所有相关笔记）
+
     参数:
         query_text: 查询文本
-        n_results: 返回的结果数量（默认5）
+        n_results: 最多返回的页面数（默认5）
         category_filter: 分类过滤器，None 或 "All" 表示搜索所有分类
-    
+        threshold: 距离阈值；None 表示不过滤，返回全部候选
+                   （查询词覆盖率达到 LEXICAL_MIN_COVERAGE 的词法命中同样保留）
+        fields: metadata 投影，只返回这些字段（如 ["title", "summary", "url"]），
+                None 表示返回全部 metadata
+        include_content: 是否从旁路存储加载全文到 metadata["content"]
+                         （fields 中包含 "content" 时同样会加载）
+        scoring: 段落命中聚合到页面的方式 "max" | "sum"（默认取 CHUNK_SCORING）
+        mode: 检索模式 "dense" | "hybrid" | "lexical"（默认取 SEARCH_MODE）
+
     返回:
-        dict: 包含 match、page_id、title、distance、category、metadata 的字典
-              如果未找到匹配，返回 {"match": False}
+        list: 按相关度排序的结果，每项包含 page_id、title、distance、coverage、rank_score、category、metadata；
+              纯词法命中时 distance 为 None。出错或无结果时返回空列表
     """
     if not isinstance(query_text, str) or len(query_text.strip()) < 2:
-        return {"match": False}
+        return []
 
-    print(f"🔍 Vector Searching for: {query_text[:20]}... (Filter: {category_filter})")
-    
-    query_args = {
-        "query_texts": [query_text],
-        "n_results": n_results 
-    }
+    mode = mode or SEARCH_MODE
+    print(f"🔍 Vector Searching for: {query_text[:20]}... (Filter: {category_filter}, Mode: {mode})")
     
     # 分类过滤（当 category_filter 为 None 或 "All" 时不添加过滤条件）
-    if category_filter and category_filter not in ["All", None]:
-        query_args["where"] = {"category": category_filter}
+    category = category_filter if category_filter and category_filter not in ["All", None] else None
+    where = {"category": category} if category else None
 
     try:
-        results = collection.query(**query_args)
+        sync_index_version()
+        collection = get_collection()
+
+        lexical = []
+        if mode in ("hybrid", "lexical"):
+            lexical = _lexical_candidates(query_text, n_results, category)
+
+        if mode == "lexical" or (mode == "hybrid" and _lexical_is_decisive(query_text, lexical)):
+            # 关键词查询：词法结果已足够明确，不走编码器
+            if mode == "hybrid":
+                print("   ⚡ Lexical match is decisive, skipping embedding.")
+            candidates = _fuse_rrf([], lexical)
+        else:
+            dense = _dense_candidates(collection, query_text, n_results, where, scoring or CHUNK_SCORING)
+            candidates = _fuse_rrf(dense, lexical) if lexical else dense
+        candidates = candidates[:n_results]
         
-        if not results['ids'] or len(results['ids'][0]) == 0:
+        if not candidates:
             print("   No results found.")
-            return {"match": False}
+            return []
 
-        # 遍历 Top-K 结果，找到第一个满足阈值的结果
-        count = len(results['ids'][0])
-        print(f"   -------- Top {count} Candidates --------")
-        
-        THRESHOLD = 0.85  # 相似度阈值（距离越小越相似）
-        
-        for i in range(count):
-            dist = results['distances'][0][i]
-            meta = results['metadatas'][0][i]
+        _fill_page_metadata(collection, candidates)
+        print(f"   -------- Top {len(candidates)} Candidates --------")
+
+        want_content = include_content or (fields is not None and "content" in fields)
+
+        ranked = []
+        for i, cand in enumerate(candidates):
+            dist = cand.get("distance")
+            coverage = cand.get("coverage", 0.0)
+            meta = cand["metadata"]
             title = meta.get("title", "Untitled")
-            
-            print(f"   #{i+1}: {title} (Dist: {dist:.4f})")
-            
-            if dist < THRESHOLD:
-                # 找到第一个满足阈值的结果就返回（Chroma 已按距离排序）
-                best_candidate = {
-                    "match": True,
-                    "page_id": results['ids'][0][i],
-                    "title": title,
-                    "distance": dist,
-                    "category": meta.get("category"),
-                    "metadata": meta,
-                }
-                print(f"   ✅ Selected: {title}")
-                return best_candidate
-        
-        print("❌ No candidate met the threshold.")
-        return {"match": False}
+
+            dist_text = f"{dist:.4f}" if dist is not None else "-"
+            print(f"   #{i+1}: {title} (Dist: {dist_text}, Hits: {cand.get('hits', 0)}, Coverage: {coverage:.2f})")
+
+            # 向量距离达标，或查询词几乎全部命中（精确关键词匹配）
+            passed = (
+                threshold is None
+                or (dist is not None and dist < threshold)
+                or coverage >= LEXICAL_MIN_COVERAGE
+            )
+            if not passed:
+                continue
+
+            if fields is not None:
+                meta = {k: meta[k] for k in fields if k in meta}
+            else:
+                meta = dict(meta)
+            ranked.append({
+                "page_id": cand["page_id"],
+                "title": title,
+                "distance": dist,
+                "coverage": coverage,
+                # 候选排序所用的分数：融合模式为 RRF，否则为段落聚合得分
+                "rank_score": cand.get("rrf", cand.get("score")),
+                "category": cand["metadata"].get("category"),
+                "metadata": meta,
+            })
+
+        # 全文只在调用方需要时才从旁路存储批量读取
+        if want_content and ranked:
+            contents = get_content_store().get_many(r["page_id"] for r in ranked)
+            for r in ranked:
+                if r["page_id"] in contents:
+                    r["metadata"]["content"] = contents[r["page_id"]]
+                elif "content" not in r["metadata"]:
+                    r["metadata"]["content"] = get_memory_content(r["page_id"])
+        return ranked
 
     except Exception as e:
         print(f"❌ Vector Search Error: {e}")
-        return {"match": False}
\ No newline at end of file
+        return []
+
+
+def search_memory(
+    query_text: str,
+    n_results: int = 5,
+    category_filter: str = None,
+    *,
+    scoring: str = None,
+    mode: str = None,
+) -> Dict[str, Any]:
+    """
+    从向量数据库中检索最相关的一条记忆（基于 search_memories 的 Top-1）
+    
+    参数:
+        query_text: 查询文本
+        n_results: 候选数量（默认5）
+        category_filter: 分类过滤器，None 或 "All" 表示搜索所有分类
+        scoring: 段落命中聚合到页面的方式 "max" | "sum"（默认取 CHUNK_SCORING）
+        mode: 检索模式 "dense" | "hybrid" | "lexical"（默认取 SEARCH_MODE）
+    
+    返回:
+        dict: 包含 match、page_id、title、distance、category、metadata 的字典
+              （纯词法命中时 distance 为 None）
+              如果未找到匹配，返回 {"match": False}
+    """
+    ranked = search_memories(
+        query_text,
+        n_results=n_results,
+        category_filter=category_filter,
+        scoring=scoring,
+        mode=mode,
+    )
+    if not ranked:
+        print("❌ No candidate met the threshold.")
+        return {"match": False}
+
+    best = ranked[0]
+    print(f"   ✅ Selected: {best['title']}")
+    return {
+        "match": True,
+        "page_id": best["page_id"],
+        "title": best["title"],
+        "distance": best["distance"],
+        "category": best["category"],
+        "metadata": best["metadata"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vector store migrations")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("migrate-content", help="move full text from Chroma metadata into the content store")
+    p = sub.add_parser("migrate-partitions", help="copy the single collection into per-domain partitions")
+    p.add_argument("--drop-legacy", action="store_true", help="delete the single collection afterwards")
+    args = parser.parse_args()
+
+    if args.command == "migrate-content":
+        migrate_content_to_store()
+    else:
+        migrate_to_partitions(drop_legacy=args.drop_legacy)
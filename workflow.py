@@ -2,6 +2,7 @@ from typing import TypedDict
 from enum import Enum
 
 from langgraph.graph import StateGraph, END
+from langgraph.config import get_stream_writer
 from langgraph.checkpoint.memory import MemorySaver
 
 from agents import ResearcherAgent, EditorAgent
@@ -62,6 +63,7 @@ class AgentState(TypedDict, total=False):
     analysis: AnalysisState
     draft: DraftState
     memory: MemoryState
+    dedup: dict             # 本次输入的重复检测结果（find_duplicate 的返回值），无重复时为 None
 
     # Meta
     retry_count: int
@@ -76,6 +78,22 @@ class AgentState(TypedDict, total=False):
 # Nodes
 # =========================================================
 
+def _llm_stream_callback(node: str):
+    """
+    把 R1 的增量输出写入 LangGraph 的 custom 流：
+    调用方以 stream_mode=["values", "custom"] 运行图时，可收到 {"llm_delta": {...}} 事件实时显示
+    """
+    try:
+        writer = get_stream_writer()
+    except Exception:
+        return None  # 不在图的运行上下文中（如直接调用节点函数）
+
+    def on_delta(kind: str, text: str):
+        writer({"llm_delta": {"node": node, "kind": kind, "text": text}})
+
+    return on_delta
+
+
 def node_memory_saver(state: AgentState) -> AgentState:
     """
     记忆保存节点：将已发布的页面保存到向量数据库，便于后续检索
@@ -169,6 +187,43 @@ def node_perceiver(state: AgentState) -> AgentState:
     }
 
 
+def node_dedup_check(state: AgentState) -> AgentState:
+    """
+    重复检测节点：用全文指纹判断输入是否已经保存过（不调用编码器和 LLM）
+    用户强制查询模式时跳过
+
+    结果每次都写入 dedup（没有重复时为 None）：同一线程的检查点会保留上一次运行的状态，
+    不覆盖的话后续输入会读到旧的重复结果
+    """
+    if state.get("user_mode_override") == "query_knowledge":
+        return {"dedup": None}
+    duplicate = vector_ops.find_duplicate(state["raw_text"])
+    return {"dedup": duplicate if duplicate.get("match") else None}
+
+
+def route_after_dedup(state: AgentState):
+    """重复输入直接结束，否则进入意图分析"""
+    if state.get("dedup"):
+        return "duplicate"
+    return "analyze"
+
+
+def node_duplicate_notice(state: AgentState) -> AgentState:
+    """
+    重复提示节点：告知用户内容已保存过，跳过召回、草稿融合和 Notion 覆盖
+    """
+    print("♻️ [Dedup] Input already saved, skipping merge")
+    dup = state["dedup"]
+    notion_url = f"https://www.notion.so/{dup['page_id'].replace('-', '')}"
+    kind = "完全相同" if dup.get("exact") else "高度相似"
+    return {
+        "final_output": (
+            f"♻️ **该内容已保存过**（与已有笔记{kind}）\n\n"
+            f"📄 **[{dup.get('title', 'Untitled')}]({notion_url})**"
+        )
+    }
+
+
 def node_analyzer(state: AgentState) -> AgentState:
     """
     分析节点：分析用户意图和知识领域
@@ -294,7 +349,8 @@ def node_draft_new(state: AgentState) -> AgentState:
     category = state["analysis"].get("category", "Humanities")
     draft = researcher.draft_content(
         state["raw_text"],
-        category
+        category,
+        on_delta=_llm_stream_callback("draft_new"),
     )
     return {"draft": draft}
 
@@ -310,7 +366,13 @@ def node_draft_merge(state: AgentState) -> AgentState:
     old_content = notion_ops.get_page_text(existing_note["page_id"])
     
     # 调用 Researcher 的 merge_content 方法进行内容融合
-    merged_draft = researcher.merge_content(old_content, state["raw_text"])
+    merged_draft = researcher.merge_content(
+        old_content, state["raw_text"], on_delta=_llm_stream_callback("draft_merge")
+    )
+    if not merged_draft:
+        # 融合结果不可用时不覆盖旧笔记，改为新建
+        print("⚠️ [Merge] Merge failed, drafting a new note instead")
+        return node_draft_new(state)
     
     merged_draft["is_merge"] = True
     merged_draft["merge_target_id"] = existing_note["page_id"]
@@ -359,6 +421,8 @@ workflow = StateGraph(AgentState)
 
 # 注册所有节点
 workflow.add_node("perceiver", node_perceiver)
+workflow.add_node("dedup_check", node_dedup_check)
+workflow.add_node("duplicate_notice", node_duplicate_notice)
 workflow.add_node("analyzer", node_analyzer)
 workflow.add_node("query_memory", node_query_memory)
 workflow.add_node("recall_context", node_recall_context)
@@ -371,7 +435,17 @@ workflow.add_node("memory_saver", node_memory_saver)
 workflow.set_entry_point("perceiver")
 
 # 定义边：必须在编译之前完成所有边的添加
-workflow.add_edge("perceiver", "analyzer")
+workflow.add_edge("perceiver", "dedup_check")
+
+# 重复输入在意图分析（LLM）和召回（编码器）之前直接结束
+workflow.add_conditional_edges(
+    "dedup_check",
+    route_after_dedup,
+    {
+        "duplicate": "duplicate_notice",
+        "analyze": "analyzer",
+    }
+)
 workflow.add_edge("analyzer", "recall_context")  # 分析后先去检索记忆库
 
 # 条件路由：根据意图和记忆匹配结果决定下一步
@@ -394,6 +468,7 @@ workflow.add_edge("publisher", "memory_saver")
 
 # 查询路径和保存路径的终点
 workflow.add_edge("query_memory", END)      # 查询完成直接结束
+workflow.add_edge("duplicate_notice", END)  # 重复输入直接结束
 workflow.add_edge("memory_saver", END)      # 保存完成后结束
 
 # 编译带检查点的图（用于 Streamlit，支持中断和恢复）